@@ -0,0 +1,114 @@
+from LiteroticaFetcher import HostRateLimiter, PageFetchError, RETRY_STATUSES
+from LiteroticaInstrumentation import NO_INSTRUMENTATION
+import asyncio
+import logging
+import time
+
+
+class LiteroticaAsyncFetcher():
+    """
+    The asyncio counterpart of LiteroticaFetcher: fetches pages over one pooled aiohttp session.
+    Takes the same options and honours the same politeness delay, global rate cap, cache and instrumentation.
+    Use it as  async with LiteroticaAsyncFetcher() as fetcher: ...  so the session is closed on the same loop.
+
+    aiohttp is only needed once a fetcher is made; the rest of the library doesn't depend on it.
+    Fetches can be cancelled like any other coroutine, and are bounded by timeout.  The cache does blocking sqlite and
+    file I/O, so it is used from the loop's default executor rather than on the event loop.
+    """
+
+    def __init__(self, timeout=(10, 60), retries=3, backoff_factor=0.5, politeness_delay=0.0, pool_size=10, cache=None,
+                 instrumentation=None, max_requests_per_second=None):
+        # timeout: total seconds per attempt, or a (connect, read) tuple as for LiteroticaFetcher
+        import aiohttp
+        self.__aiohttp = aiohttp
+
+        self.Timeout = timeout
+        self.Retries = retries
+        self.BackoffFactor = backoff_factor
+        self.PolitenessDelay = politeness_delay
+        self.PoolSize = pool_size
+        self.Cache = cache
+        self.Instrumentation = instrumentation if instrumentation is not None else NO_INSTRUMENTATION
+        self.MaxRequestsPerSecond = max_requests_per_second
+
+        self.__rateLimiter = HostRateLimiter(1.0 / politeness_delay if politeness_delay else None)
+        self.__globalRateLimiter = HostRateLimiter(max_requests_per_second, per_host=False)
+        self.__session = None
+
+    def __Session(self):
+        # Made on first use, since an aiohttp session belongs to the loop it was created on
+        if self.__session is None:
+            if isinstance(self.Timeout, tuple):
+                connect, read = self.Timeout
+                timeout = self.__aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+            else:
+                timeout = self.__aiohttp.ClientTimeout(total=self.Timeout)
+            connector = self.__aiohttp.TCPConnector(limit=self.PoolSize)
+            self.__session = self.__aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.__session
+
+    async def Fetch(self, url):
+        # Returns the body of url as bytes; raises aiohttp.ClientResponseError on a non-2xx response once retries are exhausted
+        cached = await self.__CacheCall(self.Cache.Get, url) if self.Cache is not None else None
+        if cached is not None and self.Cache.IsFresh(cached):
+            self.Instrumentation.RecordFetch(url, len(cached.Body), 0.0, cached=True)
+            return cached.Body
+
+        # A stale cached copy is revalidated rather than downloaded again
+        headers = {}
+        if cached is not None:
+            if cached.ETag:
+                headers["If-None-Match"] = cached.ETag
+            if cached.LastModified:
+                headers["If-Modified-Since"] = cached.LastModified
+
+        logging.info(f"Getting {url}")
+        start = time.perf_counter()
+        for attempt in range(self.Retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.BackoffFactor * (2 ** (attempt - 1)))
+            await asyncio.sleep(max(self.__rateLimiter.Reserve(url), self.__globalRateLimiter.Reserve(url)))
+            try:
+                async with self.__Session().get(url, headers=headers) as response:
+                    status = response.status
+                    body = await response.read()
+                    if status in RETRY_STATUSES and attempt < self.Retries:
+                        continue
+                    self.Instrumentation.RecordFetch(url, len(body), time.perf_counter() - start, retries=attempt,
+                                                     status=status, cached=status == 304)
+                    if status == 304 and cached is not None:
+                        await self.__CacheCall(self.Cache.MarkRevalidated, url)
+                        return cached.Body
+                    response.raise_for_status()
+                    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            except (self.__aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.Retries:
+                    raise
+                continue
+
+            if self.Cache is not None:
+                await self.__CacheCall(self.Cache.Put, url, body, etag, last_modified)
+            return body
+
+    async def FetchPage(self, url):
+        # Fetch, raising PageFetchError as LiteroticaFetcher.FetchPage does once the retries are used up, so that
+        # the page classes handle a failed page the same way on either fetcher
+        try:
+            return await self.Fetch(url)
+        except Exception as e:
+            raise PageFetchError(url, self.Retries + 1, e) from e
+
+    @staticmethod
+    async def __CacheCall(method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def Close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.Close()
@@ -0,0 +1,217 @@
+from LiteroticaFetcher import LiteroticaFetcher
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaLayout import slugify
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaOutput import DirectoryOutput
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import json
+import logging
+import os
+import threading
+import time
+
+
+# Outcome of one member in a batch run.  FailedStories is a list of story URLs; StoryErrors says what went wrong
+# with each, as LiteroticaMemberPage.StoryErrors() gives it.
+MemberResult = namedtuple("MemberResult", ["MemberID", "MemberName", "Success", "StoryCount", "FailedStories", "Error", "StoryErrors"])
+
+
+class LiteroticaBatch():
+    """
+    Downloads a fixed list of members and their stories through one shared fetcher.
+    Every request made for the batch goes through the same connection pool and the same global
+    requests-per-second cap.  Members are only ever the ones listed; nothing is discovered or crawled.
+
+    Progress is kept in a JSON state file, so a batch which was interrupted, or which had failures,
+    picks up where it left off when run again: finished members are skipped, stories already on
+    disk are not downloaded again, and the pages of a story which failed part way are kept in a
+    .checkpoint directory, so the story resumes at its first missing page.
+    """
+
+    __version = 1
+
+    def __init__(self, memberIDs, contentDirectory, fetcher=None, requests_per_second=1.0, statePath=None,
+                 member_workers=2, story_workers=4, parser="lxml", progress=None, memberURL=None, dataset=None,
+                 search_index=None, store=None):
+        # fetcher: used for every request in the batch; by default one is made with requests_per_second as its global cap
+        # statePath: the JSON state file, by default batch_state.json in contentDirectory
+        # member_workers: members processed at once; story_workers: story downloads at once per member
+        # progress: optional callable(memberID, status, detail) called as each member moves through the batch
+        # memberURL: optional callable(memberID) giving the member page URL, in place of FormMemberPageURL
+        # dataset: optional LiteroticaDataset each member's listings are appended to, for queries across the batch
+        # search_index: optional LiteroticaSearchIndex every story written is added to
+        # store: optional LiteroticaContentStore the files are written through, so duplicates across members share disk space
+        self.MemberIDs = list(dict.fromkeys(memberIDs))  # Listed order, without duplicates
+        self.ContentDirectory = contentDirectory
+        self.Fetcher = fetcher if fetcher is not None else LiteroticaFetcher(max_requests_per_second=requests_per_second)
+        self.StatePath = statePath if statePath is not None else os.path.join(contentDirectory, "batch_state.json")
+        self.MemberWorkers = member_workers
+        self.StoryWorkers = story_workers
+        self.Parser = parser
+        self.Progress = progress
+        self.MemberURL = memberURL
+        self.Dataset = dataset
+        self.SearchIndex = search_index
+        self.Output = DirectoryOutput(store=store) if store is not None else DirectoryOutput.Default()
+        self.Results = {}  # memberID -> MemberResult, for the members processed by the last Run
+        self.Checkpoint = LiteroticaCheckpoint(os.path.join(contentDirectory, ".checkpoint"))
+
+        self.__lock = threading.Lock()
+        self.__members = {}  # str(memberID) -> state entry
+        if os.path.exists(self.StatePath):
+            with open(self.StatePath, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == LiteroticaBatch.__version:
+                self.__members = data.get("members", {})
+
+    @staticmethod
+    def ReadMemberIDs(path):
+        # One member ID per line; blank lines and lines starting with # are ignored
+        memberIDs = []
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    memberIDs.append(int(line))
+        return memberIDs
+
+    def Status(self, memberID):
+        # "done", "failed", or None for a member this batch hasn't processed yet
+        entry = self.__members.get(str(memberID))
+        return entry["status"] if entry is not None else None
+
+    def PendingMemberIDs(self):
+        return [memberID for memberID in self.MemberIDs if self.Status(memberID) != "done"]
+
+    def Run(self, force=False):
+        # Processes every member not yet done (or every member, with force).  Returns True if all succeeded.
+        os.makedirs(self.ContentDirectory, exist_ok=True)
+        memberIDs = self.MemberIDs if force else self.PendingMemberIDs()
+        for memberID in self.MemberIDs:
+            if memberID not in memberIDs:
+                self.__Report(memberID, "skipped", "already done")
+
+        with ThreadPoolExecutor(max_workers=self.MemberWorkers) as member_pool:
+            results = list(member_pool.map(self.__RunMember, memberIDs))
+
+        return all(result.Success for result in results)
+
+    def FailureSummary(self):
+        # One line per failed member or story, from the state file, so it covers earlier runs too
+        lines = []
+        for memberID in self.MemberIDs:
+            entry = self.__members.get(str(memberID))
+            if entry is None or entry["status"] != "failed":
+                continue
+            lines.append("member {0} ({1}): {2}".format(memberID, entry.get("name"), entry.get("error")))
+            errors = {error["url"]: error for error in entry.get("story_errors", [])}
+            for url in entry.get("failed_stories", []):
+                error = errors.get(url)
+                if error is not None and error.get("page") is not None:
+                    lines.append("  story {0}: page {1} of {2}, {3} pages saved: {4}".format(
+                        url, error["page"], error.get("page_count") or "?", error.get("pages_saved"), error["error"]))
+                elif error is not None:
+                    lines.append("  story {0}: {1}".format(url, error["error"]))
+                else:
+                    lines.append("  story {0}".format(url))
+        if not lines:
+            return "No failures"
+        return "\n".join(lines)
+
+    def MemberDirectory(self, memberID, memberName):
+        return os.path.join(self.ContentDirectory, "{0}_{1}".format(memberID, slugify(memberName or "")))
+
+    def __RunMember(self, memberID):
+        self.__Report(memberID, "started", None)
+        author = LiteroticaMemberPage(memberID, fetcher=self.Fetcher, parser=self.Parser, checkpoint=self.Checkpoint,
+                                      search_index=self.SearchIndex)
+        if self.MemberURL is not None:
+            author.MemberPageURL = self.MemberURL(memberID)
+
+        try:
+            if not author.DownloadMemberPage():
+                error = "member page could not be loaded"
+                if author.DownloadError is not None:
+                    error += ": {0}".format(author.DownloadError)
+                return self.__Finish(MemberResult(memberID, author.MemberName, False, 0, [], error, []))
+
+            storyCount = len(author.IndividualStories) + sum(len(entries) for _, entries in author.SeriesStories)
+            self.__Report(memberID, "loaded", "{0:d} stories".format(storyCount))
+
+            memberDirectory = self.MemberDirectory(memberID, author.MemberName)
+            os.makedirs(memberDirectory, exist_ok=True)
+            success = author.WritePlainTextToFile(memberDirectory, pipelined=True, max_workers=self.StoryWorkers,
+                                                  parse_processes=0, output=self.Output)
+            author.WriteCSVToDisk(memberDirectory, self.Output)
+            if self.Dataset is not None:
+                self.Dataset.Append(author)
+
+            failedStories = [result.URL for result in author.DownloadResults if not result.Success]
+            error = None if success else "{0:d} of {1:d} stories failed".format(len(failedStories), storyCount)
+            return self.__Finish(MemberResult(memberID, author.MemberName, success, storyCount, failedStories, error,
+                                              author.StoryErrors()))
+        except Exception as e:
+            logging.warning("Error processing member {0}: {1}".format(memberID, e))
+            return self.__Finish(MemberResult(memberID, author.MemberName, False, 0, [], str(e), []))
+
+    def __Finish(self, result):
+        with self.__lock:
+            self.Results[result.MemberID] = result
+            self.__members[str(result.MemberID)] = {"status": "done" if result.Success else "failed",
+                                                    "name": result.MemberName,
+                                                    "stories": result.StoryCount,
+                                                    "failed_stories": result.FailedStories,
+                                                    "story_errors": result.StoryErrors,
+                                                    "error": result.Error,
+                                                    "updated_at": time.time()}
+            self.__Save()
+        self.__Report(result.MemberID, "done" if result.Success else "failed", result.Error)
+        return result
+
+    def __Save(self):
+        temp_path = self.StatePath + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": LiteroticaBatch.__version, "members": self.__members}, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.StatePath)
+
+    def __Report(self, memberID, status, detail):
+        logging.info("Member {0}: {1}{2}".format(memberID, status, "" if detail is None else " ({0})".format(detail)))
+        if self.Progress is not None:
+            self.Progress(memberID, status, detail)
+
+
+if __name__ == "__main__":
+    # e.g.  python LiteroticaBatch.py followed.txt ~/stories --rps 0.5
+    import argparse
+    from LiteroticaDataset import LiteroticaDataset
+    from LiteroticaSearchIndex import LiteroticaSearchIndex
+    from LiteroticaContentStore import LiteroticaContentStore
+
+    parser = argparse.ArgumentParser(description="Download the stories of a list of Literotica members")
+    parser.add_argument("ids_file", help="file with one member ID per line")
+    parser.add_argument("output", help="directory to write each member's stories under")
+    parser.add_argument("--rps", type=float, default=1.0, help="maximum requests per second for the whole batch")
+    parser.add_argument("--state", default=None, help="state file (default: batch_state.json in the output directory)")
+    parser.add_argument("--members", type=int, default=2, help="members processed at once")
+    parser.add_argument("--stories", type=int, default=4, help="story downloads at once per member")
+    parser.add_argument("--force", action="store_true", help="process members already marked done")
+    parser.add_argument("--dataset", default=None, help="directory of a Parquet dataset to gather every member's listings in")
+    parser.add_argument("--index", default=None, help="SQLite file of a full-text index to add every story written to")
+    parser.add_argument("--store", default=None, help="content store directory; files with the same content are hard-linked to one copy")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    batch = LiteroticaBatch(LiteroticaBatch.ReadMemberIDs(args.ids_file), args.output, requests_per_second=args.rps,
+                            statePath=args.state, member_workers=args.members, story_workers=args.stories,
+                            dataset=LiteroticaDataset(args.dataset) if args.dataset else None,
+                            search_index=LiteroticaSearchIndex(args.index) if args.index else None,
+                            store=LiteroticaContentStore(args.store) if args.store else None)
+    with batch.Fetcher:
+        succeeded = batch.Run(force=args.force)
+    if batch.SearchIndex is not None:
+        batch.SearchIndex.Close()
+    print(batch.FailureSummary())
+    if batch.Output.Store is not None:
+        print(batch.Output.Store.Summary())
+    raise SystemExit(0 if succeeded else 1)
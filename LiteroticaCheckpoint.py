@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+class LiteroticaCheckpoint():
+    """
+    The pages of each story fetched so far, so that a download which failed part way through resumes at the first
+    missing page instead of starting over.  Pages are kept until the story has been fetched in full, then cleared.
+
+    Without a directory the pages are held in memory, which covers retrying a story within one run.  With a directory
+    each page is written to <directory>/<story key>/<page number>.html, so a later run picks up where this one stopped.
+
+    Pages which no page format could parse are kept too, marked with the reason (see MarkUnparsed); once a parser
+    for the new layout is registered, downloading the story again parses them from here rather than re-fetching.
+
+    A story's pages may go stale: it can be edited or re-paginated between runs.  Saved pages older than ttl seconds
+    are Expired(), and Matches() tells whether a freshly fetched first page still has the content of the one saved,
+    so that a story is never spliced together from old and new pages.
+    """
+
+    def __init__(self, directory=None, ttl=24 * 3600):
+        # ttl: seconds a story's saved pages are trusted for, from when its first page was saved; None for ever
+        self.Directory = directory
+        self.TTL = ttl
+        self.__pages = {}  # story URL -> {page number: body}, when held in memory
+        self.__unparsed = {}  # story URL -> {page number: reason}, when held in memory
+        self.__info = {}  # story URL -> {"saved_at": time}, when held in memory
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def StoryKey(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+
+    def Get(self, url, pageNumber):
+        # The body saved for that page, or None
+        if self.Directory is None:
+            with self.__lock:
+                return self.__pages.get(url, {}).get(pageNumber)
+        try:
+            with open(self.__PagePath(url, pageNumber), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def Put(self, url, pageNumber, body):
+        if self.Directory is None:
+            with self.__lock:
+                self.__pages.setdefault(url, {})[pageNumber] = body
+                if pageNumber == 1:
+                    self.__info.setdefault(url, LiteroticaCheckpoint.__Info())
+            return
+        path = self.__PagePath(url, pageNumber)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp%d" % threading.get_ident()
+        with open(temp_path, "wb") as file:
+            file.write(body)
+        os.replace(temp_path, path)
+        if pageNumber == 1:
+            info_path = self.__InfoPath(url)
+            with self.__lock:
+                if not os.path.exists(info_path):
+                    with open(info_path + ".tmp", "w", encoding="utf-8") as file:
+                        json.dump(dict(LiteroticaCheckpoint.__Info(), url=url), file)
+                    os.replace(info_path + ".tmp", info_path)
+
+    def Expired(self, url):
+        # True if the story's pages were first saved more than TTL seconds ago, or it is unknown when
+        if self.TTL is None:
+            return False
+        info = self.__ReadInfo(url)
+        return info is None or time.time() - info["saved_at"] > self.TTL
+
+    def Matches(self, url, firstPage, fingerprint):
+        # True if firstPage, freshly fetched, is the first page the story's saved pages were fetched with.
+        # fingerprint(page) is what identifies the story in a page, e.g. its extracted text rather than the raw bytes,
+        # which differ from one request to the next; None for a page it can't tell anything from.
+        saved = self.Get(url, 1)
+        if saved is None:
+            return False
+        expected = fingerprint(saved)
+        return expected is not None and expected == fingerprint(firstPage)
+
+    def PageNumbers(self, url):
+        # The saved page numbers of a story, in order
+        if self.Directory is None:
+            with self.__lock:
+                return sorted(self.__pages.get(url, {}))
+        try:
+            names = os.listdir(os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url)))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(".html")]) for name in names if name.endswith(".html"))
+
+    def MarkUnparsed(self, url, pageNumber, reason):
+        # Records that a saved page couldn't be parsed, and why
+        if self.Directory is None:
+            with self.__lock:
+                self.__unparsed.setdefault(url, {})[pageNumber] = reason
+            return
+        path = os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url), "unparsed.json")
+        with self.__lock:
+            entry = self.__ReadUnparsed(path) or {"url": url, "pages": {}}
+            entry["pages"][str(pageNumber)] = reason
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(entry, file, indent=1)
+            os.replace(path + ".tmp", path)
+
+    def HasUnparsed(self, url):
+        # True if any of the story's saved pages is marked unparsed
+        if self.Directory is None:
+            with self.__lock:
+                return bool(self.__unparsed.get(url))
+        return os.path.exists(os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url), "unparsed.json"))
+
+    def Unparsed(self):
+        # (story URL, page number, reason) for every saved page marked unparsed, e.g. to re-parse once the parser is fixed
+        if self.Directory is None:
+            with self.__lock:
+                return sorted((url, page, reason) for url, pages in self.__unparsed.items() for page, reason in pages.items())
+        found = []
+        if os.path.isdir(self.Directory):
+            for key in os.listdir(self.Directory):
+                entry = self.__ReadUnparsed(os.path.join(self.Directory, key, "unparsed.json"))
+                if entry is not None:
+                    found += [(entry["url"], int(page), reason) for page, reason in entry["pages"].items()]
+        return sorted(found)
+
+    def Clear(self, url):
+        # Drops a story's pages, once it has been fetched and parsed in full
+        if self.Directory is None:
+            with self.__lock:
+                self.__pages.pop(url, None)
+                self.__unparsed.pop(url, None)
+                self.__info.pop(url, None)
+            return
+        shutil.rmtree(os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url)), ignore_errors=True)
+
+    @staticmethod
+    def __Info():
+        return {"saved_at": time.time()}
+
+    def __ReadInfo(self, url):
+        if self.Directory is None:
+            with self.__lock:
+                return self.__info.get(url)
+        try:
+            with open(self.__InfoPath(url), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def __InfoPath(self, url):
+        return os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url), "story.json")
+
+    @staticmethod
+    def __ReadUnparsed(path):
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def __PagePath(self, url, pageNumber):
+        return os.path.join(self.Directory, LiteroticaCheckpoint.StoryKey(url), "{0:d}.html".format(pageNumber))
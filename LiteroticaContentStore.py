@@ -0,0 +1,156 @@
+from collections import namedtuple
+import hashlib
+import os
+import shutil
+import threading
+
+
+# Counts for the files placed through a store since it was opened.
+# Stored: files whose content was new, kept as a blob.  Linked: files whose content was already stored, so they share
+# its blob.  Copied: of those, the ones which had to be copied since no link could be made.  WritesAvoided: files
+# whose content was recognised before being written, so nothing was written at all.  BytesStored / BytesLinked: the
+# sizes of the Stored files and of the Linked ones not Copied, so BytesLinked is the disk space saved.
+DedupStats = namedtuple("DedupStats", ["Stored", "Linked", "Copied", "WritesAvoided", "BytesStored", "BytesLinked"])
+
+# What a store holds on disk: Blobs, their total Bytes, and the number of Links to them from output files
+StoreUsage = namedtuple("StoreUsage", ["Blobs", "Bytes", "Links"])
+
+# ioctl which clones a file's extents (a reflink) on btrfs, XFS and the like
+_FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    # Makes destination a copy-on-write clone of source; False where the filesystem or platform can't
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        return False
+
+
+class LiteroticaContentStore():
+    """
+    Content-addressed store of output files: each distinct content is kept once, as a blob named by its sha256 (the
+    hash the output sidecars already record), and every file with that content is a hard link to the blob.  A story
+    re-posted under another URL, a chapter written again unchanged, or a series file rewritten with the same chapters
+    then takes no more disk space.  Hand it to DirectoryOutput(store=...) and every file written through that output
+    goes through the store; where the content is known before writing (WriteText, WriteBytes) a file whose blob
+    already exists is linked without being written at all.
+
+    Keep the store on the same filesystem as the output, since hard links can't cross filesystems.  Where a link
+    can't be made the file is reflinked if the filesystem supports it, and copied otherwise.  Files are always
+    replaced with os.replace rather than rewritten in place, so writing one file never changes its linked twins.
+    Prune() drops the blobs no output file links to any more.
+    """
+
+    def __init__(self, directory):
+        self.Directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__stats = DedupStats(0, 0, 0, 0, 0, 0)
+
+    @staticmethod
+    def Key(data):
+        # The store key for bytes data
+        return hashlib.sha256(data).hexdigest()
+
+    def BlobPath(self, key):
+        return os.path.join(self.Directory, key[:2], key)
+
+    def Contains(self, key):
+        return os.path.exists(self.BlobPath(key))
+
+    def Place(self, tempPath, key, path):
+        # Moves the finished file tempPath, whose content has key, to path through the store: as a new blob if the
+        # content is new, otherwise as a link to the existing one
+        blob = self.BlobPath(key)
+        size = os.path.getsize(tempPath)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(tempPath, blob)
+        except FileExistsError:
+            os.remove(tempPath)
+            self.__Link(blob, path, size)
+            return
+        except OSError:
+            # No hard links from here to the store: the file is kept on its own
+            os.replace(tempPath, path)
+            return
+        os.replace(tempPath, path)
+        self.__Count(Stored=1, BytesStored=size)
+
+    def LinkExisting(self, key, path):
+        # Points path at the stored blob for key, without writing anything
+        blob = self.BlobPath(key)
+        self.__Link(blob, path, os.path.getsize(blob))
+        self.__Count(WritesAvoided=1)
+
+    def Stats(self):
+        with self.__lock:
+            return self.__stats
+
+    def Summary(self):
+        stats = self.Stats()
+        return "{0:d} files stored ({1:.1f} MB), {2:d} duplicates linked ({3:.1f} MB saved, {4:d} writes avoided, {5:d} copied)".format(
+            stats.Stored, stats.BytesStored / 1e6, stats.Linked, stats.BytesLinked / 1e6, stats.WritesAvoided, stats.Copied)
+
+    def Usage(self):
+        # A scan of the store on disk
+        blobs, size, links = 0, 0, 0
+        for entry in self.__Blobs():
+            stat = os.stat(entry.path)
+            blobs += 1
+            size += stat.st_size
+            links += stat.st_nlink - 1
+        return StoreUsage(blobs, size, links)
+
+    def Prune(self):
+        # Removes the blobs no output file is linked to any more, e.g. after stories were rewritten with new text.
+        # Returns (blobs removed, bytes freed).  Run it while nothing is being written through the store.
+        removed, freed = 0, 0
+        for entry in self.__Blobs():
+            stat = os.stat(entry.path)
+            if stat.st_nlink > 1:
+                continue
+            os.remove(entry.path)
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
+
+    def __Blobs(self):
+        for shard in os.scandir(self.Directory):
+            if shard.is_dir() and len(shard.name) == 2:
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and len(entry.name) == 64:
+                        yield entry
+
+    def __Link(self, blob, path, size):
+        try:
+            if os.path.samefile(blob, path):
+                self.__Count(Linked=1, BytesLinked=size)
+                return  # Already this content
+        except OSError:
+            pass
+        temp_path = path + ".link%d" % threading.get_ident()
+        copied = False
+        try:
+            os.link(blob, temp_path)
+        except OSError:
+            copied = not reflink(blob, temp_path)
+            if copied:
+                shutil.copyfile(blob, temp_path)
+        os.replace(temp_path, path)
+        self.__Count(Linked=1, Copied=int(copied), BytesLinked=0 if copied else size)
+
+    def __Count(self, **counts):
+        with self.__lock:
+            self.__stats = self.__stats._replace(**{name: getattr(self.__stats, name) + count for name, count in counts.items()})
@@ -0,0 +1,165 @@
+# pyarrow is optional: it is only imported by the functions which build or read tables
+from LiteroticaLayout import series_slug
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+import csv
+import os
+import threading
+
+
+# Columns of the listing tables, in order; the same fields as the member CSV, with Rating and Date typed
+LISTING_COLUMNS = ("url", "member_name", "member_id", "series_title", "series_slug", "file_prefix", "title",
+                   "secondary_line", "category", "rating", "date")
+
+# Output formats for listing tables, and their file extensions
+LISTING_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+@lru_cache(maxsize=None)
+def listing_schema():
+    import pyarrow as pa
+    return pa.schema([("url", pa.string()),
+                      ("member_name", pa.string()),
+                      ("member_id", pa.int64()),
+                      ("series_title", pa.string()),  # null for stories not in a series
+                      ("series_slug", pa.string()),
+                      ("file_prefix", pa.string()),
+                      ("title", pa.string()),
+                      ("secondary_line", pa.string()),
+                      ("category", pa.string()),
+                      ("rating", pa.float64()),  # null for unrated stories
+                      ("date", pa.date32())])
+
+@lru_cache(maxsize=4096)
+def listing_date(text):
+    # A member page date, e.g. "06/23/2023", as a datetime.date; None if it isn't one.  Cached, as many stories share a date.
+    try:
+        return datetime.strptime(text.strip(), "%m/%d/%Y").date()
+    except (AttributeError, ValueError):
+        return None
+
+def listing_batches(memberPage, batch_size=4096):
+    # The listings of a parsed LiteroticaMemberPage as pyarrow RecordBatches of up to batch_size rows.
+    # Columns are filled as plain lists and converted a batch at a time; series values are worked out once per series.
+    import pyarrow as pa
+    columns = {name: [] for name in LISTING_COLUMNS}
+
+    def add(listing, seriesTitle, slug):
+        columns["url"].append(listing.URL)
+        columns["member_name"].append(memberPage.MemberName)
+        columns["member_id"].append(memberPage.MemberID)
+        columns["series_title"].append(seriesTitle)
+        columns["series_slug"].append(slug)
+        columns["file_prefix"].append(listing.FileName.replace('.html', ''))
+        columns["title"].append(listing.Title.strip())
+        columns["secondary_line"].append(listing.SecondaryLine.strip())
+        columns["category"].append(listing.Category)
+        columns["rating"].append(listing.Rating)
+        columns["date"].append(listing_date(listing.Date))
+
+    def batch():
+        made = pa.RecordBatch.from_pydict(columns, schema=listing_schema())
+        for values in columns.values():
+            values.clear()
+        return made
+
+    series = [(None, None, memberPage.IndividualStories)]
+    series += [(seriesTitle.split(':')[0].strip(), series_slug(seriesTitle), entries) for seriesTitle, entries in memberPage.SeriesStories]
+    for seriesTitle, slug, entries in series:
+        for listing in entries:
+            add(listing, seriesTitle, slug)
+            if len(columns["url"]) == batch_size:
+                yield batch()
+    if columns["url"]:
+        yield batch()
+
+def listing_table(memberPage, batch_size=4096):
+    import pyarrow as pa
+    return pa.Table.from_batches(list(listing_batches(memberPage, batch_size)), schema=listing_schema())
+
+def csv_listing_table(path):
+    # A member CSV written by WriteCSVToDisk as a listing table.  The CSV has no dates, so date is null.
+    import pyarrow as pa
+    columns = {name: [] for name in LISTING_COLUMNS}
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            columns["url"].append(row["StoryLink"])
+            columns["member_name"].append(row["MemberName"] or None)
+            columns["member_id"].append(int(row["MemberUID"]))
+            columns["series_title"].append(row["SeriesTitle"] or None)
+            columns["series_slug"].append(row["Subdir"] or None)
+            columns["file_prefix"].append(row["FilePrefix"])
+            columns["title"].append(row["StoryTitle"])
+            columns["secondary_line"].append(row["StorySecondaryLine"])
+            columns["category"].append(row["StoryCategory"])
+            columns["rating"].append(float(row["Rating"]) if row["Rating"] else None)
+            columns["date"].append(None)
+    return pa.Table.from_pydict(columns, schema=listing_schema())
+
+def listing_bytes(table, format="parquet"):
+    # table serialised as a Parquet file, or an Arrow IPC file
+    import pyarrow as pa
+    sink = pa.BufferOutputStream()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink)
+    elif format == "arrow":
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError("Unknown listing format: {0}".format(format))
+    return sink.getvalue().to_pybytes()
+
+
+class LiteroticaDataset():
+    """
+    The listing metadata of many members as one Parquet dataset: a directory with a member_<id>.parquet file per
+    member, read together as a single table.  Appending a member again replaces its file, so re-running a batch
+    doesn't duplicate rows.  Aggregate queries over every member read the one dataset, e.g.
+        LiteroticaDataset(path).Table(columns=["category", "rating"]).group_by("category").aggregate([("rating", "mean")])
+    """
+
+    def __init__(self, directory):
+        self.Directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def MemberPath(self, memberID):
+        return os.path.join(self.Directory, "member_{0}.parquet".format(memberID))
+
+    def Append(self, memberPage, batch_size=4096):
+        # Adds a parsed LiteroticaMemberPage's listings, replacing any earlier copy of that member's
+        return self.__Write(memberPage.MemberID, listing_table(memberPage, batch_size))
+
+    def AppendCSV(self, csvPath):
+        # Adds a member from a CSV written by WriteCSVToDisk, e.g. to bring existing downloads into the dataset
+        table = csv_listing_table(csvPath)
+        memberIDs = set(table.column("member_id").to_pylist())
+        if len(memberIDs) != 1:
+            raise ValueError("{0} should hold the stories of one member, not {1:d}".format(csvPath, len(memberIDs)))
+        return self.__Write(memberIDs.pop(), table)
+
+    def AppendMany(self, memberPages, max_workers=4):
+        # Appends every member page; the files are written in parallel.  Returns the paths written.
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(self.Append, memberPages))
+
+    def MemberIDs(self):
+        names = [name for name in os.listdir(self.Directory) if name.startswith("member_") and name.endswith(".parquet")]
+        return sorted(int(name[len("member_"):-len(".parquet")]) for name in names)
+
+    def Dataset(self):
+        # A pyarrow.dataset.Dataset over every member, for filtered and projected scans
+        import pyarrow.dataset as ds
+        return ds.dataset([self.MemberPath(memberID) for memberID in self.MemberIDs()], schema=listing_schema(), format="parquet")
+
+    def Table(self, columns=None, filter=None):
+        return self.Dataset().to_table(columns=columns, filter=filter)
+
+    def __Write(self, memberID, table):
+        import pyarrow.parquet as pq
+        path = self.MemberPath(memberID)
+        temp_path = path + ".tmp%d" % threading.get_ident()  # Not .parquet, so readers never pick it up
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, path)
+        return path
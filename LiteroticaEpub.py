@@ -0,0 +1,146 @@
+from LiteroticaStoryPage import story_page_xhtml, story_text_xhtml, unpack_raw_pages
+from LiteroticaLayout import series_slug
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+from xml.sax.saxutils import escape, quoteattr
+import logging
+import os
+import time
+import uuid
+import zipfile
+
+
+class LiteroticaEpubWriter():
+    """
+    Writes EPUB 3 books, one per series of a parsed LiteroticaMemberPage, with a chapter per story.
+    Chapters are built from the story pages as they are fetched: each page is parsed and its paragraphs written
+    straight into the book, so only one page of a series is held in memory at a time (one chapter's, from disk).
+    Books of different series are built in parallel over the member page's fetcher.
+
+    A chapter is built from what is already on disk where it can be: the raw pages a keep_raw write kept beside the
+    story files, or else the story's .html file, which holds the story <div> of every page.  Only a chapter with
+    neither is fetched from the site, so books written after WritePlainTextToFile need no network access.
+    """
+
+    __container = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                   '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n'
+                   '</container>\n')
+
+    __chapterHeader = ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+                       '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                       '<head><title>{Title}</title></head>\n<body>\n<h1>{Title}</h1>\n')
+
+    __chapterFooter = '</body>\n</html>\n'
+
+    def __init__(self, memberPage):
+        # memberPage: a LiteroticaMemberPage which has been downloaded and parsed
+        self.MemberPage = memberPage
+
+    def WriteAllSeries(self, contentDirectory, max_workers=4):
+        # One <series slug>.epub per series in contentDirectory.  Returns the paths of the books written;
+        # a series whose book couldn't be built is logged and left out.  Raw pages kept in the series directories
+        # WritePlainTextToFile made there are used in place of fetching.
+        jobs = [(seriesTitle, seriesEntries, os.path.join(contentDirectory, self.BookFileName(seriesTitle)))
+                for seriesTitle, seriesEntries in self.MemberPage.SeriesStories]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            books = [pool.submit(self.WriteSeries, seriesTitle, seriesEntries, path,
+                                 os.path.join(contentDirectory, series_slug(seriesTitle)))
+                     for seriesTitle, seriesEntries, path in jobs]
+
+        written = []
+        for (seriesTitle, _, path), book in zip(jobs, books):
+            try:
+                book.result()
+                written.append(path)
+            except Exception as e:
+                logging.warning("Error writing EPUB for series {0}: {1}".format(seriesTitle, e))
+        return written
+
+    @staticmethod
+    def BookFileName(seriesTitle):
+        # Named like the series text file WritePlainTextToFile writes
+        return series_slug(seriesTitle) + ".epub"
+
+    def WriteSeries(self, seriesTitle, storyListings, path, seriesDirectory=None):
+        # Builds the book for one series at path; it is moved into place only once complete.
+        # seriesDirectory: where the series' story files were written, to take chapters from rather than fetching
+        title = seriesTitle.split(":")[0].strip()
+        chapters = [("chapter_{0:03d}.xhtml".format(i), listing) for i, listing in enumerate(storyListings, start=1)]
+
+        temp_path = path + ".tmp"
+        try:
+            with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as book:
+                # The mimetype must come first, uncompressed
+                book.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+                book.writestr("META-INF/container.xml", LiteroticaEpubWriter.__container)
+                book.writestr("OEBPS/content.opf", self.__PackageDocument(title, seriesTitle, chapters))
+                book.writestr("OEBPS/nav.xhtml", self.__Navigation(title, chapters))
+                for fileName, listing in chapters:
+                    with book.open("OEBPS/" + fileName, "w", force_zip64=True) as entry:
+                        self.__WriteChapter(entry, listing, seriesDirectory)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, path)
+        return path
+
+    def __WriteChapter(self, entry, listing, seriesDirectory):
+        story = self.MemberPage.StoryPage(listing)
+        entry.write(LiteroticaEpubWriter.__chapterHeader.format(Title=escape(story.Title or "")).encode("utf-8"))
+        for paragraph in self.__ChapterParagraphs(story, seriesDirectory):
+            entry.write((paragraph + "\n").encode("utf-8"))
+        entry.write(LiteroticaEpubWriter.__chapterFooter.encode("utf-8"))
+
+    def __ChapterParagraphs(self, story, seriesDirectory):
+        # From the raw pages, else the written story, else fetched a page at a time
+        if seriesDirectory is not None:
+            with contextlib.suppress(FileNotFoundError):
+                with open(story.RawPagesPath(seriesDirectory), "rb") as file:
+                    pages = unpack_raw_pages(file.read())
+                return (paragraph for html in pages for paragraph in story_page_xhtml(html))
+            html_fname, _ = story.StoryFilePaths(seriesDirectory)
+            with contextlib.suppress(FileNotFoundError):
+                with open(html_fname, "r", encoding="utf-8") as file:
+                    return story_text_xhtml(file.read())
+        return (paragraph for html in story.IterPagesNewFormat() for paragraph in story_page_xhtml(html))
+
+    def __PackageDocument(self, title, seriesTitle, chapters):
+        listings = [listing for _, listing in chapters]
+        categories = list(dict.fromkeys(listing.Category for listing in listings if listing.Category))
+        ratings = [listing.Rating for listing in listings if listing.Rating]
+        identifier = uuid.uuid5(uuid.NAMESPACE_URL, "{0}#{1}".format(self.MemberPage.MemberPageURL, seriesTitle))
+
+        metadata = ['<dc:identifier id="book-id">urn:uuid:{0}</dc:identifier>'.format(identifier),
+                    '<dc:title>{0}</dc:title>'.format(escape(title)),
+                    '<dc:language>en</dc:language>',
+                    '<meta property="dcterms:modified">{0}</meta>'.format(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))]
+        if self.MemberPage.MemberName:
+            metadata.append('<dc:creator>{0}</dc:creator>'.format(escape(self.MemberPage.MemberName)))
+        metadata += ['<dc:subject>{0}</dc:subject>'.format(escape(category)) for category in categories]
+        if ratings:
+            # calibre rates out of 10; Literotica out of 5
+            metadata.append('<meta name="calibre:rating" content="{0:.1f}"/>'.format(2 * sum(ratings) / len(ratings)))
+
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        manifest += ['<item id="c{0:d}" href="{1}" media-type="application/xhtml+xml"/>'.format(i, fileName)
+                     for i, (fileName, _) in enumerate(chapters, start=1)]
+        spine = ['<itemref idref="c{0:d}"/>'.format(i) for i in range(1, len(chapters) + 1)]
+
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+                '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n{0}\n</metadata>\n'
+                '<manifest>\n{1}\n</manifest>\n'
+                '<spine>\n{2}\n</spine>\n'
+                '</package>\n').format("\n".join(metadata), "\n".join(manifest), "\n".join(spine))
+
+    def __Navigation(self, title, chapters):
+        entries = ['<li><a href={0}>{1}</a></li>'.format(quoteattr(fileName), escape(listing.Title or ""))
+                   for fileName, listing in chapters]
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                '<head><title>{0}</title></head>\n<body>\n'
+                '<nav epub:type="toc"><h1>{0}</h1><ol>\n{1}\n</ol></nav>\n'
+                '</body>\n</html>\n').format(escape(title), "\n".join(entries))
@@ -0,0 +1,186 @@
+# requests is imported when the first request goes out, so runs answered from the cache never load it
+from LiteroticaInstrumentation import NO_INSTRUMENTATION
+from urllib.parse import urlsplit
+import logging
+import random
+import threading
+import time
+
+
+# Transient statuses which are worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def is_transient(error):
+    # True for errors worth retrying a page for: connection failures and timeouts, and the retryable statuses.
+    # requests' exceptions are OSErrors, so this doesn't need requests imported.
+    if not isinstance(error, OSError):
+        return False
+    response = getattr(error, "response", None)
+    return response is None or response.status_code in RETRY_STATUSES
+
+
+class PageFetchError(Exception):
+    """A page which couldn't be fetched; Cause is the last error, after Attempts tries."""
+
+    def __init__(self, url, attempts, cause):
+        super().__init__("{0} failed after {1:d} attempt{2}: {3}".format(url, attempts, "" if attempts == 1 else "s", cause))
+        self.URL = url
+        self.Attempts = attempts
+        self.Cause = cause
+
+
+class HostRateLimiter():
+    """
+    Spaces out requests so that no more than requests_per_second are started against any one host,
+    or against all hosts together when per_host is False.
+    """
+
+    def __init__(self, requests_per_second=None, per_host=True):
+        self.__interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.__perHost = per_host
+        self.__nextSlot = {}
+        self.__lock = threading.Lock()
+
+    def Wait(self, url):
+        delay = self.Reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def Reserve(self, url):
+        # Claims the next start slot for url and returns the seconds to wait for it, without waiting
+        if self.__interval <= 0:
+            return 0.0
+        host = urlsplit(url).netloc if self.__perHost else None
+        with self.__lock:
+            now = time.monotonic()
+            slot = max(now, self.__nextSlot.get(host, now))
+            self.__nextSlot[host] = slot + self.__interval
+        return slot - now
+
+
+class LiteroticaFetcher():
+    """
+    Fetches pages over one pooled keep-alive session.
+    Hand the same fetcher to member and story pages so that a whole run reuses one set of connections.
+    """
+
+    __sharedFetcher = None
+    __sharedLock = threading.Lock()
+
+    def __init__(self, timeout=(10, 60), retries=3, backoff_factor=0.5, politeness_delay=0.0, pool_size=10, cache=None,
+                 instrumentation=None, max_requests_per_second=None, page_retries=2, page_backoff=1.0, page_backoff_max=30.0):
+        # timeout: seconds, or a (connect, read) tuple as accepted by requests
+        # politeness_delay: minimum number of seconds between the starts of two requests to the same host
+        # max_requests_per_second: cap on requests started across all hosts and all threads using this fetcher
+        # cache: an optional LiteroticaResponseCache consulted before every request
+        # instrumentation: an optional LiteroticaInstrumentation; page classes also record their stages on it
+        # page_retries: further attempts FetchPage makes at a page after a transient error, on top of the connection
+        # and status retries of each attempt.  Attempt n waits a random time of up to page_backoff * 2**n seconds,
+        # capped at page_backoff_max, so that workers which failed together don't all retry together.
+        self.Timeout = timeout
+        self.Retries = retries
+        self.BackoffFactor = backoff_factor
+        self.PoolSize = pool_size
+        self.PolitenessDelay = politeness_delay
+        self.Cache = cache
+        self.Instrumentation = instrumentation if instrumentation is not None else NO_INSTRUMENTATION
+
+        self.MaxRequestsPerSecond = max_requests_per_second
+        self.PageRetries = page_retries
+        self.PageBackoff = page_backoff
+        self.PageBackoffMax = page_backoff_max
+
+        self.__rateLimiter = HostRateLimiter(1.0 / politeness_delay if politeness_delay else None)
+        self.__globalRateLimiter = HostRateLimiter(max_requests_per_second, per_host=False)
+        self.__session = None
+        self.__sessionLock = threading.Lock()
+
+    def __Session(self):
+        with self.__sessionLock:
+            if self.__session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=self.Retries,
+                              backoff_factor=self.BackoffFactor,
+                              status_forcelist=RETRY_STATUSES,
+                              allowed_methods=frozenset(["GET", "HEAD"]))
+                adapter = HTTPAdapter(pool_connections=self.PoolSize, pool_maxsize=self.PoolSize, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.__session = session
+            return self.__session
+
+    @staticmethod
+    def Shared():
+        # The fetcher used by pages which weren't handed one explicitly
+        with LiteroticaFetcher.__sharedLock:
+            if LiteroticaFetcher.__sharedFetcher is None:
+                LiteroticaFetcher.__sharedFetcher = LiteroticaFetcher()
+            return LiteroticaFetcher.__sharedFetcher
+
+    def Fetch(self, url):
+        # Returns the body of url as bytes; raises requests.HTTPError on a non-2xx response once retries are exhausted
+        cached = self.Cache.Get(url) if self.Cache is not None else None
+        if cached is not None and self.Cache.IsFresh(cached):
+            self.Instrumentation.RecordFetch(url, len(cached.Body), 0.0, cached=True)
+            return cached.Body
+
+        # A stale cached copy is revalidated rather than downloaded again
+        headers = {}
+        if cached is not None:
+            if cached.ETag:
+                headers["If-None-Match"] = cached.ETag
+            if cached.LastModified:
+                headers["If-Modified-Since"] = cached.LastModified
+
+        logging.info(f"Getting {url}")
+        self.__rateLimiter.Wait(url)
+        self.__globalRateLimiter.Wait(url)
+        start = time.perf_counter()
+        response = self.__Session().get(url, headers=headers, timeout=self.Timeout)
+        if self.Instrumentation.Enabled:
+            retry_state = getattr(response.raw, "retries", None)
+            retries = len(retry_state.history) if retry_state is not None else 0
+            self.Instrumentation.RecordFetch(url, len(response.content), time.perf_counter() - start, retries=retries,
+                                             status=response.status_code, cached=response.status_code == 304)
+        if response.status_code == 304 and cached is not None:
+            self.Cache.MarkRevalidated(url)
+            return cached.Body
+        response.raise_for_status()
+
+        if self.Cache is not None:
+            self.Cache.Put(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return response.content
+
+    def FetchPage(self, url):
+        # Fetch, retried with exponential backoff and jitter while the errors are transient.
+        # Raises PageFetchError once the retries are used up, or at once for an error such as a 404.
+        for attempt in range(self.PageRetries + 1):
+            try:
+                return self.Fetch(url)
+            except Exception as e:
+                if attempt == self.PageRetries or not is_transient(e):
+                    raise PageFetchError(url, attempt + 1, e) from e
+                delay = self.BackoffDelay(attempt)
+                logging.warning("Error getting {0}, retrying in {1:.1f}s: {2}".format(url, delay, e))
+                time.sleep(delay)
+
+    def BackoffDelay(self, attempt):
+        # "Full jitter": uniform between zero and the exponential backoff for this attempt
+        return random.uniform(0, min(self.PageBackoffMax, self.PageBackoff * 2 ** attempt))
+
+    def Close(self):
+        with self.__sessionLock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from contextlib import nullcontext
+import contextvars
+import json
+import logging
+import threading
+import time
+
+
+class LiteroticaInstrumentation():
+    """
+    Records per-request and per-stage timings and hands them to sinks.
+    With no sinks it is disabled: Stage() returns a shared no-op context manager and RecordFetch() returns at once.
+
+    Events are dicts.  Fetches:  {"event": "fetch", "url", "member", "bytes", "seconds", "retries", "status", "cached"}
+    Stages:  {"event": "stage", "stage", "url", "member", "seconds", "error"}
+    A fetch's member is the one whose Member() context it was made in, so that network totals add up per member
+    however the fetches are spread over threads and tasks; None outside any.
+    """
+
+    __noStage = nullcontext()
+    __member = contextvars.ContextVar("member", default=None)
+
+    def __init__(self, sinks=()):
+        self.Sinks = list(sinks)
+
+    @property
+    def Enabled(self):
+        return len(self.Sinks) > 0
+
+    def RecordFetch(self, url, nbytes, seconds, retries=0, status=200, cached=False):
+        if not self.Sinks:
+            return
+        self.Emit({"event": "fetch", "url": url, "member": LiteroticaInstrumentation.__member.get(), "bytes": nbytes,
+                   "seconds": seconds, "retries": retries, "status": status, "cached": cached})
+
+    def Member(self, member):
+        # Context manager attributing the fetches made inside it, in this thread or asyncio task, to member
+        if not self.Sinks or member is None:
+            return LiteroticaInstrumentation.__noStage
+        return _MemberContext(LiteroticaInstrumentation.__member, member)
+
+    def Stage(self, name, url=None, member=None):
+        # Context manager timing one stage of work, e.g.  with instrumentation.Stage("parse", url=story.URL): ...
+        if not self.Sinks:
+            return LiteroticaInstrumentation.__noStage
+        return _StageTimer(self, name, url, member)
+
+    def Emit(self, event):
+        for sink in self.Sinks:
+            sink.Record(event)
+
+    def Close(self):
+        for sink in self.Sinks:
+            sink.Close()
+
+
+# Shared disabled instance, used wherever no instrumentation was supplied
+NO_INSTRUMENTATION = LiteroticaInstrumentation()
+
+
+class _MemberContext():
+
+    def __init__(self, variable, member):
+        self.__variable = variable
+        self.__member = member
+        self.__token = None
+
+    def __enter__(self):
+        self.__token = self.__variable.set(self.__member)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__variable.reset(self.__token)
+        return False
+
+
+class _StageTimer():
+
+    def __init__(self, instrumentation, name, url, member):
+        self.__instrumentation = instrumentation
+        self.__event = {"event": "stage", "stage": name, "url": url, "member": member}
+        self.__start = None
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__event["seconds"] = time.perf_counter() - self.__start
+        self.__event["error"] = exc_type is not None
+        self.__instrumentation.Emit(self.__event)
+        return False
+
+
+class StatsSink():
+    """Aggregates events in memory; mostly for tests and for building summaries."""
+
+    def __init__(self, keep_events=True):
+        self.KeepEvents = keep_events
+        self.Events = []
+        self.FetchCount = 0
+        self.BytesFetched = 0
+        self.FetchSeconds = 0.0
+        self.Retries = 0
+        self.StageSeconds = defaultdict(float)
+        self.StageCounts = defaultdict(int)
+        self.MemberSeconds = defaultdict(lambda: defaultdict(float))  # member -> stage -> seconds
+        self.MemberFetches = defaultdict(int)  # member -> requests, cached or not
+        self.MemberBytes = defaultdict(int)  # member -> bytes fetched
+        self.__lock = threading.Lock()
+
+    def Record(self, event):
+        with self.__lock:
+            if self.KeepEvents:
+                self.Events.append(event)
+            if event["event"] == "fetch":
+                self.FetchCount += 1
+                self.BytesFetched += event["bytes"]
+                self.FetchSeconds += event["seconds"]
+                self.Retries += event["retries"]
+                if event.get("member") is not None:
+                    self.MemberFetches[event["member"]] += 1
+                    self.MemberBytes[event["member"]] += event["bytes"]
+            elif event["event"] == "stage":
+                self.StageSeconds[event["stage"]] += event["seconds"]
+                self.StageCounts[event["stage"]] += 1
+                if event["member"] is not None:
+                    self.MemberSeconds[event["member"]][event["stage"]] += event["seconds"]
+
+    def Summary(self):
+        lines = ["{0:d} fetches, {1:d} bytes, {2:.2f}s, {3:d} retries".format(
+            self.FetchCount, self.BytesFetched, self.FetchSeconds, self.Retries)]
+        for stage in sorted(self.StageSeconds):
+            lines.append("{0}: {1:d} x, {2:.2f}s".format(stage, self.StageCounts[stage], self.StageSeconds[stage]))
+        for member in sorted(set(self.MemberSeconds) | set(self.MemberFetches), key=str):
+            parts = []
+            if member in self.MemberFetches:
+                parts.append("{0:d} fetches, {1:d} bytes".format(self.MemberFetches[member], self.MemberBytes[member]))
+            parts += ["{0} {1:.2f}s".format(stage, seconds) for stage, seconds in sorted(self.MemberSeconds.get(member, {}).items())]
+            lines.append("member {0}: {1}".format(member, ", ".join(parts)))
+        return "\n".join(lines)
+
+    def Close(self):
+        return
+
+
+class LoggingSink(StatsSink):
+    """Aggregates events and logs a summary when closed."""
+
+    def __init__(self, level=logging.INFO, logger=None):
+        # Keeps only the totals; a long run would otherwise hold every event
+        super().__init__(keep_events=False)
+        self.Level = level
+        self.Logger = logger if logger is not None else logging.getLogger("litscrap")
+
+    def Close(self):
+        self.Logger.log(self.Level, "Timing summary:\n" + self.Summary())
+
+
+class JSONLSink():
+    """Appends every event as one JSON object per line to a trace file."""
+
+    def __init__(self, path):
+        self.Path = path
+        self.__file = open(path, "a", encoding="utf-8", buffering=1024 * 1024)
+        self.__lock = threading.Lock()
+
+    def Record(self, event):
+        line = json.dumps(dict(event, time=time.time())) + "\n"
+        with self.__lock:
+            self.__file.write(line)
+
+    def Close(self):
+        with self.__lock:
+            self.__file.close()
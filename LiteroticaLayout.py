@@ -0,0 +1,59 @@
+from collections import namedtuple
+from functools import lru_cache
+import os
+import re
+import unicodedata
+
+
+_slug_strip = re.compile(r"[^\w\s-]")
+_slug_hyphenate = re.compile(r"[-\s]+")
+
+@lru_cache(maxsize=4096)
+def slugify(value):
+    # Same output as django.utils.text.slugify(value): ASCII only, lowercase, runs of spaces and hyphens
+    # collapsed to one hyphen, other punctuation dropped.  Cached, since the same titles are slugified repeatedly.
+    value = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    value = _slug_strip.sub("", value.lower())
+    return _slug_hyphenate.sub("-", value).strip("-_")
+
+def series_slug(seriesTitle):
+    # "Series Name: 3 Part Series" -> "series-name"; names a series' directory and its text file
+    return slugify(seriesTitle.split(":")[0])
+
+
+# Where one series is written: its slug, chapter directory and concatenated text file
+SeriesLayout = namedtuple("SeriesLayout", ["Title", "Slug", "Directory", "TextPath"])
+
+
+class LiteroticaLayout():
+    """
+    Every output path for a member's stories under contentDirectory, worked out in one pass over the listings:
+    the series slugs, the series directories and text files, and each story's directory.
+    Directories() lists every directory the stories are written to, for an output's MakeDirectories() and Preload().
+    """
+
+    def __init__(self, memberPage, contentDirectory):
+        self.ContentDirectory = contentDirectory
+        self.CSVPath = os.path.join(contentDirectory, f'member_{memberPage.MemberID}.csv')
+        self.Series = []  # SeriesLayout per series, in listing order
+        self.__seriesByTitle = {}
+        self.__storyDirectories = {}  # story URL -> directory its files go in
+
+        for storyEntry in memberPage.IndividualStories:
+            self.__storyDirectories[storyEntry.URL] = contentDirectory
+        for seriesTitle, seriesEntries in memberPage.SeriesStories:
+            slug = series_slug(seriesTitle)
+            series = SeriesLayout(seriesTitle, slug, os.path.join(contentDirectory, slug), os.path.join(contentDirectory, slug + '.txt'))
+            self.Series.append(series)
+            self.__seriesByTitle[seriesTitle] = series
+            for storyEntry in seriesEntries:
+                self.__storyDirectories[storyEntry.URL] = series.Directory
+
+    def SeriesFor(self, seriesTitle):
+        return self.__seriesByTitle[seriesTitle]
+
+    def StoryDirectory(self, storyEntry):
+        return self.__storyDirectories[storyEntry.URL]
+
+    def Directories(self):
+        return [self.ContentDirectory] + list(dict.fromkeys(series.Directory for series in self.Series))
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import time
+
+
+class LiteroticaManifest():
+    """
+    Record of the stories downloaded for one member, kept as JSON beside the output files.
+    Each story URL maps to the listing metadata last seen for it, its page count and hashes of its content,
+    so that a later sync can tell which stories are new or have changed.
+    """
+
+    __version = 1
+
+    # Listing fields which, when changed, mean a story should be downloaded again
+    ListingFields = ("Title", "SecondaryLine", "Date", "Rating", "SeriesTitle")
+
+    def __init__(self, path):
+        self.Path = path
+        self.Stories = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == LiteroticaManifest.__version:
+                self.Stories = data.get("stories", {})
+
+    @staticmethod
+    def ListingMetadata(story, seriesTitle=None):
+        return {"Title": story.Title, "SecondaryLine": story.SecondaryLine, "Date": story.Date,
+                "Rating": story.Rating, "SeriesTitle": seriesTitle}
+
+    @staticmethod
+    def ContentHash(text):
+        if text is None:
+            return None
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        return hashlib.sha256(text).hexdigest()
+
+    def ListingChanged(self, story, seriesTitle=None):
+        # True if story is not in the manifest or its listing metadata differs from what was recorded
+        entry = self.Stories.get(story.URL)
+        if entry is None:
+            return True
+        listing = LiteroticaManifest.ListingMetadata(story, seriesTitle)
+        return any(entry.get(field) != listing[field] for field in LiteroticaManifest.ListingFields)
+
+    def Record(self, story, seriesTitle=None):
+        entry = LiteroticaManifest.ListingMetadata(story, seriesTitle)
+        entry.update({"FileName": story.FileName,
+                      "PageCount": story.PageCount(),
+                      "TextHash": LiteroticaManifest.ContentHash(story.Text),
+                      "PlainTextHash": LiteroticaManifest.ContentHash(story.PlainText),
+                      "UpdatedAt": time.time()})
+        self.Stories[story.URL] = entry
+
+    def Remove(self, url):
+        self.Stories.pop(url, None)
+
+    def Save(self):
+        temp_path = self.Path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": LiteroticaManifest.__version, "stories": self.Stories}, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.Path)
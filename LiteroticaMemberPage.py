@@ -1,12 +1,43 @@
-from bs4 import BeautifulSoup
-from urllib import request
-from LiteroticaStoryPage import LiteroticaStoryPage
-from django.utils.text import slugify
+# bs4, lxml, asyncio and the process pool are imported where they are first needed, which keeps importing this module cheap
+from LiteroticaStoryPage import LiteroticaStoryListing, StoryDownloadError, parse_html_document, parse_story_pages, reparse_raw_pages
+from LiteroticaFetcher import LiteroticaFetcher, PageFetchError
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaManifest import LiteroticaManifest
+from LiteroticaOutput import ArchiveOutput, DirectoryOutput
+from LiteroticaLayout import LiteroticaLayout, slugify
+from LiteroticaDataset import LISTING_FORMATS, listing_bytes, listing_table
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque, namedtuple
+from functools import lru_cache
+import gzip
 import os
+import shutil
 import logging
 import csv
 
 
+# Outcome of downloading and writing one story in a pipelined WritePlainTextToFile run.
+# Error is a StoryDownloadError when pages couldn't be fetched, or whatever else went wrong.
+StoryDownloadResult = namedtuple("StoryDownloadResult", ["URL", "FileName", "SeriesTitle", "Success", "Error"])
+
+# Story URLs by what an incremental sync did with them
+SyncReport = namedtuple("SyncReport", ["New", "Changed", "Unchanged", "Removed", "Failed"])
+
+# The member page row matches, precompiled for the lxml parser
+LxmlSelectors = namedtuple("LxmlSelectors", ["StoryRows", "SeriesTitleRows", "Cells", "FirstLink", "Category", "MemberName", "Title"])
+
+@lru_cache(maxsize=None)
+def lxml_selectors():
+    from lxml import etree
+    return LxmlSelectors(StoryRows=etree.XPath("//tr[@class='root-story r-ott']"),
+                         SeriesTitleRows=etree.XPath("//tr[contains(concat(' ', normalize-space(@class), ' '), ' ser-ttl ')]"),
+                         Cells=etree.XPath(".//td"),
+                         FirstLink=etree.XPath("(.//a)[1]"),
+                         Category=etree.XPath("(.//a)[1]//span[1]"),
+                         MemberName=etree.XPath("//a[contains(concat(' ', normalize-space(@class), ' '), ' contactheader ')]"),
+                         Title=etree.XPath("string(//title)"))
+
+
 class LiteroticaMemberPage():
     """
     A Literotica member page.
@@ -29,6 +60,8 @@ class LiteroticaMemberPage():
     # Story row match within Series
     __storySeriesIndividualTitleClass = {"class" : "sl"}
     __storySeriesIndividualTitleTag = "tr"
+
+    # The same matches, precompiled for the lxml parser, are in lxml_selectors()
      
     # __save* items are used when saving member pages to disk.
     # Member page header for saving to disk.
@@ -50,9 +83,28 @@ class LiteroticaMemberPage():
 
     __savefile_format = "member_{memberID}.html"
 
-    def __init__(self, memberID):
+    def __init__(self, memberID, fetcher=None, parser="bs4", checkpoint=None, keep_raw=False, search_index=None):
+        # fetcher is shared with every story parsed from this page, so one run reuses the same connections
+        # checkpoint: the LiteroticaCheckpoint every story keeps the pages it has fetched so far in, so that writing
+        # again after a failure resumes each story at its first missing page.  By default it is held in memory;
+        # give it a directory to resume across runs.
+        # keep_raw: keep this page and every story's pages as fetched, compressed beside the files written from them,
+        # so that Reprocess() can rebuild the files when the parsing improves without downloading anything again
+        # search_index: an optional LiteroticaSearchIndex every story written is added to
+        # parser: "bs4" to parse with BeautifulSoup, or "lxml" to use lxml.html with precompiled XPath selectors,
+        # which is much faster and lighter on pages with thousands of stories.  Both build the same story lists.
+        if parser not in ("bs4", "lxml"):
+            raise ValueError("Unknown parser: {0}".format(parser))
+        self.Fetcher = fetcher if fetcher is not None else LiteroticaFetcher.Shared()
+        self.Parser = parser
+        self.Checkpoint = checkpoint if checkpoint is not None else LiteroticaCheckpoint()
+        self.KeepRaw = keep_raw
+        self.SearchIndex = search_index
+
         self.__html = None
         self.__soup = None
+        self.__tree = None
+        self.__rawPage = None  # The member page as fetched, gzipped, when keep_raw, until written
         self.__seriesIsParsed = False
         self.__singleStoriesIsParsed = False
         self.__isLoaded = False
@@ -62,8 +114,10 @@ class LiteroticaMemberPage():
         self.MemberID = memberID
         self.MemberName = None
         self.MemberCopyright = None
-        self.SeriesStories = []
-        self.IndividualStories = []
+        self.SeriesStories = []  # (series title, [LiteroticaStoryListing]) per series
+        self.IndividualStories = []  # LiteroticaStoryListing per story not in a series
+        self.DownloadResults = []  # StoryDownloadResult per story, from the last pipelined write or Reprocess
+        self.DownloadError = None  # Why the member page couldn't be fetched, if it couldn't
 
     def IsValidMemberPage(self):
         return self.__isValidMemberPage
@@ -81,31 +135,98 @@ class LiteroticaMemberPage():
         return self.__singleStoriesIsParsed
 
     def DownloadMemberPage(self):
+        self.DownloadError = None
         try:
-            urlStream = request.urlopen(self.MemberPageURL)
-            self.__html = urlStream.read()
-            self.__soup = BeautifulSoup(self.__html, features="lxml")
+            with self.Fetcher.Instrumentation.Member(self.MemberID):
+                html = self.Fetcher.FetchPage(self.MemberPageURL)
+        except PageFetchError as e:
+            logging.warning("Error getting member page: {0}".format(e))
+            self.DownloadError = e
+            return False
+
+        return self.LoadMemberPage(html)
+
+    async def DownloadMemberPageAsync(self, fetcher, executor=None):
+        # asyncio counterpart of DownloadMemberPage.  fetcher is a LiteroticaAsyncFetcher; the page is parsed by
+        # LoadMemberPage on executor (None for the loop's default), so the event loop isn't blocked while parsing,
+        # and timed on the async fetcher's instrumentation.
+        # Stories promoted with StoryPage() can then be downloaded with DownloadAllPagesAsync on the same fetcher.
+        import asyncio
+        self.DownloadError = None
+        try:
+            with fetcher.Instrumentation.Member(self.MemberID):
+                html = await fetcher.FetchPage(self.MemberPageURL)
+        except PageFetchError as e:
+            logging.warning("Error getting member page: {0}".format(e))
+            self.DownloadError = e
+            return False
+
+        return await asyncio.get_running_loop().run_in_executor(executor, self.LoadMemberPage, html, fetcher.Instrumentation)
+
+    def StoryErrors(self):
+        # What went wrong with each story which failed in the last pipelined write, as JSON-ready dicts
+        errors = []
+        for result in self.DownloadResults:
+            if result.Success:
+                continue
+            error = result.Error.AsDict() if isinstance(result.Error, StoryDownloadError) else {"url": result.URL, "error": str(result.Error)}
+            error.update({"file_name": result.FileName, "series": result.SeriesTitle, "type": type(result.Error).__name__})
+            errors.append(error)
+        return errors
+
+    def LoadMemberPage(self, html, instrumentation=None):
+        # Parses an already-fetched member page.  The parsed page is released once the story listings have been
+        # extracted, so a loaded member page only holds its plain listing records.
+        # instrumentation: what the parse is timed on, by default the fetcher's
+        instrumentation = instrumentation if instrumentation is not None else self.Fetcher.Instrumentation
+        self.__html = html
+        if self.KeepRaw:
+            self.__rawPage = gzip.compress(html.encode("utf-8") if isinstance(html, str) else html)
+        try:
+            with instrumentation.Stage("parse", url=self.MemberPageURL, member=self.MemberID):
+                if self.Parser == "lxml":
+                    self.__tree = parse_html_document(self.__html)
+                else:
+                    from bs4 import BeautifulSoup
+                    self.__soup = BeautifulSoup(self.__html, features="lxml")
         except:
+            self.__ReleasePage()
             return False
 
         self.__isLoaded = True
 
-        if "Literotica.com - error" in self.__soup.title.string:
-            return False
-        
-        self.__isValidMemberPage = True
-        
         try:
-            self.ParseMemberInfo()
-            self.ParseAllStories()
+            if "Literotica.com - error" in self.__PageTitle():
+                return False
+
+            self.__isValidMemberPage = True
+
+            with instrumentation.Stage("member_parse", url=self.MemberPageURL, member=self.MemberID):
+                self.ParseMemberInfo()
+                self.ParseAllStories()
         except Exception as e:
             logging.warning("Error parsing member page: {0}".format(e))
             return False
+        finally:
+            self.__ReleasePage()
 
         return self.IsParsed()
 
+    def __ReleasePage(self):
+        self.__html = None
+        self.__soup = None
+        self.__tree = None
+
+    def __PageTitle(self):
+        if self.Parser == "lxml":
+            return lxml_selectors().Title(self.__tree)
+        return self.__soup.title.string
+
     def ParseMemberInfo(self):
-        self.MemberName = self.__soup.find("a", class_="contactheader").text
+        if self.Parser == "lxml":
+            self.MemberName = str(lxml_selectors().MemberName(self.__tree)[0].text_content())
+        else:
+            self.MemberName = self.__soup.find("a", class_="contactheader").text
 
     def ParseAllStories(self):
         try:
@@ -123,32 +244,52 @@ class LiteroticaMemberPage():
         return True
 
     def ParseSingleStories(self):
-        SingleStoryResults = self.__soup.findAll(LiteroticaMemberPage.__storyTitleTag,attrs=LiteroticaMemberPage.__storyTitleClass)
+        if self.Parser == "lxml":
+            SingleStoryResults = lxml_selectors().StoryRows(self.__tree)
+        else:
+            SingleStoryResults = self.__soup.findAll(LiteroticaMemberPage.__storyTitleTag,attrs=LiteroticaMemberPage.__storyTitleClass)
         self.IndividualStories = self.__ParseStoryResultForStoryLines(SingleStoryResults)
         return
 
     def __GetSeriesTitleBlocks(self):
+        if self.Parser == "lxml":
+            return lxml_selectors().SeriesTitleRows(self.__tree)
         seriesStoryTitleBlocks = self.__soup.findAll(LiteroticaMemberPage.__storySeriesTitleTag,attrs= LiteroticaMemberPage.__storySeriesTitleClass)
         return seriesStoryTitleBlocks
 
     def SeriesTitles(self):
-        seriesStoryTitleBlocks = self.__GetSeriesTitleBlocks()
-        seriesTitles = []
-        for storiesSeries in seriesStoryTitleBlocks:
-            seriesTitle = storiesSeries.text
-            seriesTitles += seriesTitle
+        # The parsed page has been released by now, so this reads from the parsed series
+        return [seriesTitle for seriesTitle, _ in self.SeriesStories]
 
-        return seriesTitles
+    def StoryPage(self, storyListing):
+        # A downloadable LiteroticaStoryPage for one of this member's listings, sharing the member's fetcher
+        story = storyListing.Promote(fetcher=self.Fetcher, checkpoint=self.Checkpoint)
+        story.KeepRaw = self.KeepRaw
+        return story
+
+    def __ElementText(self, element):
+        if self.Parser == "lxml":
+            return str(element.text_content())
+        return element.text
 
     def __ParseSeriesStoriesFromTitleBlocks(self, storiesSeriesBlock):
-        rowSibling = storiesSeriesBlock.nextSibling
+        if self.Parser == "lxml":
+            seriesRows = []
+            for rowSibling in storiesSeriesBlock.itersiblings():
+                if rowSibling.tag != "tr" or LiteroticaMemberPage.__storySeriesIndividualTitleClass["class"] not in rowSibling.get("class", "").split():
+                    break
+                seriesRows.append(rowSibling)
+            return self.__ParseStoryResultForStoryLines(seriesRows)
+
+        # find_next_sibling() steps over the whitespace between rows, as itersiblings() does
+        rowSibling = storiesSeriesBlock.find_next_sibling()
         thisSeriesStories = []
 
         # get the next rows on until we no longer have rows or
         # we find a row that is not a series story class
-        while rowSibling != None and rowSibling.name == "tr" and LiteroticaMemberPage.__storySeriesIndividualTitleClass["class"] in rowSibling.attrs["class"]:
+        while rowSibling != None and rowSibling.name == "tr" and LiteroticaMemberPage.__storySeriesIndividualTitleClass["class"] in rowSibling.get("class", []):
             thisSeriesStories += self.__ParseStoryResultForStoryLines([rowSibling])
-            rowSibling = rowSibling.nextSibling
+            rowSibling = rowSibling.find_next_sibling()
 
         return thisSeriesStories
 
@@ -156,7 +297,7 @@ class LiteroticaMemberPage():
         seriesStoryTitleBlocks = self.__GetSeriesTitleBlocks()
         allSeriesStories = []
         for storiesSeriesBlock in seriesStoryTitleBlocks:
-            seriesTitle = storiesSeriesBlock.text.strip()
+            seriesTitle = self.__ElementText(storiesSeriesBlock).strip()
             
             thisSeriesStories = self.__ParseSeriesStoriesFromTitleBlocks(storiesSeriesBlock)
 
@@ -185,11 +326,13 @@ class LiteroticaMemberPage():
         else:
             return False
 
-    def WriteToDisk(self, contentDirectory):
+    def WriteToDisk(self, contentDirectory, output=None):
         if not self.IsLoaded() or not self.IsParsed() or not self.IsValidMemberPage():
             return False
+        output = output if output is not None else DirectoryOutput.Default()
         try:
-            with self.CreateMemberPage(contentDirectory) as file:
+            memberFileName = LiteroticaMemberPage.__savefile_format.format(memberID=self.MemberID)
+            with output.Open(os.path.join(contentDirectory, memberFileName)) as file:
                 file.write(self.__saveHeader.replace("{MemberPageTitle}" ,"Member #"+str(self.MemberID)))
 
                 for storyEntry in self.IndividualStories:
@@ -207,11 +350,12 @@ class LiteroticaMemberPage():
 
         return True
     
-    def WriteCSVToDisk(self, contentDirectory):
+    def WriteCSVToDisk(self, contentDirectory, output=None):
         if not self.IsLoaded() or not self.IsParsed() or not self.IsValidMemberPage():
             return False
+        output = output if output is not None else DirectoryOutput.Default()
         
-        with open(os.path.join(contentDirectory, f'member_{self.MemberID}.csv'),"w+") as file:
+        with output.Open(os.path.join(contentDirectory, f'member_{self.MemberID}.csv')) as file:
             file.write('StoryLink,MemberName,MemberUID,SeriesTitle,Subdir,FilePrefix,StoryTitle,StorySecondaryLine,StoryCategory,Rating\r\n')  # Write header
             writer = csv.writer(file)  # We use a CSV Writer to appropriately escape commas and quotes
 
@@ -222,35 +366,399 @@ class LiteroticaMemberPage():
 
             for seriesTitle, seriesEntries in self.SeriesStories:
                 clean_series_title = seriesTitle.split(':')[0].strip()
+                series_slug = slugify(clean_series_title)
                 for storyEntry in seriesEntries:
-                    story_info = [storyEntry.URL, self.MemberName, self.MemberID, clean_series_title, slugify(clean_series_title), storyEntry.FileName.replace('.html', ''),
+                    story_info = [storyEntry.URL, self.MemberName, self.MemberID, clean_series_title, series_slug, storyEntry.FileName.replace('.html', ''),
                                 storyEntry.Title.strip(), storyEntry.SecondaryLine.strip(),storyEntry.Category, storyEntry.Rating]
                     writer.writerow(story_info)
     
-    def WritePlainTextToFile(self, contentDirectory, force_redownload=False):
+    def WriteListingsToDisk(self, contentDirectory, format="parquet", output=None):
+        # The CSV index as a typed columnar table, member_<id>.parquet or member_<id>.arrow (Arrow IPC), with Rating as
+        # a float and Date as a date.  Needs pyarrow.  To gather many members in one dataset, see LiteroticaDataset.
+        if not self.IsLoaded() or not self.IsParsed() or not self.IsValidMemberPage():
+            return False
+        if format not in LISTING_FORMATS:
+            raise ValueError("Unknown listing format: {0}".format(format))
+        output = output if output is not None else DirectoryOutput.Default()
+        path = os.path.join(contentDirectory, f'member_{self.MemberID}' + LISTING_FORMATS[format])
+        output.WriteBytes(path, listing_bytes(listing_table(self), format))
+        return True
+
+    def WritePlainTextToFile(self, contentDirectory, force_redownload=False, pipelined=False, max_workers=4, parse_processes=None,
+                             streaming=False, output=None):
+        # pipelined: download stories on max_workers threads while parsing them in parse_processes worker processes
+        # (None for one per core, 0 to parse on the download threads).  A pipelined run records a StoryDownloadResult
+        # per story in DownloadResults instead of stopping at the first failure, and returns True only if all succeeded.
+        # streaming: write stories page by page and build series files by appending chapter files, so that peak memory
+        # is one page rather than one series.  Story Text and PlainText are not kept.
+        # output: the DirectoryOutput every file is written through, e.g. DirectoryOutput(background=True) to overlap
+        # writing with downloading.  Queued writes are flushed before returning.
         if not self.IsLoaded() or not self.IsParsed() or not self.IsValidMemberPage():
             logging.warning('Member page not appropriately loaded!')
             return False
 
+        if pipelined and streaming:
+            raise ValueError("pipelined and streaming modes cannot be combined")
+        output = output if output is not None else DirectoryOutput.Default()
+        layout = self.__PrepareLayout(contentDirectory, output)
+        try:
+            if pipelined:
+                success = self.__WritePlainTextPipelined(layout, force_redownload, max_workers, parse_processes, output)
+            elif streaming:
+                success = self.__WritePlainTextStreaming(layout, force_redownload, output)
+            else:
+                success = self.__WritePlainTextSequential(layout, force_redownload, output)
+            output.Flush()
+            self.__FlushSearchIndex()
+        finally:
+            output.Forget(layout.Directories())
+        return success
+
+    def Layout(self, contentDirectory):
+        # Every output path for this member's stories under contentDirectory; see LiteroticaLayout
+        return LiteroticaLayout(self, contentDirectory)
+
+    def __PrepareLayout(self, contentDirectory, output):
+        # Plans the paths once, makes the series directories, and snapshots the directories so that the
+        # "already have it" checks don't stat each file
+        layout = self.Layout(contentDirectory)
+        output.MakeDirectories(layout.Directories())
+        output.Preload(layout.Directories())
+        if self.__rawPage is not None:
+            output.WriteBytes(self.RawPagePath(contentDirectory), self.__rawPage)
+            self.__rawPage = None
+        if self.SearchIndex is not None:
+            self.SearchIndex.AddMember(self.MemberID, self.MemberName)
+        return layout
+
+    def __IndexStory(self, story, directory, output):
+        # Adds a written story to the search index.  The hash in the file's sidecar lets the index skip a story it
+        # already has without reading it; a story which was streamed to disk is read back in chunks.
+        if self.SearchIndex is None:
+            return
+        _, plaintext_fname = story.StoryFilePaths(directory)
+        digest = output.Digest(plaintext_fname)
+        if story.PlainText is not None:
+            self.SearchIndex.Add(story, digest=digest)
+            return
+        if digest is None:
+            output.Flush()  # Only a file still queued, or one from before sidecars, has no digest
+        self.SearchIndex.AddFile(story, plaintext_fname, output, digest)
+
+    def __FlushSearchIndex(self):
+        if self.SearchIndex is not None:
+            self.SearchIndex.Flush()
+
+    def RawPagePath(self, contentDirectory):
+        # Where a keep_raw run keeps the member page as fetched
+        return os.path.join(contentDirectory, f'member_{self.MemberID}.raw.gz')
+
+    def Reprocess(self, contentDirectory, parse_processes=None, output=None):
+        # Rebuilds every story's files, the series files and the CSV from the raw pages an earlier keep_raw run kept
+        # in contentDirectory, without fetching anything; the member page itself is loaded from its raw copy if it
+        # hasn't been loaded.  Stories are parsed in parse_processes worker processes (None for one per core, 0 to
+        # parse in this thread).  Records a StoryDownloadResult per story in DownloadResults, and returns True only
+        # if every story had raw pages to rebuild from.
+        output = output if output is not None else DirectoryOutput.Default()
+        if not self.IsLoaded():
+            raw_fname = self.RawPagePath(contentDirectory)
+            if not output.Exists(raw_fname):
+                logging.warning("No raw member page in {0}".format(contentDirectory))
+                return False
+            self.LoadMemberPage(gzip.decompress(output.ReadBytes(raw_fname)))
+        if not self.IsParsed() or not self.IsValidMemberPage():
+            logging.warning('Member page not appropriately loaded!')
+            return False
+
+        layout = self.__PrepareLayout(contentDirectory, output)
+        try:
+            success = self.__Reprocess(layout, parse_processes, output)
+            output.Flush()
+            self.__FlushSearchIndex()
+        finally:
+            output.Forget(layout.Directories())
+        return success
+
+    def __Reprocess(self, layout, parse_processes, output):
+        jobs, series_jobs = self.__StoryJobs(layout)
+
+        parse_pool = None
+        if parse_processes != 0:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            parse_pool = ProcessPoolExecutor(max_workers=parse_processes, mp_context=multiprocessing.get_context("spawn"))
+
+        def start(story, directory):
+            # None when there are no raw pages; else a Future of their parse, or without a pool the raw pages' path
+            raw_fname = story.RawPagesPath(directory)
+            if not output.Exists(raw_fname):
+                return None
+            if parse_pool is None:
+                return raw_fname
+            try:
+                return parse_pool.submit(reparse_raw_pages, output.ReadBytes(raw_fname))
+            except Exception as e:
+                failed = Future()
+                failed.set_exception(e)
+                return failed
+
+        # At most window stories are read and parsing at once, and each story's text is released once its files
+        # are written, so memory stays bounded however large the library is
+        window = 2 * (parse_processes or os.cpu_count() or 1)
+        results = []
+        waiting, in_flight = deque(jobs), deque()
+        try:
+            while waiting or in_flight:
+                while waiting and len(in_flight) < window:
+                    story, directory, seriesTitle = waiting.popleft()
+                    in_flight.append((story, directory, seriesTitle, start(story, directory)))
+                story, directory, seriesTitle, parse = in_flight.popleft()
+                try:
+                    if parse is None:
+                        raise FileNotFoundError("No raw pages at {0}".format(story.RawPagesPath(directory)))
+                    if parse_pool is None:
+                        story.Text, story.PlainText = reparse_raw_pages(output.ReadBytes(parse))
+                    else:
+                        story.Text, story.PlainText = parse.result()
+                    story.WriteStoryFiles(directory, output)
+                    self.__IndexStory(story, directory, output)
+                    results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, True, None))
+                except Exception as e:
+                    logging.warning("Error reprocessing story {0}: {1}".format(story.URL, e))
+                    results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, False, e))
+                story.Text = story.PlainText = None  # The series files read the chapters back from disk
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+        self.DownloadResults = results
+        self.__WriteCompleteSeries(series_jobs, results, output)
+        self.WriteCSVToDisk(layout.ContentDirectory, output)
+        return all(result.Success for result in results)
+
+    def WriteArchive(self, archivePath, force_redownload=False, **options):
+        # Writes the stories, series files and CSV index into the one zip archive at archivePath (see ArchiveOutput)
+        # rather than as separate files.  Stories already in the archive aren't downloaded again.
+        # options are passed on to WritePlainTextToFile, e.g. pipelined=True.
+        contentDirectory = os.path.dirname(os.path.abspath(archivePath))
+        with ArchiveOutput(archivePath, contentDirectory) as output:
+            success = self.WritePlainTextToFile(contentDirectory, force_redownload=force_redownload, output=output, **options)
+            if success:
+                self.WriteCSVToDisk(contentDirectory, output)
+        return success
+
+    def __WritePlainTextSequential(self, layout, force_redownload, output):
+        # Listings are promoted to story pages only while they are written, so story text doesn't accumulate
         for storyEntry in self.IndividualStories:
-            storyEntry.DownloadAndWriteStory(contentDirectory, force_redownload=force_redownload)
+            story = self.StoryPage(storyEntry)
+            story.DownloadAndWriteStory(layout.ContentDirectory, force_redownload=force_redownload, output=output)
+            self.__IndexStory(story, layout.ContentDirectory, output)
 
         for seriesTitle, seriesEntries in self.SeriesStories:
-            series_slug = slugify(seriesTitle.split(":")[0])
-            series_path = os.path.join(contentDirectory, series_slug)
-            if not os.path.exists(series_path):
-                os.makedirs(series_path)
+            series = layout.SeriesFor(seriesTitle)
             
-            series_text = ''
-            for seriesIndividualStory in seriesEntries:
-                seriesIndividualStory.DownloadAndWriteStory(series_path, force_redownload=force_redownload)
-                series_text += seriesIndividualStory.PlainText
+            seriesPages = [self.StoryPage(seriesIndividualStory) for seriesIndividualStory in seriesEntries]
+            for seriesPage in seriesPages:
+                seriesPage.DownloadAndWriteStory(series.Directory, force_redownload=force_redownload, output=output)
+                self.__IndexStory(seriesPage, series.Directory, output)
             
-            with open(os.path.join(contentDirectory, series_slug + '.txt'), 'w') as file:
-                file.write(series_text)
+            self.__WriteSeriesText(series, seriesPages, output)
+
+        return True
+
+    def SyncToDirectory(self, contentDirectory, manifestPath=None, output=None):
+        # Incremental alternative to WritePlainTextToFile + WriteCSVToDisk.
+        # Downloads only stories which are new, whose listing metadata changed since the last sync, or whose output
+        # went missing; rewrites only the series files and CSV affected.  Returns a SyncReport of story URLs; Failed
+        # holds those of the New and Changed stories which couldn't be downloaded, and DownloadResults why.
+        # A story which fails doesn't stop the others, and is left out of the manifest so the next sync retries it.
+        if not self.IsLoaded() or not self.IsParsed() or not self.IsValidMemberPage():
+            logging.warning('Member page not appropriately loaded!')
+            return None
+
+        output = output if output is not None else DirectoryOutput.Default()
+        layout = self.__PrepareLayout(contentDirectory, output)
+        try:
+            report = self.__Sync(layout, manifestPath, output)
+            self.__FlushSearchIndex()
+            return report
+        finally:
+            output.Forget(layout.Directories())
+
+    def __Sync(self, layout, manifestPath, output):
+        contentDirectory = layout.ContentDirectory
+        if manifestPath is None:
+            manifestPath = os.path.join(contentDirectory, f'member_{self.MemberID}.manifest.json')
+        manifest = LiteroticaManifest(manifestPath)
+        report = SyncReport([], [], [], [], [])
+        results = []
+
+        def sync_story(storyListing, directory, seriesTitle):
+            # Returns True if the story was (re)downloaded, None if that failed
+            story = self.StoryPage(storyListing)
+            if story.URL not in manifest.Stories:
+                report.New.append(story.URL)
+            elif manifest.ListingChanged(story, seriesTitle) or story.NeedsDownload(directory, output=output):
+                report.Changed.append(story.URL)
+            else:
+                report.Unchanged.append(story.URL)
+                return False
+            try:
+                story.DownloadAndWriteStory(directory, force_redownload=True, output=output)
+            except Exception as e:
+                logging.warning("Error syncing story {0}: {1}".format(story.URL, e))
+                report.Failed.append(story.URL)
+                results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, False, e))
+                return None
+            self.__IndexStory(story, directory, output)
+            manifest.Record(story, seriesTitle)
+            results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, True, None))
+            return True
+
+        try:
+            for storyEntry in self.IndividualStories:
+                sync_story(storyEntry, contentDirectory, None)
+
+            for seriesTitle, seriesEntries in self.SeriesStories:
+                series = layout.SeriesFor(seriesTitle)
+                updated = [sync_story(story, series.Directory, seriesTitle) for story in seriesEntries]
+                if None in updated:
+                    logging.warning("Not writing series {0}: some chapters failed".format(series.Title))
+                elif any(updated) or not output.Exists(series.TextPath):
+                    output.Flush()  # The chapters are read back below
+                    seriesPages = [self.StoryPage(story) for story in seriesEntries]
+                    for seriesPage in seriesPages:
+                        seriesPage.DownloadAndWriteStory(series.Directory, output=output)  # Loads the chapters back from disk
+                    self.__WriteSeriesText(series, seriesPages, output)
+
+            listed = {story.URL for story in self.IndividualStories}
+            listed.update(story.URL for _, seriesEntries in self.SeriesStories for story in seriesEntries)
+            for url in sorted(set(manifest.Stories) - listed):
+                report.Removed.append(url)
+                manifest.Remove(url)
+                if self.SearchIndex is not None:
+                    self.SearchIndex.Remove(url)
+
+            if report.New or report.Changed or report.Removed or not output.Exists(layout.CSVPath):
+                self.WriteCSVToDisk(contentDirectory, output)
+        finally:
+            # The stories synced so far are recorded even if something above failed, so the next sync skips them
+            self.DownloadResults = results
+            if report.New or report.Changed or report.Removed:
+                output.Flush()  # Recorded in the manifest only once the files are in place
+                manifest.Save()
+
+        logging.info("Synced member {0}: {1} new, {2} changed, {3} unchanged, {4} removed, {5} failed".format(
+            self.MemberID, len(report.New), len(report.Changed), len(report.Unchanged), len(report.Removed), len(report.Failed)))
+        return report
+
+    def __WriteSeriesText(self, series, seriesPages, output):
+        # Chapters whose text has been released are copied from their files a block at a time
+        if all(story.PlainText is not None for story in seriesPages):
+            output.WriteText(series.TextPath, ''.join([story.PlainText for story in seriesPages]))
+            return
+        output.Flush()  # The chapters may still be queued for writing
+        with output.Open(series.TextPath) as series_file:
+            for story in seriesPages:
+                if story.PlainText is not None:
+                    series_file.write(story.PlainText)
+                    continue
+                _, plaintext_fname = story.StoryFilePaths(series.Directory)
+                with output.OpenRead(plaintext_fname) as chapter_file:
+                    shutil.copyfileobj(chapter_file, series_file)
+
+    def __WritePlainTextStreaming(self, layout, force_redownload, output):
+        for storyEntry in self.IndividualStories:
+            story = self.StoryPage(storyEntry)
+            story.DownloadAndWriteStory(layout.ContentDirectory, force_redownload=force_redownload, streaming=True, output=output)
+            self.__IndexStory(story, layout.ContentDirectory, output)
+
+        for seriesTitle, seriesEntries in self.SeriesStories:
+            series = layout.SeriesFor(seriesTitle)
+
+            with output.Open(series.TextPath) as series_file:
+                for seriesIndividualStory in seriesEntries:
+                    seriesPage = self.StoryPage(seriesIndividualStory)
+                    seriesPage.DownloadAndWriteStory(series.Directory, force_redownload=force_redownload, streaming=True, output=output)
+                    self.__IndexStory(seriesPage, series.Directory, output)
+                    output.Flush()  # A chapter which was already downloaded may still be queued for writing
+                    _, plaintext_fname = seriesPage.StoryFilePaths(series.Directory)
+                    with output.OpenRead(plaintext_fname) as chapter_file:
+                        shutil.copyfileobj(chapter_file, series_file)
 
         return True
 
+    def __StoryJobs(self, layout):
+        # (story page, directory, series title) in the order the stories should be written, and (SeriesLayout, story pages)
+        jobs = [(self.StoryPage(story), layout.ContentDirectory, None) for story in self.IndividualStories]
+        series_jobs = []
+        for seriesTitle, seriesEntries in self.SeriesStories:
+            series = layout.SeriesFor(seriesTitle)
+            seriesPages = [self.StoryPage(story) for story in seriesEntries]
+            series_jobs.append((series, seriesPages))
+            jobs += [(story, series.Directory, seriesTitle) for story in seriesPages]
+        return jobs, series_jobs
+
+    def __WriteCompleteSeries(self, series_jobs, results, output):
+        failed_series = {result.SeriesTitle for result in results if not result.Success}
+        for series, seriesPages in series_jobs:
+            if series.Title in failed_series:
+                logging.warning("Not writing series {0}: some chapters failed".format(series.Title))
+                continue
+            self.__WriteSeriesText(series, seriesPages, output)
+
+    def __WritePlainTextPipelined(self, layout, force_redownload, max_workers, parse_processes, output):
+        jobs, series_jobs = self.__StoryJobs(layout)
+
+        # Parsing is CPU-bound, so it gets its own processes rather than competing with the downloads for the GIL.
+        # Workers are spawned rather than forked, since the download threads may be holding locks.
+        parse_pool = None
+        if parse_processes != 0:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            parse_pool = ProcessPoolExecutor(max_workers=parse_processes, mp_context=multiprocessing.get_context("spawn"))
+
+        results = []
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as download_pool:
+                downloads = [download_pool.submit(self.__DownloadStoryStage, story, directory, force_redownload, parse_pool, output)
+                             for story, directory, _ in jobs]
+
+                # Written in job order, so later stories keep downloading while earlier ones are written
+                for (story, directory, seriesTitle), download in zip(jobs, downloads):
+                    try:
+                        content = download.result()
+                        if isinstance(content, Future):
+                            content = content.result()
+                        if content is None:
+                            story.DownloadAndWriteStory(directory, output=output)  # Already on disk; just loads it
+                        else:
+                            story.Text, story.PlainText = content
+                            story.WriteStoryFiles(directory, output)
+                        self.__IndexStory(story, directory, output)
+                        results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, True, None))
+                    except Exception as e:
+                        logging.warning("Error downloading story {0}: {1}".format(story.URL, e))
+                        results.append(StoryDownloadResult(story.URL, story.FileName, seriesTitle, False, e))
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+        self.DownloadResults = results
+        self.__WriteCompleteSeries(series_jobs, results, output)
+        return all(result.Success for result in results)
+
+    @staticmethod
+    def __DownloadStoryStage(story, directory, force_redownload, parse_pool, output):
+        # Runs on a download thread.  Returns None if the story is already on disk, otherwise (Text, PlainText)
+        # or a Future for it from parse_pool.
+        if not story.NeedsDownload(directory, force_redownload, output):
+            return None
+        pages = list(story.IterPagesNewFormat())
+        if parse_pool is None:
+            return parse_story_pages(pages)
+        return parse_pool.submit(parse_story_pages, pages)
+
     def __WriteSeriesTitleLine(self, file, seriesTitle):
         entryLine = self.__saveSeriesTitleEntry
         entryLine = entryLine.format(SeriesTitle=seriesTitle)
@@ -285,29 +793,52 @@ class LiteroticaMemberPage():
             storyWebLink = ""
             storyTitle = ""
 
-            subElements = result.findAll('td')
+            rowFields = self.__StoryRowFields(result)
 
-            if len(subElements) == 0:
+            if rowFields is None:
                 continue
+            storyURL, storyTitleLine, storySecondaryLine, storyCategory, storyDate = rowFields
 
-            storyPage = LiteroticaStoryPage()
-            storyPage.URL = subElements[0].find("a")["href"]
-            if "showstory.php?id=" in storyPage.URL:
-                storyPage.FileName = storyPage.URL.split("showstory.php?id=")[1] + ".html"
+            storyListing = LiteroticaStoryListing()
+            storyListing.URL = storyURL
+            if "showstory.php?id=" in storyListing.URL:
+                storyListing.FileName = storyListing.URL.split("showstory.php?id=")[1] + ".html"
             else:
-                storyPage.FileName = storyPage.URL.split("/")[-1] + ".html"
-            storyPage.MemberID = self.MemberID
-            storyTitleLine = subElements[0].text
+                storyListing.FileName = storyListing.URL.split("/")[-1] + ".html"
+            storyListing.MemberID = self.MemberID
             if u"\xa0" in storyTitleLine:
                 storyTitleLine, storyRating = storyTitleLine.split(u"\xa0")
                 storyRating = float(storyRating.replace('(','').replace(')','').replace('x.xx','0.00'))
-                storyPage.Rating = storyRating
+                storyListing.Rating = storyRating
                 storyTitleLine = storyTitleLine.replace("//","").strip()
 
-            storyPage.Title = storyTitleLine
-            storyPage.Category = subElements[2].find("a").find("span").text
-            storyPage.SecondaryLine = subElements[1].text
-            storyPage.Date = subElements[3].text
-            stories.append(storyPage)
+            storyListing.Title = storyTitleLine
+            storyListing.Category = storyCategory
+            storyListing.SecondaryLine = storySecondaryLine
+            storyListing.Date = storyDate
+            stories.append(storyListing)
 
         return stories
+
+    def __StoryRowFields(self, result):
+        # (URL, title line, secondary line, category, date) from a story row, or None for a row without cells
+        if self.Parser == "lxml":
+            selectors = lxml_selectors()
+            subElements = selectors.Cells(result)
+            if len(subElements) == 0:
+                return None
+            return (str(selectors.FirstLink(subElements[0])[0].get("href")),
+                    str(subElements[0].text_content()),
+                    str(subElements[1].text_content()),
+                    str(selectors.Category(subElements[2])[0].text_content()),
+                    str(subElements[3].text_content()))
+
+        subElements = result.findAll('td')
+        if len(subElements) == 0:
+            return None
+        # Plain str copies, so that listings don't keep the soup alive
+        return (str(subElements[0].find("a")["href"]),
+                str(subElements[0].text),
+                str(subElements[1].text),
+                str(subElements[2].find("a").find("span").text),
+                str(subElements[3].text))
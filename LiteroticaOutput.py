@@ -0,0 +1,475 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+
+class DirectoryOutput():
+    """
+    Writes output files atomically: each file goes to a temp file beside it and is moved into place with os.replace
+    once complete, so an interrupted run never leaves a truncated file behind.  Text is written as UTF-8 through a
+    large buffer.  Next to every file a hidden ".<name>.check" sidecar records its size and sha256, which Exists()
+    checks before a file is trusted as complete.  The same record is appended to a per-directory ".checks" journal.
+
+    With background=True, WriteText() hands the write to a writer thread and returns at once, so disk I/O overlaps
+    with fetching; Flush() waits for queued writes and raises the first error any of them hit.
+    Paths are ordinary filesystem paths.
+
+    Preload() takes one os.scandir snapshot of a directory and reads its ".checks" journal, so that Exists() and
+    Digest() answer for the files in it without a stat or a sidecar read per file (sidecars are only read to verify
+    hashes, or for files from before the journal was kept); files written through this output are added to the
+    snapshot, Forget() drops it.
+
+    With a store (a LiteroticaContentStore), files with the same content are hard links to one stored copy.
+    """
+
+    __shared = None
+    __sharedLock = threading.Lock()
+
+    def __init__(self, background=False, buffer_size=1024 * 1024, verify="size", max_pending=16, store=None):
+        # verify: "size" to check a file's size against its sidecar, "hash" to also re-hash its content
+        # max_pending: background writes queued before WriteText() blocks, bounding the text held in memory
+        # store: optional LiteroticaContentStore every file is deduplicated through
+        if verify not in ("size", "hash"):
+            raise ValueError("Unknown verify mode: {0}".format(verify))
+        self.Background = background
+        self.BufferSize = buffer_size
+        self.Verify = verify
+        self.Store = store
+
+        self.__pending = set()
+        self.__listings = {}  # directory -> set of the names in it
+        self.__checks = {}  # directory -> {name: (size, sha256)} from its journal and this output's writes
+        self.__errors = []
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__writer = ThreadPoolExecutor(max_workers=1) if background else None
+
+    @staticmethod
+    def Default():
+        # The synchronous output used wherever none was supplied
+        with DirectoryOutput.__sharedLock:
+            if DirectoryOutput.__shared is None:
+                DirectoryOutput.__shared = DirectoryOutput()
+            return DirectoryOutput.__shared
+
+    @staticmethod
+    def SidecarPath(path):
+        directory, name = os.path.split(path)
+        return os.path.join(directory, "." + name + ".check")
+
+    @staticmethod
+    def JournalPath(directory):
+        return os.path.join(directory, ".checks")
+
+    def Exists(self, path):
+        # True if path is complete: written by this output and matching its sidecar, or queued to be written.
+        # Files from before sidecars were kept are accepted if they aren't empty.
+        directory, name = os.path.split(path)
+        with self.__lock:
+            if path in self.__pending:
+                return True
+            listing = self.__listings.get(directory)
+            check = self.__checks.get(directory, {}).get(name)
+        if listing is not None:
+            if name not in listing:
+                return False
+            if check is not None:
+                # Files are only moved into place complete, and recorded after they are, so the listing and the
+                # journal are enough unless the content itself is to be verified
+                return self.Verify != "hash" or check[1] == DirectoryOutput.__HashFile(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if listing is not None and "." + name + ".check" not in listing:
+            return size > 0
+        try:
+            with open(DirectoryOutput.SidecarPath(path), "r", encoding="utf-8") as file:
+                check = json.load(file)
+        except FileNotFoundError:
+            return size > 0
+        except ValueError:
+            return False
+        if check.get("size") != size:
+            return False
+        if self.Verify == "hash":
+            return check.get("sha256") == DirectoryOutput.__HashFile(path)
+        return True
+
+    def Digest(self, path):
+        # The sha256 its sidecar records for path, or None if there is none or the file is still queued to be written
+        directory, name = os.path.split(path)
+        with self.__lock:
+            if path in self.__pending:
+                return None
+            check = self.__checks.get(directory, {}).get(name)
+        if check is not None:
+            return check[1]
+        try:
+            with open(DirectoryOutput.SidecarPath(path), "r", encoding="utf-8") as file:
+                return json.load(file).get("sha256")
+        except (OSError, ValueError):
+            return None
+
+    def Open(self, path):
+        # A text file to write path through, e.g.  with output.Open(path) as file: file.write(...)
+        # path only appears, with its sidecar, when the block exits without an exception.
+        return _AtomicTextFile(path, self.BufferSize, self.__Written, self.Store)
+
+    def WriteText(self, path, text):
+        self.__Write(path, text)
+
+    def WriteBytes(self, path, data):
+        # As WriteText, for binary data such as compressed raw pages
+        self.__Write(path, data)
+
+    def OpenRead(self, path):
+        return open(path, "r", encoding="utf-8")
+
+    def ReadText(self, path):
+        with self.OpenRead(path) as file:
+            return file.read()
+
+    def ReadBytes(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+    def MakeDirectory(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def MakeDirectories(self, paths):
+        # Creates those of paths which don't exist yet, with one scan of each parent rather than a stat per path
+        byParent = {}
+        for path in paths:
+            parent, name = os.path.split(os.path.normpath(path))
+            byParent.setdefault(parent, set()).add(name)
+        for parent, names in byParent.items():
+            os.makedirs(parent or ".", exist_ok=True)
+            with os.scandir(parent or ".") as entries:
+                existing = {entry.name for entry in entries if entry.is_dir()}
+            for name in names - existing:
+                os.makedirs(os.path.join(parent, name), exist_ok=True)
+
+    def Preload(self, directories):
+        # Snapshots each directory with one os.scandir, and loads its journal, for Exists() to answer from
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    listing = {entry.name for entry in entries}
+            except FileNotFoundError:
+                listing = set()
+            checks = _read_journal(directory) if ".checks" in listing else {}
+            with self.__lock:
+                self.__listings[directory] = listing
+                self.__checks[directory] = checks
+
+    def Forget(self, directories):
+        with self.__lock:
+            for directory in directories:
+                self.__listings.pop(directory, None)
+                self.__checks.pop(directory, None)
+
+    def Flush(self):
+        # Waits for queued background writes; raises the first error any of them hit
+        if self.__writer is not None:
+            self.__writer.submit(lambda: None).result()
+        self.__RaiseErrors()
+
+    def Close(self):
+        self.Flush()
+        if self.__writer is not None:
+            self.__writer.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+
+    def __Written(self, path, size, sha256):
+        # Called once path, its sidecar and its journal record are in place
+        directory, name = os.path.split(path)
+        with self.__lock:
+            listing = self.__listings.get(directory)
+            if listing is not None:
+                listing.update((name, "." + name + ".check", ".checks"))
+                self.__checks[directory][name] = (size, sha256)
+
+    def __Write(self, path, data):
+        if self.__writer is None:
+            self.__WriteNow(path, data)
+            return
+        self.__RaiseErrors()
+        self.__slots.acquire()
+        with self.__lock:
+            self.__pending.add(path)
+        self.__writer.submit(self.__WriteQueued, path, data)
+
+    def __WriteNow(self, path, data):
+        # data is text, or bytes written as they are
+        if self.Store is not None:
+            data = data if isinstance(data, bytes) else data.encode("utf-8")
+            key = self.Store.Key(data)
+            if self.Store.Contains(key):
+                # Content already stored: link to it rather than writing it again
+                _place_with_sidecar(path, len(data), key, lambda: self.Store.LinkExisting(key, path))
+                self.__Written(path, len(data), key)
+                return
+        with self.Open(path) as file:
+            if isinstance(data, bytes):
+                file.write_bytes(data)
+            else:
+                file.write(data)
+
+    def __WriteQueued(self, path, data):
+        try:
+            self.__WriteNow(path, data)
+        except Exception as e:
+            with self.__lock:
+                self.__errors.append(e)
+        finally:
+            with self.__lock:
+                self.__pending.discard(path)
+            self.__slots.release()
+
+    def __RaiseErrors(self):
+        with self.__lock:
+            errors, self.__errors = self.__errors, []
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def __HashFile(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+class _AtomicTextFile():
+    """Text writer for DirectoryOutput.Open: UTF-8 into a temp file, hashed on the way, moved into place on exit."""
+
+    def __init__(self, path, buffer_size, written, store=None):
+        self.Path = path
+        self.__written = written
+        self.__store = store
+        self.__tempPath = path + ".tmp%d" % threading.get_ident()
+        self.__file = open(self.__tempPath, "wb", buffering=buffer_size)
+        self.__digest = hashlib.sha256()
+        self.__size = 0
+
+    def write(self, text):
+        self.write_bytes(text.encode("utf-8"))
+        return len(text)
+
+    def write_bytes(self, data):
+        self.__digest.update(data)
+        self.__size += len(data)
+        self.__file.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__file.close()
+        if exc_type is not None:
+            os.remove(self.__tempPath)
+            return False
+
+        key = self.__digest.hexdigest()
+        if self.__store is None:
+            _place_with_sidecar(self.Path, self.__size, key, lambda: os.replace(self.__tempPath, self.Path))
+        else:
+            _place_with_sidecar(self.Path, self.__size, key, lambda: self.__store.Place(self.__tempPath, key, self.Path))
+        self.__written(self.Path, self.__size, key)
+        return False
+
+
+def _place_with_sidecar(path, size, sha256, place):
+    # Writes path's sidecar beside it and calls place() to put the file itself in place; the sidecar is only
+    # moved into place, and the directory's journal only records the file, after the file, so neither ever
+    # describes a file which isn't there yet
+    sidecar = DirectoryOutput.SidecarPath(path)
+    with open(sidecar + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({"size": size, "sha256": sha256}, file)
+    place()
+    os.replace(sidecar + ".tmp", sidecar)
+    directory, name = os.path.split(path)
+    with _journalLock, open(DirectoryOutput.JournalPath(directory), "a", encoding="utf-8") as journal:
+        journal.write(json.dumps([name, size, sha256]) + "\n")
+
+
+_journalLock = threading.Lock()
+
+
+def _read_journal(directory):
+    # {name: (size, sha256)} from directory's journal, the latest record of each name winning.  A journal which has
+    # grown to mostly superseded records is rewritten with just the latest ones.
+    checks, records = {}, 0
+    try:
+        with open(DirectoryOutput.JournalPath(directory), "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    name, size, sha256 = json.loads(line)
+                except (TypeError, ValueError):
+                    continue  # A record cut short by an interrupted run
+                checks[name] = (size, sha256)
+                records += 1
+    except FileNotFoundError:
+        return checks
+    if records > 2 * len(checks) + 64:
+        journalPath = DirectoryOutput.JournalPath(directory)
+        with _journalLock:
+            with open(journalPath + ".tmp", "w", encoding="utf-8") as journal:
+                for name, (size, sha256) in checks.items():
+                    journal.write(json.dumps([name, size, sha256]) + "\n")
+            os.replace(journalPath + ".tmp", journalPath)
+    return checks
+
+
+class ArchiveOutput():
+    """
+    Writes output files into one zip archive instead of a directory tree; e.g. a member's stories, series files
+    and CSV index, for filesystems where thousands of small files are slow.  Paths are the same filesystem paths
+    DirectoryOutput takes, stored relative to root.  The zip's central directory indexes every entry, so ReadText()
+    decompresses only the one entry asked for, and Exists() lets "already have it" checks look inside the archive.
+
+    Entries are written to a new archive beside the old one; Close() copies over the old entries which weren't
+    rewritten and moves the new archive into place, so the archive on disk is always complete.
+    Use it as  with ArchiveOutput(path, root) as output: ...
+    """
+
+    def __init__(self, archivePath, root, compression=zipfile.ZIP_DEFLATED, compresslevel=6, spool_size=8 * 1024 * 1024):
+        # root: the directory paths are taken relative to, normally the contentDirectory handed to the writers
+        # spool_size: bytes of an entry held in memory while it is written through Open(), before spilling to a temp file
+        self.ArchivePath = archivePath
+        self.Root = root
+        self.SpoolSize = spool_size
+
+        self.__lock = threading.Lock()
+        self.__previous = zipfile.ZipFile(archivePath, "r") if os.path.exists(archivePath) else None
+        self.__previousNames = set(self.__previous.namelist()) if self.__previous is not None else set()
+        self.__tempPath = archivePath + ".tmp"
+        self.__archive = zipfile.ZipFile(self.__tempPath, "w", compression=compression, compresslevel=compresslevel)
+        self.__written = set()
+
+    def Name(self, path):
+        # The archive entry name for path
+        return os.path.relpath(path, self.Root).replace(os.sep, "/")
+
+    def Names(self):
+        with self.__lock:
+            return sorted(self.__written | self.__previousNames)
+
+    def Exists(self, path):
+        name = self.Name(path)
+        with self.__lock:
+            return name in self.__written or name in self.__previousNames
+
+    def Digest(self, path):
+        # Archive entries have no sidecars
+        return None
+
+    def Open(self, path):
+        # A text file to write path through; the entry is added when the block exits without an exception.
+        # Several entries can be open at once, since each is spooled until it is complete.
+        return _ArchiveEntryFile(self, self.Name(path), self.SpoolSize)
+
+    def WriteText(self, path, text):
+        self.AddEntry(self.Name(path), io.BytesIO(text.encode("utf-8")))
+
+    def WriteBytes(self, path, data):
+        self.AddEntry(self.Name(path), io.BytesIO(data))
+
+    def AddEntry(self, name, source):
+        # Copies the binary file object source into the archive as name
+        with self.__lock:
+            with self.__archive.open(name, "w", force_zip64=True) as entry:
+                shutil.copyfileobj(source, entry, 1024 * 1024)
+            self.__written.add(name)
+
+    def OpenRead(self, path):
+        return io.TextIOWrapper(io.BytesIO(self.ReadBytes(path)), encoding="utf-8")
+
+    def ReadBytes(self, path):
+        # Raises FileNotFoundError for a path with no entry, as DirectoryOutput does
+        name = self.Name(path)
+        with self.__lock:
+            if name in self.__written:
+                return self.__archive.read(name)
+            if name not in self.__previousNames:
+                raise FileNotFoundError("No entry {0} in {1}".format(name, self.ArchivePath))
+            return self.__previous.read(name)
+
+    def ReadText(self, path):
+        with self.OpenRead(path) as file:
+            return file.read()
+
+    def MakeDirectory(self, path):
+        return
+
+    def MakeDirectories(self, paths):
+        return
+
+    def Preload(self, directories):
+        return
+
+    def Forget(self, directories):
+        return
+
+    def Flush(self):
+        return
+
+    def Close(self):
+        with self.__lock:
+            if self.__archive is None:
+                return
+            if self.__previous is not None:
+                for info in self.__previous.infolist():
+                    if info.filename in self.__written:
+                        continue
+                    with self.__previous.open(info) as source, self.__archive.open(info, "w", force_zip64=True) as entry:
+                        shutil.copyfileobj(source, entry, 1024 * 1024)
+                self.__previous.close()
+            self.__archive.close()
+            self.__archive = None
+            os.replace(self.__tempPath, self.ArchivePath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Entries finished before an error are kept, so a rerun can pick up from them
+        self.Close()
+
+
+class _ArchiveEntryFile():
+    """Text writer for ArchiveOutput.Open: spools UTF-8 until the entry is complete, then adds it to the archive."""
+
+    def __init__(self, output, name, spool_size):
+        self.Name = name
+        self.__output = output
+        self.__spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+
+    def write(self, text):
+        self.__spool.write(text.encode("utf-8"))
+        return len(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.__spool.seek(0)
+                self.__output.AddEntry(self.Name, self.__spool)
+        finally:
+            self.__spool.close()
+        return False
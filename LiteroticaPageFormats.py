@@ -0,0 +1,78 @@
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+
+# One layout of the site's story pages.
+# Name: the layout version, e.g. "2023-06".  Marker: a byte pattern only pages in this layout contain, checked before
+# anything is parsed.  ContentClass: the class of the story body <div>.  PageNumbers: a byte pattern whose group
+# captures the page numbers shown in the pager (or the page count, for layouts which show one).
+PageFormat = namedtuple("PageFormat", ["Name", "Marker", "ContentClass", "PageNumbers"])
+
+
+class UnrecognisedPageError(ValueError):
+    """A page no registered PageFormat matches, or whose story body isn't where its format says."""
+
+    def __init__(self, reason, url=None, page=None):
+        super().__init__("{0}{1}: {2}".format(url or "page", "" if page is None else " page {0:d}".format(page), reason))
+        self.Reason = reason
+        self.URL = url
+        self.Page = page
+
+
+# Registered formats, newest first; sniff_page_format tries them in this order
+_page_formats = []
+
+def register_page_format(pageFormat):
+    # Adds a layout, or replaces the one of the same name.  The most recently registered is tried first,
+    # so a parser for a new layout only has to be registered to take over from the old ones.
+    # Formats registered at run time aren't known to spawned parse processes, which only see the ones below.
+    _page_formats[:] = [registered for registered in _page_formats if registered.Name != pageFormat.Name]
+    _page_formats.insert(0, pageFormat)
+
+def unregister_page_format(name):
+    _page_formats[:] = [registered for registered in _page_formats if registered.Name != name]
+
+def page_formats():
+    return list(_page_formats)
+
+def page_format(name):
+    for registered in _page_formats:
+        if registered.Name == name:
+            return registered
+    raise KeyError(name)
+
+def sniff_page_format(html):
+    # The PageFormat of a raw page (bytes or str), found with a byte scan rather than a parse; None if none matches
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    for registered in _page_formats:
+        if registered.Marker.search(html):
+            return registered
+    return None
+
+def page_count(html, pageFormat):
+    # Number of pages of the story, from its first page's pager; 1 if there is no pager
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    page_numbers = [int(n) for n in pageFormat.PageNumbers.findall(html)]
+    return max(page_numbers) if page_numbers else 1
+
+@lru_cache(maxsize=None)
+def content_xpath(contentClass):
+    # Compiled XPath for the story body <div> with class contentClass
+    from lxml import etree
+    return etree.XPath("//div[contains(concat(' ', normalize-space(@class), ' '), ' {0} ')]".format(contentClass))
+
+
+# The layout used until 2023: body in "b-story-body-x x-r15", "N Pages:" in the "b-pager-caption-t r-d45" caption
+register_page_format(PageFormat("pre-2023",
+                                re.compile(rb'class="[^"]*\bb-story-body-x\b'),
+                                "b-story-body-x",
+                                re.compile(rb'class="[^"]*\bb-pager-caption-t\b[^"]*"[^>]*>.{0,200}?(\d+) Pages:', re.DOTALL)))
+
+# The layout current as of 2023-06-23: body in "aa_ht", pager links like <a class="l_bJ" href="...?page=3">3</a>
+register_page_format(PageFormat("2023-06",
+                                re.compile(rb'class="[^"]*\baa_ht\b'),
+                                "aa_ht",
+                                re.compile(rb'<a\b[^>]*\bclass="[^"]*\bl_bJ\b[^"]*"[^>]*>\s*(\d+)\s*</a>')))
@@ -0,0 +1,134 @@
+from collections import namedtuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# A cached response.  FetchedAt is when the body was last confirmed current with the server.
+CachedResponse = namedtuple("CachedResponse", ["URL", "Body", "ETag", "LastModified", "FetchedAt"])
+
+
+class LiteroticaResponseCache():
+    """
+    On-disk cache of fetched pages, keyed by URL.
+    Bodies are stored zlib-compressed under the sha256 of their content, so identical pages are stored once.
+    An sqlite index tracks each URL's validators and last use, for TTL expiry and least-recently-used eviction.
+    """
+
+    __indexFileName = "index.sqlite3"
+
+    def __init__(self, directory, ttl=24 * 3600, max_bytes=512 * 1024 * 1024, compression_level=6):
+        # ttl: seconds a response is served without revalidation (None: forever, 0: always revalidate)
+        # max_bytes: cap on the total compressed size of stored bodies
+        self.Directory = directory
+        self.TTL = ttl
+        self.MaxBytes = max_bytes
+        self.CompressionLevel = compression_level
+
+        os.makedirs(directory, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(os.path.join(directory, self.__indexFileName), check_same_thread=False)
+        with self.__db:
+            self.__db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    url TEXT PRIMARY KEY, digest TEXT NOT NULL, etag TEXT, last_modified TEXT,
+                                    fetched_at REAL NOT NULL, last_used REAL NOT NULL)""")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+
+    def Get(self, url):
+        # Returns a CachedResponse, fresh or not, or None if url isn't cached
+        with self.__lock:
+            row = self.__db.execute("SELECT digest, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                                    (url,)).fetchone()
+            if row is None:
+                return None
+            digest, etag, last_modified, fetched_at = row
+            try:
+                with open(self.__BlobPath(digest), "rb") as file:
+                    body = zlib.decompress(file.read())
+            except (OSError, zlib.error):
+                # Blob lost or damaged; forget the entry so it gets fetched again
+                self.__DeleteEntry(url, digest)
+                self.__db.commit()
+                return None
+            with self.__db:
+                self.__db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+        return CachedResponse(url, body, etag, last_modified, fetched_at)
+
+    def IsFresh(self, response):
+        if self.TTL is None:
+            return True
+        return time.time() - response.FetchedAt < self.TTL
+
+    def Put(self, url, body, etag=None, last_modified=None):
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self.__BlobPath(digest)
+        now = time.time()
+
+        with self.__lock:
+            if not os.path.exists(blob_path):
+                compressed = zlib.compress(body, self.CompressionLevel)
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                temp_path = blob_path + ".tmp%d" % threading.get_ident()
+                with open(temp_path, "wb") as file:
+                    file.write(compressed)
+                os.replace(temp_path, blob_path)
+                with self.__db:
+                    self.__db.execute("INSERT OR REPLACE INTO blobs (digest, size) VALUES (?, ?)", (digest, len(compressed)))
+
+            previous = self.__db.execute("SELECT digest FROM responses WHERE url = ?", (url,)).fetchone()
+            with self.__db:
+                self.__db.execute("""INSERT OR REPLACE INTO responses (url, digest, etag, last_modified, fetched_at, last_used)
+                                     VALUES (?, ?, ?, ?, ?, ?)""", (url, digest, etag, last_modified, now, now))
+                if previous is not None and previous[0] != digest:
+                    self.__DeleteBlobIfUnused(previous[0])
+            self.__Evict()
+
+    def MarkRevalidated(self, url):
+        # The server confirmed the cached body is still current (304 Not Modified)
+        with self.__lock, self.__db:
+            now = time.time()
+            self.__db.execute("UPDATE responses SET fetched_at = ?, last_used = ? WHERE url = ?", (now, now, url))
+
+    def Size(self):
+        with self.__lock:
+            return self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def Close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def __Evict(self):
+        # Drops least recently used responses until the stored bodies fit in MaxBytes
+        total = self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.MaxBytes:
+            return
+        with self.__db:
+            for url, digest in self.__db.execute("SELECT url, digest FROM responses ORDER BY last_used").fetchall():
+                self.__DeleteEntry(url, digest)
+                total = self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+                if total <= self.MaxBytes:
+                    break
+
+    def __DeleteEntry(self, url, digest):
+        self.__db.execute("DELETE FROM responses WHERE url = ?", (url,))
+        self.__DeleteBlobIfUnused(digest)
+
+    def __DeleteBlobIfUnused(self, digest):
+        if self.__db.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None:
+            return
+        self.__db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        try:
+            os.remove(self.__BlobPath(digest))
+        except FileNotFoundError:
+            pass
+
+    def __BlobPath(self, digest):
+        return os.path.join(self.Directory, digest[:2], digest[2:] + ".z")
@@ -0,0 +1,222 @@
+from collections import namedtuple
+from itertools import islice
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+# A story matching a search.  Score is higher for better matches; Matches is the number of its paragraphs which match.
+StoryHit = namedtuple("StoryHit", ["URL", "Title", "MemberID", "MemberName", "SeriesTitle", "Category", "Score", "Matches"])
+
+# A paragraph matching a search.  Paragraph is its position in the story from 0; Snippet the matching text, marked up.
+ParagraphHit = namedtuple("ParagraphHit", ["URL", "Title", "MemberID", "SeriesTitle", "Paragraph", "Snippet", "Score"])
+
+
+class LiteroticaSearchIndex():
+    """
+    Full-text index of downloaded stories, one SQLite FTS5 row per paragraph, with each story's member, series and
+    category alongside for filtering.  Hand it to a LiteroticaMemberPage as search_index and every story written is
+    indexed as it goes.
+
+    Add() only queues a story; queued stories are written batch_size at a time, or once batch_bytes of text is
+    queued, each batch in one transaction, so indexing costs the download pipeline little.  AddFile() indexes a
+    story which is only on disk, reading it in chunks rather than whole.  A story is keyed by URL and re-indexed
+    only when its text has changed, judged by the sha256 of its text: the hash the output sidecars record, so a
+    story already indexed isn't even read.  Search() ranks stories, SearchParagraphs() single paragraphs; queries
+    use the FTS5 syntax, e.g. "lighthouse keeper", '"exact phrase"' or 'storm NOT rain'.
+    """
+
+    # Paragraph rowids are story id << __paragraphBits | paragraph number, so a story's rows are one rowid range
+    __paragraphBits = 20
+
+    # Characters read at a time by AddFile
+    __chunkSize = 64 * 1024
+
+    def __init__(self, path, batch_size=50, batch_bytes=8 * 1024 * 1024):
+        self.Path = path
+        self.BatchSize = batch_size
+        self.BatchBytes = batch_bytes
+
+        self.__lock = threading.Lock()
+        self.__pending = []  # (story fields, text, digest or None) waiting to be written
+        self.__pendingBytes = 0
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        with self.__db:
+            self.__db.execute("""CREATE TABLE IF NOT EXISTS stories (
+                                    id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, member_id INTEGER, title TEXT,
+                                    series TEXT, category TEXT, digest TEXT NOT NULL, paragraph_count INTEGER NOT NULL,
+                                    indexed_at REAL NOT NULL)""")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS stories_member ON stories (member_id)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS members (member_id INTEGER PRIMARY KEY, name TEXT)")
+            self.__db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS paragraphs USING fts5(text, tokenize = 'porter unicode61')")
+
+    def AddMember(self, memberID, memberName):
+        with self.__lock, self.__db:
+            self.__db.execute("INSERT OR REPLACE INTO members (member_id, name) VALUES (?, ?)", (memberID, memberName))
+
+    def Add(self, story, plainText=None, digest=None):
+        # Queues a LiteroticaStoryPage for indexing, with plainText in place of its PlainText if given.
+        # digest: the sha256 of the text as UTF-8, if already known
+        plainText = plainText if plainText is not None else story.PlainText
+        with self.__lock:
+            self.__pending.append((self.__Fields(story), plainText, digest))
+            self.__pendingBytes += len(plainText)
+            if len(self.__pending) >= self.BatchSize or self.__pendingBytes >= self.BatchBytes:
+                self.__WritePending()
+
+    def AddFile(self, story, path, output, digest=None):
+        # Indexes a story whose text is only on disk, e.g. one streamed there, at path read through output.
+        # digest: the sha256 of the file, e.g. from its sidecar; if the index already has it the file isn't read.
+        fields = self.__Fields(story)
+        with self.__lock:
+            self.__WritePending()
+            if digest is None:
+                digest = self.__HashFile(path, output)
+            with self.__db:
+                self.__WriteStory(fields, digest, lambda: self.__ReadParagraphs(path, output), time.time())
+
+    def Digest(self, url):
+        # The digest of the text indexed for url, or None
+        with self.__lock:
+            row = self.__db.execute("SELECT digest FROM stories WHERE url = ?", (url,)).fetchone()
+        return row[0] if row is not None else None
+
+    def Remove(self, url):
+        with self.__lock:
+            self.__WritePending()
+            with self.__db:
+                row = self.__db.execute("SELECT id FROM stories WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    self.__DeleteParagraphs(row[0])
+                    self.__db.execute("DELETE FROM stories WHERE id = ?", (row[0],))
+
+    def Flush(self):
+        # Writes the stories still queued
+        with self.__lock:
+            self.__WritePending()
+
+    # FTS5's ranking functions only work in the query doing the MATCH, so each search ranks the matching paragraphs in a
+    # materialised CTE first and filters and groups them after
+
+    def Search(self, query, limit=20, memberID=None, seriesTitle=None, category=None):
+        # StoryHits for the stories with paragraphs matching query, best first
+        where, parameters = self.__Filters(memberID, seriesTitle, category)
+        with self.__lock:
+            self.__WritePending()
+            rows = self.__db.execute("""WITH hit AS MATERIALIZED (SELECT rowid >> {0:d} AS story_id, -bm25(paragraphs) AS score
+                                                              FROM paragraphs WHERE paragraphs MATCH ?)
+                                        SELECT s.url, s.title, s.member_id, m.name, s.series, s.category, SUM(hit.score) AS total, COUNT(*)
+                                        FROM hit JOIN stories s ON s.id = hit.story_id
+                                        LEFT JOIN members m ON m.member_id = s.member_id
+                                        WHERE {1}
+                                        GROUP BY s.id ORDER BY total DESC LIMIT ?""".format(self.__paragraphBits, where),
+                                     [query] + parameters + [limit]).fetchall()
+        return [StoryHit(*row) for row in rows]
+
+    def SearchParagraphs(self, query, limit=20, memberID=None, seriesTitle=None, category=None, mark=("[", "]"), words=16):
+        # ParagraphHits for the best matching paragraphs; each Snippet is up to words words around the match,
+        # with the matching terms between the two strings of mark
+        where, parameters = self.__Filters(memberID, seriesTitle, category)
+        with self.__lock:
+            self.__WritePending()
+            rows = self.__db.execute("""WITH hit AS MATERIALIZED (SELECT rowid >> {0:d} AS story_id, rowid & {1:d} AS paragraph,
+                                                                     snippet(paragraphs, 0, ?, ?, '...', ?) AS snippet,
+                                                                     -bm25(paragraphs) AS score
+                                                              FROM paragraphs WHERE paragraphs MATCH ?)
+                                        SELECT s.url, s.title, s.member_id, s.series, hit.paragraph, hit.snippet, hit.score
+                                        FROM hit JOIN stories s ON s.id = hit.story_id
+                                        WHERE {2}
+                                        ORDER BY hit.score DESC LIMIT ?""".format(self.__paragraphBits, (1 << self.__paragraphBits) - 1, where),
+                                     [mark[0], mark[1], words, query] + parameters + [limit]).fetchall()
+        return [ParagraphHit(*row) for row in rows]
+
+    def __len__(self):
+        # Number of stories indexed, including those still queued
+        with self.__lock:
+            self.__WritePending()
+            return self.__db.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def Close(self):
+        with self.__lock:
+            self.__WritePending()
+            self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+
+    @staticmethod
+    def __Filters(memberID, seriesTitle, category):
+        where, parameters = ["1"], []
+        for column, value in (("s.member_id", memberID), ("s.series", seriesTitle), ("s.category", category)):
+            if value is not None:
+                where.append(column + " = ?")
+                parameters.append(value)
+        return " AND ".join(where), parameters
+
+    @staticmethod
+    def __Fields(story):
+        seriesTitle = story.SeriesTitle.split(":")[0].strip() if story.SeriesTitle else None  # As in the CSV
+        return (story.URL, story.MemberID, story.Title, seriesTitle, story.Category)
+
+    @staticmethod
+    def __Paragraphs(text):
+        return (paragraph for paragraph in text.split("\n\n") if paragraph.strip())
+
+    def __ReadParagraphs(self, path, output):
+        # The paragraphs of a text file, read a chunk at a time
+        remainder = ""
+        with output.OpenRead(path) as file:
+            for chunk in iter(lambda: file.read(self.__chunkSize), ""):
+                *paragraphs, remainder = (remainder + chunk).split("\n\n")
+                yield from (paragraph for paragraph in paragraphs if paragraph.strip())
+        if remainder.strip():
+            yield remainder
+
+    def __HashFile(self, path, output):
+        digest = hashlib.sha256()
+        with output.OpenRead(path) as file:
+            for chunk in iter(lambda: file.read(self.__chunkSize), ""):
+                digest.update(chunk.encode("utf-8"))
+        return digest.hexdigest()
+
+    def __WritePending(self):
+        # One transaction for everything queued
+        if not self.__pending:
+            return
+        pending, self.__pending, self.__pendingBytes = self.__pending, [], 0
+        now = time.time()
+        with self.__db:
+            for fields, text, digest in pending:
+                if digest is None:
+                    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                self.__WriteStory(fields, digest, lambda: self.__Paragraphs(text), now)
+
+    def __WriteStory(self, fields, digest, paragraphs, now):
+        # Records a story's fields; its paragraphs, from the callable paragraphs, are only read and indexed
+        # if digest differs from the one indexed.  Runs inside the caller's transaction.
+        url, memberID, title, seriesTitle, category = fields
+        row = self.__db.execute("SELECT id, digest FROM stories WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            storyID = self.__db.execute("""INSERT INTO stories (url, member_id, title, series, category, digest, paragraph_count, indexed_at)
+                                           VALUES (?, ?, ?, ?, ?, ?, 0, ?)""",
+                                        (url, memberID, title, seriesTitle, category, digest, now)).lastrowid
+        else:
+            storyID = row[0]
+            self.__db.execute("UPDATE stories SET member_id = ?, title = ?, series = ?, category = ?, digest = ?, indexed_at = ? WHERE id = ?",
+                              (memberID, title, seriesTitle, category, digest, now, storyID))
+            if row[1] == digest:
+                return
+            self.__DeleteParagraphs(storyID)
+        first = storyID << self.__paragraphBits
+        rows = enumerate(islice(paragraphs(), 1 << self.__paragraphBits))
+        self.__db.executemany("INSERT INTO paragraphs (rowid, text) VALUES (?, ?)", ((first + i, paragraph) for i, paragraph in rows))
+        self.__db.execute("UPDATE stories SET paragraph_count = (SELECT COUNT(*) FROM paragraphs WHERE rowid >= ? AND rowid < ?) WHERE id = ?",
+                          (first, first + (1 << self.__paragraphBits), storyID))
+
+    def __DeleteParagraphs(self, storyID):
+        first = storyID << self.__paragraphBits
+        self.__db.execute("DELETE FROM paragraphs WHERE rowid >= ? AND rowid < ?", (first, first + (1 << self.__paragraphBits)))
@@ -1,73 +1,287 @@
-from bs4 import BeautifulSoup
-from bs4 import NavigableString
-from urllib import request
-import requests as requestslib
+# lxml and asyncio are imported where they are first needed, which keeps importing this module cheap
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+from LiteroticaFetcher import LiteroticaFetcher, PageFetchError
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaPageFormats import UnrecognisedPageError, content_xpath, page_count, sniff_page_format
+from LiteroticaInstrumentation import NO_INSTRUMENTATION
+from LiteroticaOutput import DirectoryOutput
+import gzip
+import hashlib
 import os
 import sys
 import logging
+import zlib
+
+
+# Inline tags which are rewritten as their Markdown equivalents in the plaintext output
+INLINE_MARKDOWN = {
+                    'b': '**',
+                    'strong': '**',
+                    'em': '*',
+                    'i': '*'
+                    }
+PUNCTUATION = {',', '.', ';', ':', '!', '?'}
+
+
+def parse_html_document(html_text):
+    # Parses html_text (str or utf-8 bytes) with lxml, returning the root <html> element
+    import lxml.html
+    if isinstance(html_text, bytes):
+        html_text = html_text.decode("utf-8", errors="replace")
+    if not html_text.strip():
+        html_text = "<html></html>"
+    return lxml.html.document_fromstring(html_text)
+
+
+def markdown_inline_tags(root):
+    # Rewrites the INLINE_MARKDOWN tags under root (an lxml element) as Markdown text, in place.
+    # Tags are visited once each, innermost first and in document order, so earlier siblings have already been
+    # rewritten by the time their neighbours are.  Only the short runs of text around each tag are touched, which
+    # keeps this linear in the size of the document.
+    from lxml import etree
+    matches = [match for _, match in etree.iterwalk(root, events=("end",), tag=tuple(INLINE_MARKDOWN))]
+
+    for match in matches:
+        text = ''.join(match.itertext())  # Nested inline tags have already been rewritten
+        for child in list(match):
+            match.remove(child)
+
+        if text.strip() == '' or text in PUNCTUATION:
+            match.text = text
+            continue
+
+        previous = match.getprevious()
+        parent = match.getparent()
+        has_before = previous is not None or bool(parent.text)
+        has_after = match.getnext() is not None or bool(match.tail)
+        tail = match.tail or ''
+
+        # Punctuation at start of next sibling: Move to inside of tag
+        if tail and tail[0] in PUNCTUATION:
+            text += tail[0]
+            tail = tail[1:]
+
+        # Whitespace at end of inline tag: Move to next sibling, or drop it at the end of the parent
+        stripped = text.rstrip()
+        if len(stripped) < len(text):
+            if has_after:
+                tail = text[len(stripped):] + tail
+            text = stripped
+
+        # Punctuation at beginning of inline tag: Move to previous sibling
+        before = ''
+        if has_before and text[0] in PUNCTUATION:
+            before = text[0]
+            text = text[1:]
+
+        # Whitespace at beginning of inline tag: Move to previous sibling, or drop it at the start of the parent
+        stripped = text.lstrip()
+        if len(stripped) < len(text):
+            if has_before:
+                before += text[:len(text) - len(stripped)]
+            text = stripped
+
+        if before:
+            if previous is not None:
+                previous.tail = (previous.tail or '') + before
+            else:
+                parent.text = (parent.text or '') + before
+
+        match.tail = tail
+        match.text = INLINE_MARKDOWN[match.tag] + text + INLINE_MARKDOWN[match.tag] if text else ''
+
+    # Unwrap the rewritten tags, merging their text into the surrounding text
+    etree.strip_tags(root, *INLINE_MARKDOWN)
+    return root
 
 
 def convert_inline_tags_to_markdown(html_text):
     # input: html_text which can be soupified
-    # output: html_text which can be soupified, but where the tags_to_replace have been replaced with Markdown equivalents
-
-    tags_to_replace = {
-                        'b': '**',
-                        'strong': '**',
-                        'em': '*',
-                        'i': '*'
-                        }
-    punctuation = {',', '.', ';', ':', '!', '?'}
-    soup = BeautifulSoup(html_text, features="lxml")
-
-    # Replace tags with markdown equivalents
-    for tag, replacement in tags_to_replace.items():
-        for match in soup.find_all(tag):
-            if match.string is None:
-                match.replace_with("")
-                continue
-            if len(match.string.strip()) == 0:
-                match.replace_with(match.string)
-                continue
-            if match.string in punctuation:
-                match.replace_with(match.string)
-                continue
-
-            next_sibling = match.next_sibling
-            prev_sibling = match.previous_sibling
-
-            # Punctuation at start of next sibling: Move to inside of tag
-            # Whitespace at end of inline tag: Move to next sibling
-            # Punctuation at beginning of inline tag: Move to previous sibling
-            # Whitespace at beginning of inline tag: Move to previous sibling
-
-            # If there is punctuation at the start of the next sibling string, move it inside the inline tag
-            if isinstance(next_sibling, NavigableString) and len(next_sibling) > 0 and next_sibling[0] in punctuation:
-                match.string += next_sibling[0]
-                match.next_sibling.replace_with(next_sibling[1:])
-
-            # If there is trailing whitespace, move it to the next sibling if there is one:
-            rstrip_len = len(match.string.rstrip())
-            if len(match.string) > rstrip_len:
-                if isinstance(next_sibling, NavigableString) and len(next_sibling) > 0:
-                    match.next_sibling.replace_with(match.string[rstrip_len:] + match.next_sibling)
-                match.string = match.string[:rstrip_len]
-
-            # If there is a punctuation at the start of the inline tag, move it to the previous sibling
-            if isinstance(prev_sibling, NavigableString) and len(prev_sibling) > 0 and match.string[0] in punctuation:
-                match.previous_sibling.replace_with(match.previous_sibling + match.string[0])
-                match.string = match.string[1:]
-
-            # If there is leading whitespace, move it to the previous sibling if there is one:
-            len_leading_whitespace = len(match.string) - len(match.string.lstrip())
-            if len_leading_whitespace > 0:
-                if isinstance(prev_sibling, NavigableString) and len(prev_sibling) > 0:
-                    match.previous_sibling.replace_with(match.previous_sibling + match.string[:len_leading_whitespace])
-                match.string = match.string[len_leading_whitespace:]
-
-            match.replace_with(replacement + match.get_text() + replacement)
-            
-    return str(soup)
+    # output: html_text which can be soupified, but where the INLINE_MARKDOWN tags have been replaced with Markdown equivalents
+    import lxml.html
+    root = markdown_inline_tags(parse_html_document(html_text))
+    return lxml.html.tostring(root, encoding="unicode")
+
+
+def story_page_format(html):
+    # The registered PageFormat of a raw story page, picked by a byte scan before anything is parsed
+    pageFormat = sniff_page_format(html)
+    if pageFormat is None:
+        raise UnrecognisedPageError("no registered page format matches")
+    return pageFormat
+
+def story_content(root, pageFormat):
+    # The story body element of a parsed page
+    matches = content_xpath(pageFormat.ContentClass)(root)
+    if not matches:
+        raise UnrecognisedPageError("no {0} story body in a {1} page".format(pageFormat.ContentClass, pageFormat.Name))
+    return matches[0]
+
+# One page of a story, extracted from a single parse:
+# Html is the serialised story <div> (as it appears in Text), Paragraphs its Markdown-cleaned paragraph texts.
+StoryPageContent = namedtuple("StoryPageContent", ["Html", "Paragraphs"])
+
+# Stage timer factory for the functions below when no instrumentation is wanted; see LiteroticaInstrumentation.Stage
+_no_stage = NO_INSTRUMENTATION.Stage
+
+def extract_page_content(root, pageFormat, stage=_no_stage):
+    # Builds a StoryPageContent from a parsed page; the story element is serialised before being rewritten
+    import lxml.html
+    content = story_content(root, pageFormat)
+    html = lxml.html.tostring(content, encoding="unicode", with_tail=False)
+
+    with stage("markdown"):
+        markdown_inline_tags(content)
+        paragraphs = [txt for p in content.iter('p') if (txt:=p.text_content().strip()) != '']
+    return StoryPageContent(html, paragraphs)
+
+def parse_story_page(html, stage=_no_stage):
+    # Parses one page with the parser of whichever registered format it is in
+    pageFormat = story_page_format(html)
+    with stage("parse"):
+        root = parse_html_document(html)
+    return extract_page_content(root, pageFormat, stage)
+
+def story_fingerprint(html):
+    # What identifies a story's content in its first page: the page count and the page's paragraphs, leaving out
+    # the ads, tokens and counters around them which change with every request.  None if the page is in no known layout.
+    pageFormat = sniff_page_format(html)
+    if pageFormat is None:
+        return None
+    try:
+        content = extract_page_content(parse_html_document(html), pageFormat)
+    except UnrecognisedPageError:
+        return None
+    digest = hashlib.sha256(b"%d\n" % page_count(html, pageFormat))
+    for paragraph in content.Paragraphs:
+        digest.update(paragraph.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+def render_text(page_contents):
+    return ''.join([page.Html + "\r\n" for page in page_contents])
+
+def render_plaintext(page_contents):
+    return '\n\n'.join([paragraph for page in page_contents for paragraph in page.Paragraphs])
+
+def parse_story_pages(pages):
+    # pages: raw HTML of each page, in order.  Returns (Text, PlainText), parsing each page exactly once.
+    # Module-level so that it can be shipped to a worker process.
+    page_contents = [parse_story_page(html) for html in pages]
+    return render_text(page_contents), render_plaintext(page_contents)
+
+def raw_page_frame(html):
+    # One page in a raw pages file: its length in bytes on a line, then the page as fetched
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    return b"%d\n" % len(html) + html
+
+def raw_pages_compressor():
+    # Compresses the frames of a raw pages file as they come, into gzip format
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+def pack_raw_pages(pages):
+    return gzip.compress(b"".join(raw_page_frame(html) for html in pages))
+
+def unpack_raw_pages(data):
+    # The pages of a raw pages file, in order
+    data = gzip.decompress(data)
+    pages = []
+    position = 0
+    while position < len(data):
+        newline = data.index(b"\n", position)
+        end = newline + 1 + int(data[position:newline])
+        pages.append(data[newline + 1:end])
+        position = end
+    return pages
+
+def reparse_raw_pages(data):
+    # (Text, PlainText) from a raw pages file; module-level so that it can be shipped to a worker process
+    return parse_story_pages(unpack_raw_pages(data))
+
+# Inline tags kept when a story page is rendered as XHTML, e.g. for an EPUB chapter
+XHTML_INLINE_TAGS = ('b', 'strong', 'em', 'i', 'br')
+
+def story_page_xhtml(html, stage=_no_stage):
+    # The non-empty paragraphs of one story page as well-formed XHTML <p> strings (without a namespace, for
+    # embedding in an XHTML document), keeping inline emphasis but dropping every other tag and all attributes
+    pageFormat = story_page_format(html)
+    with stage("parse"):
+        root = parse_html_document(html)
+    return content_xhtml(story_content(root, pageFormat))
+
+def story_text_xhtml(text, stage=_no_stage):
+    # As story_page_xhtml, for a whole story's Text (every page's story <div>, as written to its .html file)
+    pageFormat = story_page_format(text)
+    with stage("parse"):
+        root = parse_html_document(text)
+    contents = content_xpath(pageFormat.ContentClass)(root)
+    if not contents:
+        raise UnrecognisedPageError("no {0} story body in the story text".format(pageFormat.ContentClass))
+    return [paragraph for content in contents for paragraph in content_xhtml(content)]
+
+def content_xhtml(content):
+    # The paragraphs of a story body element, as story_page_xhtml returns them; the element is rewritten in place
+    from lxml import etree
+    paragraphs = []
+    for p in list(content.iter('p')):
+        if p.getparent() is None or p.text_content().strip() == '':
+            continue  # Empty, or a nested paragraph already merged into its parent
+        etree.strip_elements(p, etree.Comment, etree.ProcessingInstruction, 'script', 'style', with_tail=False)
+        etree.strip_tags(p, *{e.tag for e in p.iterdescendants() if e.tag not in XHTML_INLINE_TAGS})
+        for element in p.iter():
+            element.attrib.clear()
+        p.tail = None
+        paragraphs.append(etree.tostring(p, method="xml", encoding="unicode"))
+    return paragraphs
+
+class StoryDownloadError(Exception):
+    """
+    A story whose download stopped at Page (of PageCount, if known) after Attempts tries.
+    PagesSaved pages are in the story's checkpoint, so the next attempt starts from the first of the rest.
+    """
+
+    def __init__(self, url, page, pageCount, pagesSaved, attempts, cause):
+        super().__init__("{0}: page {1:d} of {2} failed after {3:d} attempt{4}, {5:d} pages saved: {6}".format(
+            url, page, pageCount or "?", attempts, "" if attempts == 1 else "s", pagesSaved, cause))
+        self.URL = url
+        self.Page = page
+        self.PageCount = pageCount
+        self.PagesSaved = pagesSaved
+        self.Attempts = attempts
+        self.Cause = cause
+
+    def AsDict(self):
+        return {"url": self.URL, "page": self.Page, "page_count": self.PageCount, "pages_saved": self.PagesSaved,
+                "attempts": self.Attempts, "error": str(self.Cause)}
+
+
+class LiteroticaStoryListing():
+    """
+    One story row from a member page: plain str metadata only, with no reference back into the parsed page.
+    Promote() turns it into a LiteroticaStoryPage when the story is to be downloaded.
+    """
+
+    __slots__ = ("URL", "FileName", "MemberID", "Title", "Category", "SecondaryLine", "Date", "Rating", "SeriesTitle")
+
+    def __init__(self):
+        for field in LiteroticaStoryListing.__slots__:
+            setattr(self, field, None)
+        self.MemberID = 0
+
+    def Promote(self, fetcher=None, checkpoint=None):
+        storyPage = LiteroticaStoryPage(fetcher=fetcher, checkpoint=checkpoint)
+        for field in LiteroticaStoryListing.__slots__:
+            setattr(storyPage, field, getattr(self, field))
+        return storyPage
+
+    def RelativePath(self):
+        # text Path for insertion into the summary page written to HTML
+        return "../storyPages/" + self.FileName
+
+    def __repr__(self):
+        return "LiteroticaStoryListing({0!r}, {1!r})".format(self.URL, self.Title)
+
 
 class LiteroticaStoryPage():
     """Literotica Story Page"""
@@ -78,13 +292,19 @@ class LiteroticaStoryPage():
 
     __saveFooter = """</body>\r\n</html>"""
 
-    def __init__(self):
+    def __init__(self, fetcher=None, checkpoint=None):
+        # checkpoint: the LiteroticaCheckpoint the pages fetched so far are kept in; by default one in memory for this story
+        self.Fetcher = fetcher if fetcher is not None else LiteroticaFetcher.Shared()
+        self.Checkpoint = checkpoint
+
         self.Title = None
         self.MemberID = 0
         self.FileName = None
         self.URL = None
         self.Category = None
         self.SecondaryLine = None
+        self.Date = None
+        self.SeriesTitle = None
         self.Text = None  # Concatenated HTML blocks of the story pages
         self.PlainText = None  # Raw text, separated with newlines
         self.Rating = None
@@ -96,94 +316,301 @@ class LiteroticaStoryPage():
         self.__isDownloaded = False
         self.__isParsed = False
         self.__PageCount = 0
+        self.__memoryCheckpoint = None
 
-    @staticmethod
-    def clean_plaintext(html_text):   
-        html_text = convert_inline_tags_to_markdown(html_text)  # Clean italics and bold
-        soup = BeautifulSoup(html_text, features="lxml")
+        self.KeepRaw = False  # Keep the pages as fetched, compressed, and write them beside the story files
+        self.RawPages = None  # The pages of the last download as a raw pages file, when KeepRaw, until written
+
+    def PageCount(self):
+        # Number of pages found by the last download; 0 if the story hasn't been downloaded
+        return self.__PageCount
 
-        paragraphs = soup.find_all('p')
-        paragraph_texts = [txt for p in paragraphs if (txt:=p.get_text().strip()) != '']
+    @staticmethod
+    def clean_plaintext(html_text, stage=_no_stage):
+        # Parsed once; italics and bold are cleaned in the same tree the paragraphs are read from
+        with stage("parse"):
+            root = parse_html_document(html_text)
+
+        with stage("markdown"):
+            markdown_inline_tags(root)
+            paragraph_texts = [txt for p in root.iter('p') if (txt:=p.text_content().strip()) != '']
         return '\n\n'.join(paragraph_texts)
+
+    def __Stage(self, name):
+        return self.Fetcher.Instrumentation.Stage(name, url=self.URL, member=self.MemberID)
     
     def DownloadAllPages(self):
-        urlStream = request.urlopen(self.URL+"?page=1")
-        html = urlStream.read()
-        soup = BeautifulSoup(html, features="lxml")
+        # Older entry point for the pre-2023 layout.  The layout of each page is now detected, so this is
+        # DownloadAllPagesNewFormat, returning False rather than raising when a page is in no known layout.
         try:
-            pageblock = soup.findAll("span",attrs={"class" :"b-pager-caption-t r-d45"})
-            self.__PageCount = int(pageblock[0].contents[1].replace(" Pages:",""))
-        except:
-            # TODO: Make this more specific. This fails quietly on a valid page when the format changes.
+            return self.DownloadAllPagesNewFormat()
+        except UnrecognisedPageError as e:
+            logging.warning("Could not parse {0}: {1}".format(self.URL, e))
             return False
-
-        # Note: Avoid .prettify() as it inserts linebreaks around inline tags, which make future processing difficult. 
-        storyText = str(soup.find("div",attrs={"class": "b-story-body-x x-r15"})) + "\r\n"
-        if self.__PageCount != 1:
-            for pageNum in range(2,self.__PageCount+1):
-                urlStream = request.urlopen(self.URL+"?page="+str(pageNum))
-                html = urlStream.read()
-                soup = BeautifulSoup(html)
-                storyText += str(soup.find("div",attrs={"class": "b-story-body-x x-r15"})) + "\r\n"
-        self.Text = storyText.encode("utf-8")
-        self.PlainText = self.clean_plaintext(self.Text)
-        return True
     
-    def DownloadAllPagesNewFormat(self):
-        # Handles HTML format which is current as of 2023-06-23
-
-        urlstream = request.urlopen(self.URL)
-        html = urlstream.read()
-        soup = BeautifulSoup(html, features="lxml")
-
-        # Get number of pages
-        pageblock = soup.findAll("div",attrs={"class" :"panel clearfix l_bH"})
-        if pageblock:
-            pagenums = pageblock[0].findAll("a",attrs={"class" :"l_bJ"})
-            page_count = int(pagenums[-1].text)
+    def IterPagesNewFormat(self, max_workers=1, keep_pages=True):
+        # Yields the raw HTML of every page of the story, in page order, whichever registered layout it is in.
+        # Pages after the first are fetched on up to max_workers threads; request rate is governed by the fetcher's politeness_delay.
+        # Each page goes through the fetcher's FetchPage retries and is saved to the checkpoint; pages already there
+        # aren't fetched again, so after a StoryDownloadError the next attempt resumes at the first missing page.
+        # keep_pages=False only uses a checkpoint with a directory, so that no more than a page is held in memory.
+        # A page in no registered layout raises UnrecognisedPageError, and is left in the checkpoint marked unparsed.
+        # With KeepRaw, the pages are compressed into RawPages as they pass.
+        checkpoint = self.__PageCheckpoint(keep_pages)
+        raw = raw_pages_compressor() if self.KeepRaw else None
+        raw_chunks = []
+        for html in self.__IterFetchedPages(max_workers, checkpoint):
+            if raw is not None:
+                raw_chunks.append(raw.compress(raw_page_frame(html)))
+            yield html
+
+        if raw is not None:
+            raw_chunks.append(raw.flush())
+            self.RawPages = b"".join(raw_chunks)
+        if checkpoint is not None:
+            checkpoint.Clear(self.URL)
+
+    def __IterFetchedPages(self, max_workers, checkpoint):
+        first_page = self.__FirstPage(checkpoint)
+        self.__PageCount = page_count(first_page, self.__SniffPage(1, first_page, checkpoint))
+        yield first_page
+
+        page_numbers = range(2, self.__PageCount+1)
+        if max_workers > 1 and len(page_numbers) > 1:
+            # At most max_workers pages are in flight or waiting to be consumed, so memory stays bounded.
+            # Results are yielded in submission order, regardless of which page finishes first.
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                in_flight = deque()
+                for pageNumber in page_numbers:
+                    if len(in_flight) == max_workers:
+                        yield in_flight.popleft().result()
+                    in_flight.append(pool.submit(self.__FetchPage, pageNumber, checkpoint))
+                while in_flight:
+                    yield in_flight.popleft().result()
         else:
-            page_count = 1
-            
-        # self.Rating = soup.find("span", class_="aT_cl").text
-        # Get first page story
-        storyText = str(soup.find("div", class_='aa_ht')) + "\r\n"
-
-        for i in range(2, page_count+1):
-            logging.info(f"Getting page {i}")
-            urlstream = request.urlopen(self.URL + f'?page={i:d}')
-            html = urlstream.read()
-            soup = BeautifulSoup(html, features="lxml")
-            storyText += str(soup.find("div", class_='aa_ht')) + "\r\n"
-
-        self.Text = storyText
-        self.PlainText = self.clean_plaintext(storyText)
+            for pageNumber in page_numbers:
+                yield self.__FetchPage(pageNumber, checkpoint)
+
+    def __PageCheckpoint(self, keep_pages):
+        checkpoint = self.Checkpoint
+        if checkpoint is None:
+            if self.__memoryCheckpoint is None:
+                self.__memoryCheckpoint = LiteroticaCheckpoint()
+            checkpoint = self.__memoryCheckpoint
+        if checkpoint.Directory is None and not keep_pages:
+            return None
+        return checkpoint
+
+    def __FirstPage(self, checkpoint):
+        # Page 1, making sure the pages saved in the checkpoint are still those of the story as it is now.
+        # Pages past the checkpoint's TTL are dropped; pages saved by an earlier run are kept only if page 1,
+        # fetched again, hasn't changed, since an edited or re-paginated story would otherwise be spliced together.
+        # Pages kept because no page format could parse them are used as saved, within the TTL, so that they can be
+        # parsed once a parser for their layout is registered without fetching anything.
+        if not self.__MustVerifyCheckpoint(checkpoint):
+            return self.__FetchPage(1, checkpoint)
+        first_page = self.__FetchPage(1, None)
+        self.__VerifyCheckpoint(checkpoint, first_page)
+        return first_page
+
+    def __MustVerifyCheckpoint(self, checkpoint):
+        # True if the pages an earlier run saved in checkpoint are to be checked against page 1 fetched afresh;
+        # expired pages are dropped here
+        if checkpoint is None or not checkpoint.PageNumbers(self.URL):
+            return False
+        if checkpoint.Expired(self.URL):
+            logging.info("Discarding expired checkpoint of {0}".format(self.URL))
+            checkpoint.Clear(self.URL)
+            return False
+        # Not for pages saved earlier in this run, or saved to be parsed later
+        return checkpoint.Directory is not None and not checkpoint.HasUnparsed(self.URL)
+
+    def __VerifyCheckpoint(self, checkpoint, first_page):
+        if not checkpoint.Matches(self.URL, first_page, story_fingerprint):
+            logging.info("Discarding checkpoint of {0}: the story has changed".format(self.URL))
+            checkpoint.Clear(self.URL)
+        checkpoint.Put(self.URL, 1, first_page)
+
+    def __PageURL(self, pageNumber):
+        return self.URL if pageNumber == 1 else self.URL + f'?page={pageNumber:d}'
+
+    def __FetchPage(self, pageNumber, checkpoint):
+        html = checkpoint.Get(self.URL, pageNumber) if checkpoint is not None else None
+        if html is not None:
+            return html
+        try:
+            with self.Fetcher.Instrumentation.Member(self.MemberID):
+                html = self.Fetcher.FetchPage(self.__PageURL(pageNumber))
+        except PageFetchError as e:
+            raise self.__PageFailed(pageNumber, checkpoint, e) from e
+        return self.__PageFetched(pageNumber, html, checkpoint)
+
+    async def __FetchPageAsync(self, fetcher, pageNumber, checkpoint):
+        # __FetchPage on a LiteroticaAsyncFetcher; the checkpoint is only touched between awaits
+        html = checkpoint.Get(self.URL, pageNumber) if checkpoint is not None else None
+        if html is not None:
+            return html
+        try:
+            with fetcher.Instrumentation.Member(self.MemberID):
+                html = await fetcher.FetchPage(self.__PageURL(pageNumber))
+        except PageFetchError as e:
+            raise self.__PageFailed(pageNumber, checkpoint, e) from e
+        return self.__PageFetched(pageNumber, html, checkpoint)
+
+    def __PageFetched(self, pageNumber, html, checkpoint):
+        if checkpoint is not None:
+            checkpoint.Put(self.URL, pageNumber, html)
+        if pageNumber > 1:
+            self.__SniffPage(pageNumber, html, checkpoint)
+        return html
+
+    def __PageFailed(self, pageNumber, checkpoint, error):
+        pagesSaved = len(checkpoint.PageNumbers(self.URL)) if checkpoint is not None else 0
+        return StoryDownloadError(self.URL, pageNumber, self.__PageCount or None, pagesSaved, error.Attempts, error.Cause)
+
+    def __SniffPage(self, pageNumber, html, checkpoint):
+        # The page's format; a page in none is saved so that it can be parsed once a parser for its layout is registered
+        pageFormat = sniff_page_format(html)
+        if pageFormat is not None:
+            return pageFormat
+        error = UnrecognisedPageError("no registered page format matches", self.URL, pageNumber)
+        checkpoint = checkpoint if checkpoint is not None else self.__PageCheckpoint(True)
+        checkpoint.Put(self.URL, pageNumber, html)
+        checkpoint.MarkUnparsed(self.URL, pageNumber, error.Reason)
+        logging.warning("Saved unrecognised page: {0}".format(error))
+        raise error
+
+    def DownloadAllPagesNewFormat(self, max_workers=1):
+        # Handles every registered page format (see LiteroticaPageFormats), the current one being that of 2023-06-23
+        with self.__Stage("download"):
+            page_contents = [parse_story_page(html, self.__Stage) for html in self.IterPagesNewFormat(max_workers)]
+            self.Text, self.PlainText = render_text(page_contents), render_plaintext(page_contents)
         return True
 
-            
-    def DownloadAndWriteStory(self, contentDirectory, force_redownload=False):
-        # End conditions: plaintext and html files exist, self.PlainText is populated with rawtext, self.html is populated with html
+    async def DownloadAllPagesAsync(self, fetcher, max_concurrency=4, executor=None):
+        # asyncio counterpart of DownloadAllPagesNewFormat.  fetcher is a LiteroticaAsyncFetcher; up to max_concurrency
+        # pages are fetched at once.  Pages are kept in the checkpoint, and failures and unrecognised pages handled,
+        # as on the sync path: a page which can't be fetched raises StoryDownloadError once the pages fetched
+        # alongside it are saved.  Parsing is the same parse_story_pages as the sync paths, run on executor
+        # (None for the loop's default) so that it doesn't block the event loop.  The download is timed on the async
+        # fetcher's instrumentation.
+        import asyncio
+        checkpoint = self.__PageCheckpoint(True)
+        with fetcher.Instrumentation.Stage("download", url=self.URL, member=self.MemberID):
+            if self.__MustVerifyCheckpoint(checkpoint):
+                first_page = await self.__FetchPageAsync(fetcher, 1, None)
+                self.__VerifyCheckpoint(checkpoint, first_page)
+            else:
+                first_page = await self.__FetchPageAsync(fetcher, 1, checkpoint)
+            self.__PageCount = page_count(first_page, self.__SniffPage(1, first_page, checkpoint))
+
+            limit = asyncio.Semaphore(max_concurrency)
+            async def fetch_page(pageNumber):
+                async with limit:
+                    return await self.__FetchPageAsync(fetcher, pageNumber, checkpoint)
+
+            other_pages = await asyncio.gather(*[fetch_page(i) for i in range(2, self.__PageCount+1)], return_exceptions=True)
+            for page in other_pages:
+                if isinstance(page, BaseException):
+                    raise page
+            loop = asyncio.get_running_loop()
+            pages = [first_page] + list(other_pages)
+            self.Text, self.PlainText = await loop.run_in_executor(executor, parse_story_pages, pages)
+            if self.KeepRaw:
+                self.RawPages = await loop.run_in_executor(executor, pack_raw_pages, pages)
+        checkpoint.Clear(self.URL)
+        return True
+
+    def StoryFilePaths(self, contentDirectory):
+        # (html, plaintext) output paths for this story
         html_fname = os.path.join(contentDirectory, self.FileName)
         plaintext_fname = os.path.join(contentDirectory, self.FileName.replace('.html', '.txt'))
+        return html_fname, plaintext_fname
+
+    def RawPagesPath(self, contentDirectory):
+        # Where a KeepRaw download keeps the pages as fetched
+        return os.path.join(contentDirectory, self.FileName.replace('.html', '.raw.gz'))
 
-        if force_redownload or (self.PlainText is None and not os.path.exists(plaintext_fname)):
+    def NeedsDownload(self, contentDirectory, force_redownload=False, output=None):
+        # output: the DirectoryOutput the files are written through; its sidecars tell complete files from partial ones
+        output = output if output is not None else DirectoryOutput.Default()
+        html_fname, plaintext_fname = self.StoryFilePaths(contentDirectory)
+        return force_redownload or (self.PlainText is None and not (output.Exists(plaintext_fname) and output.Exists(html_fname)))
+
+            
+    def DownloadAndWriteStory(self, contentDirectory, force_redownload=False, streaming=False, release_text=False, output=None):
+        # End conditions: plaintext and html files exist, self.PlainText is populated with rawtext, self.html is populated with html
+        # streaming: write each page to the files as it arrives, never holding the whole story (Text and PlainText stay None)
+        # release_text: drop Text and PlainText once they are on disk
+        # output: the DirectoryOutput to write through; by default files are written atomically in the foreground
+        output = output if output is not None else DirectoryOutput.Default()
+        html_fname, plaintext_fname = self.StoryFilePaths(contentDirectory)
+
+        if streaming:
+            if self.NeedsDownload(contentDirectory, force_redownload, output):
+                self.StreamStoryFiles(contentDirectory, output=output)
+            elif self.PlainText is not None and not output.Exists(plaintext_fname):
+                self.WriteStoryFiles(contentDirectory, output)
+            self.Text = self.PlainText = None
+            return
+
+        if self.NeedsDownload(contentDirectory, force_redownload, output):
             self.DownloadAllPagesNewFormat()
-            with open(plaintext_fname, 'w') as file:
-                file.write(self.PlainText)
-            with open(html_fname, 'w') as file:
-                file.write(self.Text)
-        elif self.PlainText is None and os.path.exists(plaintext_fname):
-            self.PlainText = open(plaintext_fname, 'r').read()
-            self.Text = open(html_fname, 'r').read()
-        elif self.PlainText is not None and not os.path.exists(plaintext_fname):
-            with open(plaintext_fname, 'w') as file:
-                file.write(self.PlainText)
-            with open(html_fname, 'w') as file:
-                file.write(self.Text)
-
-    def WriteToDisk(self, contentDirectory):
+            self.WriteStoryFiles(contentDirectory, output)
+        elif self.PlainText is None and output.Exists(plaintext_fname):
+            self.PlainText = output.ReadText(plaintext_fname)
+            self.Text = output.ReadText(html_fname)
+        elif self.PlainText is not None and not output.Exists(plaintext_fname):
+            self.WriteStoryFiles(contentDirectory, output)
+
+        if release_text:
+            self.Text = self.PlainText = None
+
+    def StreamStoryFiles(self, contentDirectory, max_workers=1, output=None):
+        # Downloads the story, writing each page's HTML and paragraphs out as soon as it is parsed.
+        # Peak memory is one page (or max_workers pages when fetching concurrently), not the whole story.
+        output = output if output is not None else DirectoryOutput.Default()
+        html_fname, plaintext_fname = self.StoryFilePaths(contentDirectory)
+        with self.__Stage("download"), output.Open(html_fname) as html_file, output.Open(plaintext_fname) as plaintext_file:
+            separator = ''
+            for html in self.IterPagesNewFormat(max_workers, keep_pages=False):
+                page = parse_story_page(html, self.__Stage)
+                html_file.write(page.Html + "\r\n")
+                for paragraph in page.Paragraphs:
+                    plaintext_file.write(separator + paragraph)
+                    separator = '\n\n'
+        self.__WriteRawPages(contentDirectory, output)
+
+    def WriteStoryFiles(self, contentDirectory, output=None):
+        output = output if output is not None else DirectoryOutput.Default()
+        html_fname, plaintext_fname = self.StoryFilePaths(contentDirectory)
+        with self.__Stage("write"):
+            output.WriteText(html_fname, self.Text)
+            output.WriteText(plaintext_fname, self.PlainText)
+            self.__WriteRawPages(contentDirectory, output)
+
+    def __WriteRawPages(self, contentDirectory, output):
+        if self.RawPages is not None:
+            output.WriteBytes(self.RawPagesPath(contentDirectory), self.RawPages)
+            self.RawPages = None
+
+    def Reprocess(self, contentDirectory, output=None):
+        # Regenerates Text and PlainText from the raw pages a KeepRaw download kept, and rewrites the story files,
+        # without fetching anything.  Returns False if there are no raw pages for this story.
+        output = output if output is not None else DirectoryOutput.Default()
+        raw_fname = self.RawPagesPath(contentDirectory)
+        if not output.Exists(raw_fname):
+            return False
+        with self.__Stage("reprocess"):
+            self.Text, self.PlainText = reparse_raw_pages(output.ReadBytes(raw_fname))
+        self.WriteStoryFiles(contentDirectory, output)
+        return True
+
+    def WriteToDisk(self, contentDirectory, output=None):
         # This did not have a caller or a unit test, so I'm working with my best understanding of the intent
+        output = output if output is not None else DirectoryOutput.Default()
         try:
-            with self.CreateStoryPage(contentDirectory, self.FileName) as file:
+            with output.Open(os.path.join(contentDirectory, "storyPages", self.FileName)) as file:
                 self.__WriteStoryPageHeader(file)
                 self.__WriteStoryPageMemberLine(file)
                 self.__WriteStoryPageText(file)
@@ -194,7 +621,7 @@ class LiteroticaStoryPage():
         return True
 
     def __WriteStoryPageText(self,file):
-        file.write(self.Text.encode("utf-8"))
+        file.write(self.Text)
         return
 
     def __WriteStoryPageFooter(self, file):
@@ -203,12 +630,12 @@ class LiteroticaStoryPage():
 
     def __WriteStoryPageMemberLine(self, file):
         memberLine = self.__saveMemberLine.replace("{MemberID}",str(self.MemberID))
-        file.write(memberLine.encode("utf-8"))
+        file.write(memberLine)
         return
 
     def __WriteStoryPageHeader(self, file):
         storyPageHeader = self.__saveHeader.replace("{Title}", self.Title)
-        file.write(storyPageHeader.encode("utf-8"))
+        file.write(storyPageHeader)
         return
 
     def CreateStoryPage(self, contentDirectory, fileName):
@@ -0,0 +1,20 @@
+from synthetic_site import LocalSite
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    # The benchmarks are a separate run, e.g.  pytest test_benchmarks.py --benchmark-only  (or -m benchmark);
+    # a plain pytest deselects them rather than spending minutes timing things on every test run
+    if config.getoption("--benchmark-only", default=False) or "benchmark" in (config.getoption("markexpr") or ""):
+        return
+    deselected = [item for item in items if item.get_closest_marker("benchmark") is not None]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if item.get_closest_marker("benchmark") is None]
+
+
+@pytest.fixture
+def local_site():
+    site = LocalSite().Start()
+    yield site
+    site.Stop()
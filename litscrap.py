@@ -0,0 +1,149 @@
+"""
+Command-line entry point, e.g.
+
+    python -m litscrap member 1332946 --output ~/stories --cache ~/.cache/litscrap
+    python -m litscrap member 1332946 --output ~/stories --list
+    python -m litscrap member 1332946 --output ~/stories --reprocess
+
+"member" syncs one member's stories into <output>/<id>; with --list it only reads what an earlier sync
+recorded, without loading the parsing or networking libraries.  With --cache, pages still fresh in the
+response cache are served from it, and requests itself is only imported once something has to be fetched.
+--keep-raw keeps the pages as fetched beside the stories, and --reprocess rebuilds the stories from them.
+The pages of a story which failed part way, or which couldn't be parsed, are kept in <output>/.checkpoint (or
+--checkpoint), so the next sync resumes it, and parses saved pages once the parser is fixed, without refetching.
+--index adds every story written to a full-text search index (see LiteroticaSearchIndex), and --store writes
+the files through a content store (see LiteroticaContentStore), so files with the same content share one copy.
+"""
+import argparse
+import logging
+import os
+import sys
+
+
+def member_directory(output, memberID):
+    return os.path.join(output, str(memberID))
+
+
+def list_member(args):
+    from LiteroticaManifest import LiteroticaManifest
+
+    directory = member_directory(args.output, args.id)
+    manifest_path = os.path.join(directory, f'member_{args.id}.manifest.json')
+    if not os.path.exists(manifest_path):
+        print("No sync recorded for member {0} in {1}".format(args.id, directory), file=sys.stderr)
+        return 1
+
+    stories = LiteroticaManifest(manifest_path).Stories
+    for url, entry in sorted(stories.items(), key=lambda item: (item[1].get("SeriesTitle") or "", item[1].get("FileName") or "")):
+        series = entry.get("SeriesTitle")
+        print("\t".join([entry.get("Title") or "", series.split(":")[0] if series else "", str(entry.get("PageCount")), url]))
+    return 0
+
+
+def search_index(args):
+    if not args.index:
+        return None
+    from LiteroticaSearchIndex import LiteroticaSearchIndex
+    return LiteroticaSearchIndex(args.index)
+
+
+def member_output(args):
+    # The output the files are written through: the default one, or one deduplicating through --store
+    from LiteroticaOutput import DirectoryOutput
+    if not args.store:
+        return DirectoryOutput.Default()
+    from LiteroticaContentStore import LiteroticaContentStore
+    return DirectoryOutput(store=LiteroticaContentStore(args.store))
+
+
+def print_store_summary(output):
+    if output.Store is not None:
+        print("Store: " + output.Store.Summary())
+
+
+def reprocess_member(args):
+    from LiteroticaMemberPage import LiteroticaMemberPage
+
+    directory = member_directory(args.output, args.id)
+    index = search_index(args)
+    output = member_output(args)
+    author = LiteroticaMemberPage(args.id, parser=args.parser, search_index=index)
+    success = author.Reprocess(directory, parse_processes=args.processes, output=output)
+    if index is not None:
+        index.Close()
+    failed = [result for result in author.DownloadResults if not result.Success]
+    print("{0} ({1}): {2:d} stories rebuilt, {3:d} failed".format(
+        author.MemberName, args.id, len(author.DownloadResults) - len(failed), len(failed)))
+    print_store_summary(output)
+    return 0 if success else 1
+
+
+def sync_member(args):
+    from LiteroticaCheckpoint import LiteroticaCheckpoint
+    from LiteroticaFetcher import LiteroticaFetcher
+    from LiteroticaMemberPage import LiteroticaMemberPage
+
+    cache = None
+    if args.cache:
+        from LiteroticaResponseCache import LiteroticaResponseCache
+        cache = LiteroticaResponseCache(args.cache, ttl=args.ttl)
+
+    index = search_index(args)
+    checkpoint = LiteroticaCheckpoint(args.checkpoint or os.path.join(args.output, ".checkpoint"))
+    with LiteroticaFetcher(cache=cache, politeness_delay=args.delay) as fetcher:
+        author = LiteroticaMemberPage(args.id, fetcher=fetcher, parser=args.parser, checkpoint=checkpoint,
+                                      keep_raw=args.keep_raw, search_index=index)
+        if args.url:
+            author.MemberPageURL = args.url
+        if not author.DownloadMemberPage():
+            print("Could not load member page {0}".format(author.MemberPageURL), file=sys.stderr)
+            return 1
+
+        directory = member_directory(args.output, args.id)
+        os.makedirs(directory, exist_ok=True)
+        output = member_output(args)
+        report = author.SyncToDirectory(directory, output=output)
+    if index is not None:
+        index.Close()
+
+    print("{0} ({1}): {2:d} new, {3:d} changed, {4:d} unchanged, {5:d} removed, {6:d} failed".format(
+        author.MemberName, args.id, len(report.New), len(report.Changed), len(report.Unchanged), len(report.Removed),
+        len(report.Failed)))
+    for error in author.StoryErrors():
+        print("  {0}: {1}".format(error["url"], error["error"]), file=sys.stderr)
+    print_store_summary(output)
+    return 1 if report.Failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="litscrap", description="Download Literotica member pages and stories")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    member = commands.add_parser("member", help="sync one member's stories into <output>/<id>")
+    member.add_argument("id", type=int, help="member ID")
+    member.add_argument("--output", default=".", help="directory holding a subdirectory per member (default: .)")
+    member.add_argument("--list", action="store_true", help="list the stories recorded by the last sync, without fetching")
+    member.add_argument("--cache", default=None, help="response cache directory")
+    member.add_argument("--ttl", type=float, default=24 * 3600, help="seconds a cached page is used without revalidating")
+    member.add_argument("--delay", type=float, default=0.0, help="minimum seconds between requests")
+    member.add_argument("--checkpoint", default=None, help="directory keeping the pages of unfinished stories (default: <output>/.checkpoint)")
+    member.add_argument("--parser", choices=["bs4", "lxml"], default="lxml")
+    member.add_argument("--keep-raw", action="store_true", help="keep the pages as fetched, compressed, for --reprocess")
+    member.add_argument("--reprocess", action="store_true", help="rebuild the stories from their raw pages, without fetching")
+    member.add_argument("--processes", type=int, default=None, help="parse processes for --reprocess (default: one per core)")
+    member.add_argument("--index", default=None, help="SQLite file of a full-text index to add the stories written to")
+    member.add_argument("--store", default=None, help="content store directory; files with the same content are hard-linked to one copy")
+    member.add_argument("--url", default=None, help="member page URL, if not the usual one for the ID")
+    member.add_argument("-v", "--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    if args.list:
+        return list_member(args)
+    if args.reprocess:
+        return reprocess_member(args)
+    return sync_member(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+A local stand-in for the Literotica site, used by the tests.
+Serves generated story pages from a background HTTP server so that
+paging and fetching can be exercised without network access.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import hashlib
+import threading
+import time
+
+
+def make_story_page(page_num, page_count, paragraphs, title="Synthetic Story"):
+    # Mirrors the 2023-06 layout: pager links in "panel clearfix l_bH", story body in "aa_ht"
+    pager = ""
+    if page_count > 1:
+        links = "".join(f'<a class="l_bJ" href="?page={i:d}">{i:d}</a>' for i in range(1, page_count + 1))
+        pager = f'<div class="panel clearfix l_bH">{links}</div>'
+
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    html = (f"<html><head><title>{title} - Literotica.com</title></head><body>"
+            f'<div class="aa_ht"><div>{body}</div></div>{pager}</body></html>')
+    return html.encode("utf-8")
+
+
+def add_story(site, path, pages, title="Synthetic Story"):
+    # pages: a list of paragraph lists, one per page.  Returns the story URL.
+    page_count = len(pages)
+    for page_num, paragraphs in enumerate(pages, start=1):
+        html = make_story_page(page_num, page_count, paragraphs, title=title)
+        if page_num == 1:
+            site.Pages[path] = html
+        site.Pages[path + f"?page={page_num:d}"] = html
+    return site.URL(path)
+
+
+def make_story_row(row_class, url, title, description, category, date, rating=4.5):
+    # rating may also be a string, e.g. "x.xx" for unrated stories
+    rating = rating if isinstance(rating, str) else f"{rating:.2f}"
+    return (f'<tr class="{row_class}"><td><a href="{url}">{title}</a>\xa0({rating})</td>'
+            f'<td>{description}</td><td><a href="/c/{category}"><span>{category}</span></a></td>'
+            f'<td>{date}</td></tr>')
+
+
+def make_member_page(member_name, individual_rows, series):
+    # individual_rows: story row dicts; series: list of (series title, [story row dicts])
+    rows = [make_story_row("root-story r-ott", **row) for row in individual_rows]
+    for series_title, series_rows in series:
+        rows.append(f'<tr class="ser-ttl"><td colspan="4">{series_title}</td></tr>')
+        rows += [make_story_row("sl", **row) for row in series_rows]
+
+    html = (f"<html><head><title>{member_name} - Literotica.com</title></head><body>"
+            f'<a class="contactheader" href="#">{member_name}</a>'
+            f'<table>{"".join(rows)}</table></body></html>')
+    return html.encode("utf-8")
+
+
+def add_member(site, member_id, member_name="Synthetic Author", individual_count=2, series_lengths=(3,), pages_per_story=2):
+    # Adds a member page plus every story on it.  Returns the member page URL.
+    def add_row(slug, title):
+        pages = [[f"{title} page {p:d} paragraph {j:d}." for j in range(3)] for p in range(1, pages_per_story + 1)]
+        url = add_story(site, f"/s/{slug}", pages, title=title)
+        return {"url": url, "title": title, "description": f"About {title}", "category": "Romance", "date": "01/02/2023"}
+
+    individual_rows = [add_row(f"story-{i:d}", f"Story {i:d}") for i in range(1, individual_count + 1)]
+    series = []
+    for s, length in enumerate(series_lengths, start=1):
+        series_rows = [add_row(f"series-{s:d}-ch-{c:d}", f"Series {s:d} Ch. {c:02d}") for c in range(1, length + 1)]
+        series.append((f"Series {s:d}: {length:d} Part Series", series_rows))
+
+    path = f"/stories/memberpage.php?uid={member_id}&page=submissions"
+    site.Pages[path] = make_member_page(member_name, individual_rows, series)
+    return site.URL(path)
+
+
+def make_listing_rows(count, base_url="https://www.literotica.com/s/", prefix="story"):
+    # Listing rows for stories which aren't served; for benchmarking member page parsing at scale
+    return [{"url": f"{base_url}{prefix}-{i:d}", "title": f"Story Number {i:d}", "description": f"The {i:d}th story, with a longer description",
+             "category": ("Romance", "Humor & Satire", "Sci-Fi & Fantasy")[i % 3], "date": f"{1 + i % 12:02d}/{1 + i % 28:02d}/2023",
+             "rating": 3.5 + (i % 150) / 100} for i in range(count)]
+
+
+def make_large_member_page(story_count, series_length=10, series_fraction=0.5, member_name="Prolific Author"):
+    # A member page with story_count rows, series_fraction of them grouped into series of series_length chapters
+    series_count = int(story_count * series_fraction) // series_length
+    individual_rows = make_listing_rows(story_count - series_count * series_length)
+    series = [(f"Saga {s:d}: {series_length:d} Part Series", make_listing_rows(series_length, prefix=f"saga-{s:d}-ch"))
+              for s in range(series_count)]
+    return make_member_page(member_name, individual_rows, series)
+
+
+def make_italics_paragraphs(size_bytes):
+    # Dialogue-heavy paragraphs full of inline emphasis, about size_bytes of HTML in total
+    templates = ["\"I <em>told</em> you,\" she said<em>, again. </em>He didn't <b>listen</b>.",
+                 "<i>Never </i>again<i>, </i>he thought. <strong>Never.</strong> The rain kept falling<em>.</em>",
+                 "It was <em>late</em>; the house was <em> quiet</em>, and <b>nobody </b>moved, not even the cat.",
+                 "Plain paragraphs matter too: most of a story has no markup at all, just sentences one after another."]
+    paragraphs = []
+    size = 0
+    while size < size_bytes:
+        paragraph = templates[len(paragraphs) % len(templates)]
+        paragraphs.append(paragraph)
+        size += len(paragraph) + len("<p></p>")
+    return paragraphs
+
+
+class LocalSite():
+    """Serves a dict of path -> bytes over HTTP on localhost."""
+
+    def __init__(self, pages=None, delay=0.0):
+        self.Pages = dict(pages or {})
+        self.Requests = []  # Paths in the order they were requested
+        self.Connections = set()  # Client (host, port) pairs seen; one per TCP connection
+        self.Failures = {}  # path -> number of 503 responses to send before serving the page
+        self.NotModified = 0  # Number of 304 responses sent to conditional requests
+        self.Delay = delay  # Seconds to wait before answering, to imitate network latency
+
+        self.__server = None
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def Start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                failing = site.RecordRequest(self.path, self.client_address)
+                if site.Delay:
+                    time.sleep(site.Delay)
+
+                body = site.Pages.get(self.path)
+                if failing:
+                    self.send_response(503)
+                    body = b"<html><head><title>Unavailable</title></head></html>"
+                elif body is None:
+                    self.send_response(404)
+                    body = b"<html><head><title>Literotica.com - error</title></head></html>"
+                else:
+                    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        site.RecordNotModified()
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def RecordRequest(self, path, client_address):
+        # Returns True when this request should be answered with a failure
+        with self.__lock:
+            self.Requests.append(path)
+            self.Connections.add(client_address)
+            if self.Failures.get(path, 0) > 0:
+                self.Failures[path] -= 1
+                return True
+        return False
+
+    def RecordNotModified(self):
+        with self.__lock:
+            self.NotModified += 1
+
+    def Stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def URL(self, path):
+        host, port = self.__server.server_address
+        return f"http://{host}:{port:d}{path}"
+
+
+if __name__ == "__main__":
+    # Writes a fixture to stdout, e.g.:  python synthetic_site.py member 5000 > member.html
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Generate synthetic Literotica pages")
+    parser.add_argument("kind", choices=["member", "story"])
+    parser.add_argument("size", type=int, help="member: number of story rows; story: approximate bytes of story HTML")
+    args = parser.parse_args()
+
+    if args.kind == "member":
+        sys.stdout.buffer.write(make_large_member_page(args.size))
+    else:
+        sys.stdout.buffer.write(make_story_page(1, 1, make_italics_paragraphs(args.size)))
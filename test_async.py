@@ -0,0 +1,137 @@
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaFetcher import PageFetchError
+from LiteroticaStoryPage import LiteroticaStoryPage, StoryDownloadError, UnrecognisedPageError
+from synthetic_site import add_member, add_story
+import asyncio
+import os
+import pytest
+
+pytest.importorskip("aiohttp")
+from LiteroticaAsyncFetcher import LiteroticaAsyncFetcher
+
+
+def test_async_story_matches_sync(local_site):
+    url = add_story(local_site, "/s/async", [[f"Page {i:d} has <em>some</em> text."] for i in range(1, 6)])
+    sequential = LiteroticaStoryPage()
+    sequential.URL = url
+    assert sequential.DownloadAllPagesNewFormat()
+
+    async def download():
+        async with LiteroticaAsyncFetcher() as fetcher:
+            story = LiteroticaStoryPage()
+            story.URL = url
+            assert await story.DownloadAllPagesAsync(fetcher, max_concurrency=3)
+            return story
+
+    story = asyncio.run(download())
+    assert story.PageCount() == 5
+    assert (story.Text, story.PlainText) == (sequential.Text, sequential.PlainText)
+
+
+def test_async_member_page(local_site):
+    url = add_member(local_site, 1, individual_count=2, series_lengths=(2,))
+
+    async def download():
+        async with LiteroticaAsyncFetcher() as fetcher:
+            author = LiteroticaMemberPage(1, parser="lxml")
+            author.MemberPageURL = url
+            assert await author.DownloadMemberPageAsync(fetcher)
+            stories = [author.StoryPage(listing) for listing in author.IndividualStories]
+            await asyncio.gather(*[story.DownloadAllPagesAsync(fetcher) for story in stories])
+            return author, stories
+
+    author, stories = asyncio.run(download())
+    assert author.SeriesTitles() == ["Series 1: 2 Part Series"]
+    assert "Story 2 page 2 paragraph 2." in stories[1].PlainText
+
+
+def test_async_fetch_retries_and_times_out(local_site):
+    local_site.Pages["/flaky"] = b"<html><body>ok</body></html>"
+    local_site.Failures["/flaky"] = 2
+    local_site.Pages["/slow"] = b"<html></html>"
+
+    async def fetch():
+        async with LiteroticaAsyncFetcher(retries=3, backoff_factor=0.01) as fetcher:
+            assert await fetcher.Fetch(local_site.URL("/flaky")) == b"<html><body>ok</body></html>"
+        local_site.Delay = 0.5
+        async with LiteroticaAsyncFetcher(timeout=0.1, retries=0) as fetcher:
+            with pytest.raises(asyncio.TimeoutError):
+                await fetcher.Fetch(local_site.URL("/slow"))
+
+    asyncio.run(fetch())
+    assert local_site.Requests.count("/flaky") == 3
+
+
+def test_async_stages_and_cache_stay_off_the_loop(local_site, tmp_path):
+    from LiteroticaInstrumentation import LiteroticaInstrumentation, StatsSink
+    from LiteroticaResponseCache import LiteroticaResponseCache
+    import threading
+
+    url = add_member(local_site, 1, individual_count=1, series_lengths=())
+    cache = LiteroticaResponseCache(str(tmp_path / "cache"))
+    cache_threads = set()
+    for name in ("Get", "Put"):
+        method = getattr(cache, name)
+        setattr(cache, name, lambda *args, method=method: cache_threads.add(threading.get_ident()) or method(*args))
+
+    stats = StatsSink()
+    async def download():
+        async with LiteroticaAsyncFetcher(cache=cache, instrumentation=LiteroticaInstrumentation([stats])) as fetcher:
+            author = LiteroticaMemberPage(1, parser="lxml")
+            author.MemberPageURL = url
+            assert await author.DownloadMemberPageAsync(fetcher)
+            story = author.StoryPage(author.IndividualStories[0])
+            assert await story.DownloadAllPagesAsync(fetcher)
+            return threading.get_ident()
+
+    loop_thread = asyncio.run(download())
+    assert cache_threads and loop_thread not in cache_threads
+    assert {"parse", "member_parse", "download"} <= set(stats.StageCounts)
+    assert stats.MemberFetches == {1: stats.FetchCount}
+
+
+def test_async_story_fails_and_resumes_like_sync(local_site, tmp_path):
+    url = add_story(local_site, "/s/async-flaky", [[f"Page {i:d} text."] for i in range(1, 6)])
+    local_site.Failures["/s/async-flaky?page=4"] = 100
+    local_site.Pages["/s/async-redesigned"] = b'<html><body><div class="zz_q9"><p>New.</p></div></body></html>'
+
+    async def download(story):
+        async with LiteroticaAsyncFetcher(retries=0) as fetcher:
+            return await story.DownloadAllPagesAsync(fetcher, max_concurrency=2)
+
+    story = LiteroticaStoryPage(checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint")))
+    story.URL = url
+    with pytest.raises(StoryDownloadError) as error:
+        asyncio.run(download(story))
+    assert (error.value.Page, error.value.PageCount) == (4, 5)
+    assert isinstance(error.value.__cause__, PageFetchError)
+
+    # Resumed from the pages saved on disk: page 1 is checked again, and only the missing page is fetched
+    local_site.Failures.clear()
+    local_site.Requests.clear()
+    story = LiteroticaStoryPage(checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint")))
+    story.URL = url
+    assert asyncio.run(download(story))
+    assert sorted(local_site.Requests) == ["/s/async-flaky", "/s/async-flaky?page=4"]
+    assert story.PlainText.count("text.") == 5
+    assert os.listdir(tmp_path / "checkpoint") == []
+
+    checkpoint = LiteroticaCheckpoint()
+    story = LiteroticaStoryPage(checkpoint=checkpoint)
+    story.URL = local_site.URL("/s/async-redesigned")
+    with pytest.raises(UnrecognisedPageError):
+        asyncio.run(download(story))
+    assert checkpoint.Unparsed() == [(story.URL, 1, "no registered page format matches")]
+
+
+def test_async_member_page_error_is_recorded(local_site):
+    async def download():
+        async with LiteroticaAsyncFetcher(retries=0) as fetcher:
+            author = LiteroticaMemberPage(1)
+            author.MemberPageURL = local_site.URL("/no-such-member")
+            assert not await author.DownloadMemberPageAsync(fetcher)
+            return author
+
+    author = asyncio.run(download())
+    assert isinstance(author.DownloadError, PageFetchError)
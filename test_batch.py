@@ -0,0 +1,59 @@
+from LiteroticaBatch import LiteroticaBatch
+from synthetic_site import add_member
+import json
+import os
+
+
+def member_url(site):
+    return lambda memberID: site.URL(f"/stories/memberpage.php?uid={memberID}&page=submissions")
+
+
+def test_batch_downloads_listed_members(local_site, tmp_path):
+    add_member(local_site, 1, member_name="First Author", individual_count=2, series_lengths=(2,))
+    add_member(local_site, 2, member_name="Second Author", individual_count=1, series_lengths=())
+    progress = []
+
+    batch = LiteroticaBatch([1, 2, 1], str(tmp_path), requests_per_second=200, memberURL=member_url(local_site),
+                            progress=lambda memberID, status, detail: progress.append((memberID, status)))
+    assert batch.Run()
+
+    assert batch.MemberIDs == [1, 2]
+    assert batch.Results[1].StoryCount == 4 and batch.Results[2].StoryCount == 1
+    assert (tmp_path / "1_first-author" / "story-1.txt").exists()
+    assert (tmp_path / "1_first-author" / "series-1.txt").exists()
+    assert (tmp_path / "2_second-author" / "member_2.csv").exists()
+    assert (1, "done") in progress and (2, "done") in progress
+    assert batch.FailureSummary() == "No failures"
+
+
+def test_batch_resumes_and_summarises_failures(local_site, tmp_path):
+    add_member(local_site, 1, individual_count=2, series_lengths=())
+    local_site.Failures["/s/story-2"] = 100
+
+    batch = LiteroticaBatch([1, 3], str(tmp_path), requests_per_second=200, memberURL=member_url(local_site))
+    batch.Fetcher = type(batch.Fetcher)(retries=0, page_retries=0)
+    assert not batch.Run()
+
+    assert batch.Results[1].FailedStories == [local_site.URL("/s/story-2")]
+    assert batch.Results[3].Error.startswith("member page could not be loaded")
+    assert batch.Results[1].StoryErrors[0]["page"] == 1 and batch.Results[1].StoryErrors[0]["type"] == "StoryDownloadError"
+    summary = batch.FailureSummary()
+    assert "member 1" in summary and "/s/story-2" in summary and "member 3" in summary
+
+    with open(os.path.join(str(tmp_path), "batch_state.json")) as file:
+        state = json.load(file)["members"]
+    assert state["1"]["status"] == "failed" and state["3"]["status"] == "failed"
+
+    # The site recovers; a new batch on the same state only fetches what is missing
+    local_site.Failures.clear()
+    add_member(local_site, 3, individual_count=1, series_lengths=())
+    local_site.Requests.clear()
+    resumed = LiteroticaBatch([1, 3], str(tmp_path), requests_per_second=200, memberURL=member_url(local_site))
+    assert resumed.Run()
+    assert "/s/story-2" in local_site.Requests
+    assert local_site.Requests.count("/s/story-1") == 1, "Member 1's story 1 is on disk; only member 3's is fetched"
+    assert resumed.FailureSummary() == "No failures"
+
+    local_site.Requests.clear()
+    assert resumed.Run()
+    assert local_site.Requests == []
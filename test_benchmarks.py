@@ -0,0 +1,69 @@
+"""
+Offline benchmarks for the parsing and writing hot paths, using synthetic fixtures from synthetic_site.
+Run with pytest-benchmark, e.g.  pytest test_benchmarks.py --benchmark-only  (or -m benchmark); a plain pytest
+deselects them, see conftest.py.
+LITSCRAP_BENCH_SCALE multiplies the fixture sizes (default 1).
+"""
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaStoryPage import LiteroticaStoryPage, convert_inline_tags_to_markdown
+from synthetic_site import add_member, make_large_member_page, make_italics_paragraphs
+import pytest
+import os
+
+pytest.importorskip("pytest_benchmark")
+
+SCALE = float(os.environ.get("LITSCRAP_BENCH_SCALE", "1"))
+MEMBER_ROWS = int(2000 * SCALE)
+STORY_BYTES = int(2 * 1024 * 1024 * SCALE)
+
+
+@pytest.fixture(scope="module")
+def italics_story_html():
+    return "<div>" + "".join(f"<p>{paragraph}</p>" for paragraph in make_italics_paragraphs(STORY_BYTES)) + "</div>"
+
+
+def load_member_page(site, html, parser="bs4"):
+    site.Pages["/member"] = html
+    author = LiteroticaMemberPage(1, parser=parser)
+    author.MemberPageURL = site.URL("/member")
+    assert author.DownloadMemberPage()
+    return author
+
+
+@pytest.mark.benchmark(group="member")
+@pytest.mark.parametrize("parser", ["bs4", "lxml"])
+def test_load_member_page(benchmark, local_site, parser):
+    # The parsed page is released after loading, so each round parses the member page from its bytes
+    html = make_large_member_page(MEMBER_ROWS)
+    author = LiteroticaMemberPage(1, parser=parser)
+
+    assert benchmark(author.LoadMemberPage, html)
+
+    parsed = len(author.IndividualStories) + sum(len(entries) for _, entries in author.SeriesStories)
+    assert parsed == MEMBER_ROWS
+
+
+@pytest.mark.benchmark(group="markdown")
+def test_convert_inline_tags_to_markdown(benchmark, italics_story_html):
+    output = benchmark.pedantic(convert_inline_tags_to_markdown, args=(italics_story_html,), rounds=3)
+    assert "<em>" not in output
+
+
+@pytest.mark.benchmark(group="markdown")
+def test_clean_plaintext(benchmark, italics_story_html):
+    plaintext = benchmark.pedantic(LiteroticaStoryPage.clean_plaintext, args=(italics_story_html,), rounds=3)
+    assert "*told*" in plaintext
+
+
+@pytest.mark.benchmark(group="end-to-end")
+def test_write_plaintext_to_file(benchmark, local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=int(10 * SCALE), series_lengths=(int(10 * SCALE),),
+                                      pages_per_story=3)
+    assert author.DownloadMemberPage()
+
+    def write():
+        author.WritePlainTextToFile(str(tmp_path), force_redownload=True)
+
+    benchmark.pedantic(write, rounds=3)
+    assert len(list(tmp_path.rglob("*.txt"))) == int(20 * SCALE) + 1
@@ -0,0 +1,111 @@
+from synthetic_site import add_member
+import litscrap
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("bs4", "lxml", "requests", "urllib3", "asyncio", "django", "multiprocessing", "aiohttp", "pyarrow")
+
+# Seconds allowed for importing the library; measured at about 0.05s, so this leaves room for slow machines
+IMPORT_BUDGET = float(os.environ.get("LITSCRAP_IMPORT_BUDGET", "0.5"))
+
+
+def run_python(code, *args):
+    result = subprocess.run([sys.executable, "-c", code] + list(args), cwd=HERE, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def test_import_is_lazy_and_within_budget():
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import LiteroticaMemberPage, LiteroticaStoryPage, LiteroticaBatch, LiteroticaEpub, litscrap\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(elapsed)\n"
+            "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))\n")
+    elapsed, modules = run_python(code).splitlines()
+    assert not set(HEAVY_MODULES) & set(modules.split())
+    assert float(elapsed) < IMPORT_BUDGET
+
+
+def test_member_sync_then_list(local_site, tmp_path, capsys):
+    url = add_member(local_site, 7, member_name="CLI Author", individual_count=2, series_lengths=(2,))
+    cache = str(tmp_path / "cache")
+
+    assert litscrap.main(["member", "7", "--output", str(tmp_path), "--url", url, "--cache", cache]) == 0
+    assert "CLI Author (7): 4 new, 0 changed, 0 unchanged, 0 removed, 0 failed" in capsys.readouterr().out
+    assert (tmp_path / "7" / "story-1.txt").exists()
+
+    # Fresh pages come from the cache, and requests isn't even imported
+    local_site.Requests.clear()
+    code = ("import sys, litscrap\n"
+            "code = litscrap.main(sys.argv[1:])\n"
+            "print('requests' in sys.modules)\n")
+    out = run_python(code, "member", "7", "--output", str(tmp_path), "--url", url, "--cache", cache)
+    assert "4 unchanged" in out and out.splitlines()[-1] == "False"
+    assert local_site.Requests == []
+
+    listing = run_python("import sys, litscrap\nlitscrap.main(sys.argv[1:])\nprint(sorted(m for m in sys.modules if m.split('.')[0] in %r))" % (HEAVY_MODULES,),
+                         "member", "7", "--output", str(tmp_path), "--list")
+    lines = listing.splitlines()
+    assert lines[-1] == "[]"
+    assert len(lines) == 5
+    assert lines[0].split("\t")[:3] == ["Story 1", "", "2"]
+    assert lines[2].split("\t")[:2] == ["Series 1 Ch. 01", "Series 1"]
+
+
+def test_list_without_sync(tmp_path, capsys):
+    assert litscrap.main(["member", "8", "--output", str(tmp_path), "--list"]) == 1
+    assert "No sync recorded" in capsys.readouterr().err
+
+
+def test_member_reprocess(local_site, tmp_path, capsys):
+    url = add_member(local_site, 9, member_name="Raw Author", individual_count=1, series_lengths=(2,))
+    assert litscrap.main(["member", "9", "--output", str(tmp_path), "--url", url, "--keep-raw"]) == 0
+    (tmp_path / "9" / "story-1.txt").unlink()
+
+    local_site.Requests.clear()
+    assert litscrap.main(["member", "9", "--output", str(tmp_path), "--reprocess", "--processes", "0"]) == 0
+    assert "Raw Author (9): 3 stories rebuilt, 0 failed" in capsys.readouterr().out
+    assert (tmp_path / "9" / "story-1.txt").exists() and local_site.Requests == []
+
+
+def test_member_sync_fills_index(local_site, tmp_path):
+    from LiteroticaSearchIndex import LiteroticaSearchIndex
+
+    url = add_member(local_site, 10, member_name="Indexed Author", individual_count=2, series_lengths=(1,))
+    index_path = str(tmp_path / "index.sqlite")
+    assert litscrap.main(["member", "10", "--output", str(tmp_path), "--url", url, "--index", index_path]) == 0
+    with LiteroticaSearchIndex(index_path) as index:
+        assert len(index) == 3
+        assert [hit.MemberName for hit in index.Search('"Story 1"')] == ["Indexed Author"]
+
+
+def test_member_sync_through_store(local_site, tmp_path, capsys):
+    url = add_member(local_site, 11, individual_count=1, series_lengths=(2,))
+    store = str(tmp_path / "store")
+    for output in ("a", "b"):
+        assert litscrap.main(["member", "11", "--output", str(tmp_path / output), "--url", url, "--store", store]) == 0
+    assert os.path.samefile(tmp_path / "a" / "11" / "story-1.txt", tmp_path / "b" / "11" / "story-1.txt")
+    assert "duplicates linked" in capsys.readouterr().out
+
+
+def test_member_sync_keeps_unparsed_pages_on_disk(local_site, tmp_path, capsys):
+    from LiteroticaPageFormats import PageFormat, register_page_format, unregister_page_format
+    import re
+
+    url = add_member(local_site, 12, individual_count=1, series_lengths=(), pages_per_story=1)
+    local_site.Pages["/s/story-1"] = local_site.Pages["/s/story-1?page=1"] = b'<html><body><div class="zz_q9"><p>Redesigned.</p></div></body></html>'
+    assert litscrap.main(["member", "12", "--output", str(tmp_path), "--url", url]) == 1
+    assert "1 failed" in capsys.readouterr().out
+    assert (tmp_path / ".checkpoint").is_dir()
+
+    # The parser is fixed in a later run: the saved page is parsed from disk, not fetched again
+    register_page_format(PageFormat("future", re.compile(rb'class="zz_q9"'), "zz_q9", re.compile(rb'data-page="(\d+)"')))
+    try:
+        local_site.Requests.clear()
+        assert litscrap.main(["member", "12", "--output", str(tmp_path), "--url", url]) == 0
+    finally:
+        unregister_page_format("future")
+    assert "/s/story-1" not in local_site.Requests
+    assert (tmp_path / "12" / "story-1.txt").read_text() == "Redesigned."
@@ -0,0 +1,72 @@
+from LiteroticaContentStore import LiteroticaContentStore
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaOutput import DirectoryOutput
+from synthetic_site import add_member
+import LiteroticaContentStore as content_store
+import os
+import pytest
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = LiteroticaContentStore(str(tmp_path / "store"))
+    output = DirectoryOutput(store=store, verify="hash")
+    first, second, other = (str(tmp_path / name) for name in ("first.txt", "second.txt", "other.txt"))
+
+    output.WriteText(first, "Once upon a time.")
+    output.WriteText(second, "Once upon a time.")
+    with output.Open(other) as file:  # Written before its content is known
+        file.write("Once upon a time.")
+
+    assert os.path.samefile(first, second) and os.path.samefile(first, other)
+    assert all(output.Exists(path) for path in (first, second, other))
+    assert store.Stats() == content_store.DedupStats(Stored=1, Linked=2, Copied=0, WritesAvoided=1, BytesStored=17, BytesLinked=34)
+    assert store.Usage() == content_store.StoreUsage(Blobs=1, Bytes=17, Links=3)
+
+    # Replacing one file leaves its twins, and the blob, as they were
+    output.WriteText(second, "A different ending.")
+    assert open(first).read() == "Once upon a time." and open(second).read() == "A different ending."
+    assert output.Exists(second) and not os.path.samefile(first, second)
+
+    for path in (first, other):
+        os.remove(path)
+    assert store.Prune() == (1, 17)
+    assert store.Usage() == content_store.StoreUsage(Blobs=1, Bytes=19, Links=1)
+
+
+def test_copies_where_no_link_can_be_made(tmp_path, monkeypatch):
+    store = LiteroticaContentStore(str(tmp_path / "store"))
+    output = DirectoryOutput(store=store)
+    output.WriteText(str(tmp_path / "first.txt"), "Chapter one.")
+
+    def no_link(source, destination):
+        raise PermissionError("no hard links here")
+    monkeypatch.setattr(content_store.os, "link", no_link)
+    monkeypatch.setattr(content_store, "reflink", lambda source, destination: False)
+    output.WriteText(str(tmp_path / "second.txt"), "Chapter one.")
+
+    assert (tmp_path / "second.txt").read_text() == "Chapter one."
+    assert not os.path.samefile(tmp_path / "first.txt", tmp_path / "second.txt")
+    assert store.Stats().Copied == 1 and store.Stats().BytesLinked == 0
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_member_copies_share_the_store(local_site, tmp_path, streaming):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=2, series_lengths=(2,))
+    assert author.DownloadMemberPage()
+    store = LiteroticaContentStore(str(tmp_path / "store"))
+
+    for name in ("first", "second"):
+        assert author.WritePlainTextToFile(str(tmp_path / name), force_redownload=True, streaming=streaming,
+                                           output=DirectoryOutput(store=store))
+        author.WriteCSVToDisk(str(tmp_path / name), DirectoryOutput(store=store))
+
+    written = sorted(path.relative_to(tmp_path / "first") for path in (tmp_path / "first").rglob("*.*")
+                     if not path.name.startswith("."))
+    assert written
+    for rel_path in written:
+        assert os.path.samefile(tmp_path / "first" / rel_path, tmp_path / "second" / rel_path), rel_path
+
+    stats = store.Stats()
+    assert stats.Stored == store.Usage().Blobs and stats.Linked == len(written)
+    assert stats.BytesLinked == sum((tmp_path / "first" / rel_path).stat().st_size for rel_path in written)
@@ -0,0 +1,61 @@
+from LiteroticaDataset import LiteroticaDataset, csv_listing_table, listing_batches, listing_table
+from LiteroticaMemberPage import LiteroticaMemberPage
+from synthetic_site import add_member
+import datetime
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+
+def load_member(site, member_id, **kwargs):
+    author = LiteroticaMemberPage(member_id, parser="lxml")
+    author.MemberPageURL = add_member(site, member_id, member_name=f"Author {member_id:d}", **kwargs)
+    assert author.DownloadMemberPage()
+    return author
+
+
+def test_listing_table_matches_csv(local_site, tmp_path):
+    author = load_member(local_site, 1, individual_count=2, series_lengths=(3,))
+    author.WriteCSVToDisk(str(tmp_path))
+    table = listing_table(author, batch_size=2)
+
+    assert table.schema.field("rating").type == pa.float64() and table.schema.field("date").type == pa.date32()
+    assert [batch.num_rows for batch in listing_batches(author, batch_size=2)] == [2, 2, 1]
+    rows = table.to_pylist()
+    assert rows[0]["series_title"] is None and rows[2]["series_title"] == "Series 1"
+    assert rows[0]["date"] == datetime.date(2023, 1, 2) and rows[0]["rating"] == 4.5
+
+    # Every column but the date comes out as the CSV has it
+    from_csv = csv_listing_table(str(tmp_path / "member_1.csv"))
+    assert from_csv.drop_columns(["date"]).equals(table.drop_columns(["date"]))
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_listings_written_beside_csv(local_site, tmp_path, format):
+    author = load_member(local_site, 1, individual_count=1, series_lengths=(2,))
+    assert author.WriteListingsToDisk(str(tmp_path), format=format)
+
+    path = str(tmp_path / f"member_1.{format}")
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        written = pq.read_table(path)
+    else:
+        written = pa.ipc.open_file(path).read_all()
+    assert written.equals(listing_table(author))
+
+
+def test_dataset_gathers_members(local_site, tmp_path):
+    authors = [load_member(local_site, member_id, individual_count=member_id, series_lengths=(2,)) for member_id in (1, 2, 3)]
+    dataset = LiteroticaDataset(str(tmp_path / "dataset"))
+    dataset.AppendMany(authors[:2])
+    authors[2].WriteCSVToDisk(str(tmp_path))
+    dataset.AppendCSV(str(tmp_path / "member_3.csv"))
+    dataset.Append(authors[0])  # Appending again replaces the member's rows
+
+    assert dataset.MemberIDs() == [1, 2, 3]
+    table = dataset.Table()
+    assert table.num_rows == 3 + 4 + 5
+    counts = {row["member_id"]: row["url_count"] for row in table.group_by("member_id").aggregate([("url", "count")]).to_pylist()}
+    assert counts == {1: 3, 2: 4, 3: 5}
+    import pyarrow.compute as pc
+    assert dataset.Table(columns=["title"], filter=pc.field("member_id") == 2).num_rows == 4
@@ -0,0 +1,84 @@
+from LiteroticaEpub import LiteroticaEpubWriter
+from LiteroticaMemberPage import LiteroticaMemberPage
+from synthetic_site import add_member, add_story
+from lxml import etree
+import os
+import pytest
+import zipfile
+
+
+def test_epub_per_series(local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, member_name="Epub Author", individual_count=1, series_lengths=(3, 2))
+    add_story(local_site, "/s/series-1-ch-2", [["<em>Emphasis</em> &amp; more."], ["Second page."]], title="Series 1 Ch. 02")
+    assert author.DownloadMemberPage()
+
+    paths = LiteroticaEpubWriter(author).WriteAllSeries(str(tmp_path), max_workers=2)
+    assert paths == [str(tmp_path / "series-1.epub"), str(tmp_path / "series-2.epub")]
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
+
+    with zipfile.ZipFile(paths[0]) as book:
+        first = book.infolist()[0]
+        assert (first.filename, first.compress_type) == ("mimetype", zipfile.ZIP_STORED)
+        assert book.read("mimetype") == b"application/epub+zip"
+
+        package = etree.fromstring(book.read("OEBPS/content.opf"))
+        ns = {"opf": "http://www.idpf.org/2007/opf", "dc": "http://purl.org/dc/elements/1.1/"}
+        assert package.findtext(".//dc:title", namespaces=ns) == "Series 1"
+        assert package.findtext(".//dc:creator", namespaces=ns) == "Epub Author"
+        assert package.findtext(".//dc:subject", namespaces=ns) == "Romance"
+        assert package.find(".//opf:meta[@name='calibre:rating']", namespaces=ns).get("content") == "9.0"
+        assert len(package.findall(".//opf:itemref", namespaces=ns)) == 3
+
+        nav = etree.fromstring(book.read("OEBPS/nav.xhtml"))
+        assert [a.text for a in nav.iter("{http://www.w3.org/1999/xhtml}a")] == ["Series 1 Ch. 01", "Series 1 Ch. 02", "Series 1 Ch. 03"]
+
+        chapter = etree.fromstring(book.read("OEBPS/chapter_002.xhtml"))
+        paragraphs = ["".join(p.itertext()) for p in chapter.iter("{http://www.w3.org/1999/xhtml}p")]
+        assert paragraphs == ["Emphasis & more.", "Second page."]
+        assert chapter.find(".//{http://www.w3.org/1999/xhtml}em").text == "Emphasis"
+
+    with zipfile.ZipFile(paths[1]) as book:
+        assert len([name for name in book.namelist() if name.startswith("OEBPS/chapter_")]) == 2
+
+
+def test_epub_from_raw_pages_without_fetching(local_site, tmp_path):
+    author = LiteroticaMemberPage(1, keep_raw=True)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=0, series_lengths=(2,))
+    assert author.DownloadMemberPage()
+    assert author.WritePlainTextToFile(str(tmp_path))
+
+    local_site.Requests.clear()
+    assert LiteroticaEpubWriter(author).WriteAllSeries(str(tmp_path)) == [str(tmp_path / "series-1.epub")]
+    assert local_site.Requests == []
+    with zipfile.ZipFile(str(tmp_path / "series-1.epub")) as book:
+        assert b"Series 1 Ch. 02 page 2 paragraph 2." in book.read("OEBPS/chapter_002.xhtml")
+
+
+def test_epub_from_written_stories_without_fetching(local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=0, series_lengths=(2,))
+    add_story(local_site, "/s/series-1-ch-2", [["<em>Emphasis</em> &amp; more."], ["Second page."]], title="Series 1 Ch. 02")
+    assert author.DownloadMemberPage()
+    fetched = LiteroticaEpubWriter(author).WriteSeries(*author.SeriesStories[0], str(tmp_path / "fetched.epub"))
+
+    assert author.WritePlainTextToFile(str(tmp_path / "out"))
+    local_site.Requests.clear()
+    assert LiteroticaEpubWriter(author).WriteAllSeries(str(tmp_path / "out")) == [str(tmp_path / "out" / "series-1.epub")]
+    assert local_site.Requests == []
+
+    with zipfile.ZipFile(fetched) as from_site, zipfile.ZipFile(str(tmp_path / "out" / "series-1.epub")) as from_disk:
+        for name in ("OEBPS/chapter_001.xhtml", "OEBPS/chapter_002.xhtml"):
+            assert from_disk.read(name) == from_site.read(name)
+        assert b"<p><em>Emphasis</em> &amp; more.</p>" in from_disk.read("OEBPS/chapter_002.xhtml")
+
+
+def test_epub_error_is_not_masked(local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=0, series_lengths=(1,))
+    assert author.DownloadMemberPage()
+    seriesTitle, entries = author.SeriesStories[0]
+    missing = str(tmp_path / "missing" / "series-1.epub")
+    with pytest.raises(FileNotFoundError) as error:
+        LiteroticaEpubWriter(author).WriteSeries(seriesTitle, entries, missing)
+    assert error.value.filename == missing + ".tmp" and error.value.__context__ is None
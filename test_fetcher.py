@@ -0,0 +1,69 @@
+from LiteroticaFetcher import LiteroticaFetcher, PageFetchError
+from LiteroticaStoryPage import LiteroticaStoryPage
+from synthetic_site import add_story
+import pytest
+import requests
+import time
+
+
+def test_connections_are_reused(local_site):
+    url = add_story(local_site, "/s/keep-alive", [["Some text."]] * 6)
+
+    with LiteroticaFetcher() as fetcher:
+        for _ in range(2):
+            story = LiteroticaStoryPage(fetcher=fetcher)
+            story.URL = url
+            assert story.DownloadAllPagesNewFormat()
+
+    assert len(local_site.Requests) == 12
+    assert len(local_site.Connections) == 1, "Expected every page to be fetched over one keep-alive connection"
+
+
+def test_transient_errors_are_retried(local_site):
+    local_site.Pages["/flaky"] = b"<html><body>ok</body></html>"
+    local_site.Failures["/flaky"] = 2
+
+    with LiteroticaFetcher(retries=3, backoff_factor=0.01) as fetcher:
+        assert fetcher.Fetch(local_site.URL("/flaky")) == b"<html><body>ok</body></html>"
+    assert local_site.Requests.count("/flaky") == 3
+
+
+def test_missing_page_raises(local_site):
+    with LiteroticaFetcher(retries=0) as fetcher:
+        with pytest.raises(requests.HTTPError):
+            fetcher.Fetch(local_site.URL("/does-not-exist"))
+
+
+def test_fetch_page_backs_off_on_transient_errors_only(local_site):
+    local_site.Pages["/flaky"] = b"<html><body>ok</body></html>"
+    local_site.Failures["/flaky"] = 2
+
+    with LiteroticaFetcher(retries=0, page_retries=2, page_backoff=0.01) as fetcher:
+        assert fetcher.FetchPage(local_site.URL("/flaky")) == b"<html><body>ok</body></html>"
+        assert all(0 <= fetcher.BackoffDelay(attempt) <= 0.01 * 2 ** attempt for attempt in range(5))
+
+        with pytest.raises(PageFetchError) as error:
+            fetcher.FetchPage(local_site.URL("/does-not-exist"))
+    assert error.value.Attempts == 1 and isinstance(error.value.Cause, requests.HTTPError)
+    assert local_site.Requests.count("/flaky") == 3 and local_site.Requests.count("/does-not-exist") == 1
+
+
+def test_politeness_delay(local_site):
+    local_site.Pages["/page"] = b"<html></html>"
+
+    with LiteroticaFetcher(politeness_delay=0.05) as fetcher:
+        start = time.monotonic()
+        for _ in range(4):
+            fetcher.Fetch(local_site.URL("/page"))
+        assert time.monotonic() - start >= 3 * 0.05
+
+
+def test_global_rate_limit_spans_hosts(local_site):
+    local_site.Pages["/page"] = b"<html></html>"
+    urls = [local_site.URL("/page"), local_site.URL("/page").replace("127.0.0.1", "localhost")]
+
+    with LiteroticaFetcher(max_requests_per_second=20) as fetcher:
+        start = time.monotonic()
+        for i in range(4):
+            fetcher.Fetch(urls[i % 2])
+        assert time.monotonic() - start >= 3 * 0.05
@@ -0,0 +1,76 @@
+from LiteroticaFetcher import LiteroticaFetcher
+from LiteroticaInstrumentation import LiteroticaInstrumentation, StatsSink, JSONLSink, LoggingSink, NO_INSTRUMENTATION
+from LiteroticaMemberPage import LiteroticaMemberPage
+from synthetic_site import add_member
+import json
+import logging
+
+
+def test_member_run_is_recorded(local_site, tmp_path):
+    stats = StatsSink()
+    trace_path = str(tmp_path / "trace.jsonl")
+    instrumentation = LiteroticaInstrumentation([stats, JSONLSink(trace_path)])
+
+    with LiteroticaFetcher(instrumentation=instrumentation) as fetcher:
+        author = LiteroticaMemberPage(7, fetcher=fetcher)
+        author.MemberPageURL = add_member(local_site, 7, individual_count=2, series_lengths=(2,))
+        assert author.DownloadMemberPage()
+        author.WritePlainTextToFile(str(tmp_path))
+    instrumentation.Close()
+
+    assert stats.FetchCount == len(local_site.Requests)
+    assert stats.BytesFetched == sum(len(local_site.Pages[path]) for path in local_site.Requests)
+    assert stats.Retries == 0
+    assert stats.StageCounts["download"] == 4
+    assert stats.StageCounts["write"] == 4
+    assert stats.StageCounts["parse"] == 1 + 4 * 2  # Member page, then each story page
+    assert stats.StageCounts["markdown"] == 4 * 2
+    assert set(stats.MemberSeconds[7]) == {"parse", "member_parse", "download", "markdown", "write"}
+    assert stats.MemberFetches == {7: stats.FetchCount} and stats.MemberBytes == {7: stats.BytesFetched}
+
+    with open(trace_path) as file:
+        events = [json.loads(line) for line in file]
+    assert len(events) == len(stats.Events)
+    assert {event["event"] for event in events} == {"fetch", "stage"}
+
+
+def test_network_totals_per_member(local_site, tmp_path):
+    stats = StatsSink()
+    with LiteroticaFetcher(instrumentation=LiteroticaInstrumentation([stats])) as fetcher:
+        for memberID, stories in ((1, 1), (2, 3)):
+            author = LiteroticaMemberPage(memberID, fetcher=fetcher)
+            author.MemberPageURL = add_member(local_site, memberID, individual_count=stories, series_lengths=(),
+                                              pages_per_story=3)
+            assert author.DownloadMemberPage()
+            # Pipelined, so the pages are fetched on download threads outside any stage
+            assert author.WritePlainTextToFile(str(tmp_path / str(memberID)), pipelined=True, max_workers=3, parse_processes=0)
+
+    assert stats.MemberFetches == {1: 1 + 1 * 3, 2: 1 + 3 * 3}
+    assert sum(stats.MemberBytes.values()) == stats.BytesFetched
+    assert "member 2: 10 fetches" in stats.Summary()
+
+
+def test_retries_are_counted(local_site):
+    local_site.Pages["/flaky"] = b"<html></html>"
+    local_site.Failures["/flaky"] = 1
+    stats = StatsSink()
+
+    with LiteroticaFetcher(backoff_factor=0.01, instrumentation=LiteroticaInstrumentation([stats])) as fetcher:
+        fetcher.Fetch(local_site.URL("/flaky"))
+    assert stats.FetchCount == 1
+    assert stats.Retries == 1
+
+
+def test_logging_summary(caplog):
+    instrumentation = LiteroticaInstrumentation([LoggingSink()])
+    with instrumentation.Stage("parse", member=3):
+        pass
+    with caplog.at_level(logging.INFO, logger="litscrap"):
+        instrumentation.Close()
+    assert "parse: 1 x" in caplog.text
+    assert "member 3: parse" in caplog.text
+
+
+def test_disabled_instrumentation_is_a_no_op():
+    assert not NO_INSTRUMENTATION.Enabled
+    assert NO_INSTRUMENTATION.Stage("parse") is NO_INSTRUMENTATION.Stage("write")
@@ -0,0 +1,80 @@
+from LiteroticaLayout import series_slug, slugify
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaOutput import DirectoryOutput
+from synthetic_site import add_member
+import os
+import pytest
+
+SLUG_CASES = ["Series 1: 3 Part Series", "  Héllo, Wörld!  ", "The Cat's -- Pyjamas", "Ünïcödé — dashes – and “quotes”",
+              "___leading and trailing___", "tabs\tand\nnewlines", "Ch. 01", "日本語 title", "", "a--b  c__d", "Ææ ﬁ ligature ½"]
+
+
+@pytest.mark.parametrize("value", SLUG_CASES)
+def test_slugify_matches_django(value):
+    django_text = pytest.importorskip("django.utils.text")
+    assert slugify(value) == django_text.slugify(value)
+
+
+def test_series_slug():
+    assert series_slug("Summer Camp: 12 Part Series") == "summer-camp"
+    assert series_slug("Summer Camp: 12 Part Series") is series_slug("Summer Camp: 12 Part Series")
+
+
+def test_layout_and_directory_scan(local_site, tmp_path, monkeypatch):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=2, series_lengths=(2, 1))
+    assert author.DownloadMemberPage()
+
+    layout = author.Layout(str(tmp_path))
+    assert [series.Slug for series in layout.Series] == ["series-1", "series-2"]
+    assert layout.SeriesFor("Series 2: 1 Part Series").TextPath == str(tmp_path / "series-2.txt")
+    assert layout.StoryDirectory(author.SeriesStories[0][1][1]) == str(tmp_path / "series-1")
+    assert layout.Directories() == [str(tmp_path), str(tmp_path / "series-1"), str(tmp_path / "series-2")]
+
+    assert author.WritePlainTextToFile(str(tmp_path))
+
+    # A second run answers every "already have it" check from one scan per directory
+    scanned = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path=".": scanned.append(path) or real_scandir(path))
+    monkeypatch.setattr(os.path, "getsize", lambda path: pytest.fail("Unexpected stat of " + path))
+    local_site.Requests.clear()
+    assert author.WritePlainTextToFile(str(tmp_path))
+    assert local_site.Requests == []
+    assert sorted(scanned) == sorted([str(tmp_path.parent), str(tmp_path)] + layout.Directories())
+
+
+def test_preloaded_listing_sees_new_writes(tmp_path):
+    output = DirectoryOutput()
+    path = str(tmp_path / "story.txt")
+    output.Preload([str(tmp_path)])
+    assert not output.Exists(path)
+    output.WriteText(path, "text")
+    assert output.Exists(path)
+    output.Forget([str(tmp_path)])
+    assert output.Exists(path)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_warm_rerun_reads_no_sidecars(local_site, tmp_path, monkeypatch, streaming):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=4, series_lengths=(3, 2))
+    assert author.DownloadMemberPage()
+    assert author.WritePlainTextToFile(str(tmp_path), streaming=streaming)
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=4, series_lengths=(3, 2))
+    assert author.DownloadMemberPage()
+
+    # Every story is already written: "already have it" is answered from one listing and one journal per directory
+    opened, statted = [], []
+    real_open, real_stat = open, os.stat
+    monkeypatch.setattr("builtins.open", lambda file, *args, **kwargs: opened.append(str(file)) or real_open(file, *args, **kwargs))
+    monkeypatch.setattr(os, "stat", lambda path, *args, **kwargs: statted.append(str(path)) or real_stat(path, *args, **kwargs))
+    local_site.Requests.clear()
+    assert author.WritePlainTextToFile(str(tmp_path), streaming=streaming)
+    monkeypatch.undo()
+    assert local_site.Requests == []
+    assert [path for path in opened if path.endswith(".check")] == []
+    assert [path for path in statted if not os.path.isdir(path)] == []  # Only makedirs looks at the directories
+    journals = [path for path in opened if path.endswith(".checks")]
+    assert sorted(set(journals)) == sorted(os.path.join(directory, ".checks") for directory in author.Layout(str(tmp_path)).Directories())
@@ -1,4 +1,8 @@
+from LiteroticaFetcher import LiteroticaFetcher
 from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaOutput import DirectoryOutput
+from LiteroticaStoryPage import LiteroticaStoryListing
+from synthetic_site import add_member, make_listing_rows, make_member_page
 import pytest
 import os
 import glob
@@ -40,3 +44,236 @@ def test_author_write(author_id=AUTHOR_ID):
 
     author.WriteToDisk(member_dir)
     assert len(glob.glob(os.path.join(member_dir,'*.html'))) > 0, "No HTML files written"
+
+
+def load_local_member(site, member_id=1, keep_raw=False, **kwargs):
+    url = add_member(site, member_id, **kwargs)
+    author = LiteroticaMemberPage(member_id, keep_raw=keep_raw)
+    author.MemberPageURL = url
+    assert author.DownloadMemberPage(), "Error loading local author page"
+    return author
+
+
+@pytest.mark.parametrize("parse_processes", [0, 2])
+def test_pipelined_write_matches_sequential(local_site, tmp_path, parse_processes):
+    author = load_local_member(local_site, individual_count=3, series_lengths=(4, 2))
+    assert len(author.IndividualStories) == 3
+    assert [len(entries) for _, entries in author.SeriesStories] == [4, 2]
+
+    sequential_dir = tmp_path / "sequential"
+    pipelined_dir = tmp_path / "pipelined"
+    sequential_dir.mkdir()
+    pipelined_dir.mkdir()
+
+    author.WritePlainTextToFile(str(sequential_dir), force_redownload=True)
+    assert author.WritePlainTextToFile(str(pipelined_dir), force_redownload=True, pipelined=True,
+                                       max_workers=3, parse_processes=parse_processes)
+    assert len(author.DownloadResults) == 9
+    assert all(result.Success for result in author.DownloadResults)
+
+    sequential_files = sorted(p.relative_to(sequential_dir) for p in sequential_dir.rglob("*.txt"))
+    pipelined_files = sorted(p.relative_to(pipelined_dir) for p in pipelined_dir.rglob("*.txt"))
+    assert sequential_files == pipelined_files
+    for rel_path in sequential_files:
+        assert (sequential_dir / rel_path).read_text() == (pipelined_dir / rel_path).read_text()
+
+    series_text = (pipelined_dir / "series-1.txt").read_text()
+    chapter_positions = [series_text.index(f"Series 1 Ch. {c:02d} page 1") for c in range(1, 5)]
+    assert chapter_positions == sorted(chapter_positions), "Series chapters out of order"
+
+
+def test_pipelined_write_reports_failures(local_site, tmp_path):
+    author = load_local_member(local_site, individual_count=2, series_lengths=(2,))
+    del local_site.Pages["/s/series-1-ch-2"]
+
+    assert not author.WritePlainTextToFile(str(tmp_path), pipelined=True, parse_processes=0)
+
+    failures = [result for result in author.DownloadResults if not result.Success]
+    assert [result.FileName for result in failures] == ["series-1-ch-2.html"]
+    assert (tmp_path / "story-1.txt").exists() and (tmp_path / "story-2.txt").exists()
+    assert not (tmp_path / "series-1.txt").exists(), "Incomplete series should not be written"
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_reprocess_rebuilds_from_raw_pages(local_site, tmp_path, streaming):
+    author = load_local_member(local_site, keep_raw=True, individual_count=2, series_lengths=(3,))
+    assert author.WritePlainTextToFile(str(tmp_path), streaming=streaming)
+    author.WriteCSVToDisk(str(tmp_path))
+    written = {p.relative_to(tmp_path): p.read_bytes() for p in tmp_path.rglob("*") if p.suffix in (".txt", ".html", ".csv")}
+    assert (tmp_path / "member_1.raw.gz").exists() and (tmp_path / "series-1" / "series-1-ch-1.raw.gz").exists()
+
+    for path in written:
+        (tmp_path / path).unlink()
+    local_site.Requests.clear()
+
+    # A fresh member page loads itself from the raw copy; nothing is fetched
+    rebuilt = LiteroticaMemberPage(1)
+    assert rebuilt.Reprocess(str(tmp_path), parse_processes=0 if streaming else 2)
+    assert local_site.Requests == []
+    assert len(rebuilt.DownloadResults) == 5
+    assert {p.relative_to(tmp_path): p.read_bytes() for p in tmp_path.rglob("*") if p.suffix in (".txt", ".html", ".csv")} == written
+
+
+def test_reprocess_bounds_stories_in_memory(local_site, tmp_path):
+    author = load_local_member(local_site, keep_raw=True, individual_count=12, series_lengths=(3,))
+    assert author.WritePlainTextToFile(str(tmp_path))
+
+    class CountingOutput(DirectoryOutput):
+        # Raw pages read, less stories written, at the worst point
+        def __init__(self):
+            super().__init__()
+            self.Ahead = self.MostAhead = 0
+
+        def ReadBytes(self, path):
+            self.Ahead += path.endswith(".raw.gz")
+            self.MostAhead = max(self.MostAhead, self.Ahead)
+            return super().ReadBytes(path)
+
+        def WriteText(self, path, text):
+            self.Ahead -= path.endswith(".txt") and os.path.basename(path) != "series-1.txt"
+            super().WriteText(path, text)
+
+    output = CountingOutput()
+    rebuilt = LiteroticaMemberPage(1)
+    assert rebuilt.Reprocess(str(tmp_path), parse_processes=1, output=output)
+    assert output.MostAhead <= 2 + 1, "Raw pages should be read only as the parses are needed"
+    assert (tmp_path / "series-1.txt").read_text().count("paragraph 0.") == 3 * 2
+
+
+def test_reprocess_reports_stories_without_raw_pages(local_site, tmp_path):
+    author = load_local_member(local_site, keep_raw=True, individual_count=1, series_lengths=(2,))
+    assert author.WritePlainTextToFile(str(tmp_path))
+    (tmp_path / "series-1" / "series-1-ch-2.raw.gz").unlink()
+    (tmp_path / "series-1.txt").unlink()
+
+    assert not author.Reprocess(str(tmp_path), parse_processes=0)
+    assert [result.FileName for result in author.DownloadResults if not result.Success] == ["series-1-ch-2.html"]
+    assert not (tmp_path / "series-1.txt").exists()
+
+
+def test_sync_fetches_only_new_and_changed(local_site, tmp_path):
+    author = load_local_member(local_site, individual_count=2, series_lengths=(3,))
+    report = author.SyncToDirectory(str(tmp_path))
+    assert len(report.New) == 5 and not report.Changed and not report.Unchanged
+    assert (tmp_path / "series-1.txt").exists() and (tmp_path / "member_1.csv").exists()
+
+    # Nothing changed: only the member page is fetched again
+    author = load_local_member(local_site, individual_count=2, series_lengths=(3,))
+    csv_mtime = os.path.getmtime(tmp_path / "member_1.csv")
+    del local_site.Requests[:]
+    report = author.SyncToDirectory(str(tmp_path))
+    assert len(report.Unchanged) == 5 and not report.New and not report.Changed
+    assert local_site.Requests == []
+    assert os.path.getmtime(tmp_path / "member_1.csv") == csv_mtime
+
+    # One revised listing and one new story
+    url = add_member(local_site, 1, individual_count=3, series_lengths=(3,))
+    path = "/stories/memberpage.php?uid=1&page=submissions"
+    local_site.Pages[path] = local_site.Pages[path].replace(b"About Series 1 Ch. 02", b"About Series 1 Ch. 02, revised")
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = url
+    assert author.DownloadMemberPage()
+    del local_site.Requests[:]
+    report = author.SyncToDirectory(str(tmp_path))
+
+    assert report.New == [local_site.URL("/s/story-3")]
+    assert report.Changed == [local_site.URL("/s/series-1-ch-2")]
+    assert len(report.Unchanged) == 4
+    assert sorted(set(local_site.Requests)) == ["/s/series-1-ch-2", "/s/series-1-ch-2?page=2",
+                                                "/s/story-3", "/s/story-3?page=2"]
+    series_text = (tmp_path / "series-1.txt").read_text()
+    assert series_text.index("Series 1 Ch. 01") < series_text.index("Series 1 Ch. 02") < series_text.index("Series 1 Ch. 03")
+
+
+def test_sync_records_stories_around_a_failure(local_site, tmp_path):
+    author = load_local_member(local_site, individual_count=3, series_lengths=(2,))
+    local_site.Failures.update({"/s/story-3": 100, "/s/series-1-ch-2": 100})
+    with LiteroticaFetcher(page_retries=0) as fetcher:
+        author.Fetcher = fetcher
+        report = author.SyncToDirectory(str(tmp_path))
+    local_site.Failures.clear()
+
+    assert report.Failed == [local_site.URL("/s/story-3"), local_site.URL("/s/series-1-ch-2")]
+    assert [error["url"] for error in author.StoryErrors()] == report.Failed
+    assert (tmp_path / "story-1.txt").exists() and (tmp_path / "member_1.csv").exists()
+    assert not (tmp_path / "series-1.txt").exists(), "Incomplete series should not be written"
+
+    # Only the stories which failed are downloaded again
+    author = load_local_member(local_site, individual_count=3, series_lengths=(2,))
+    del local_site.Requests[:]
+    report = author.SyncToDirectory(str(tmp_path))
+    assert report.New == [local_site.URL("/s/story-3"), local_site.URL("/s/series-1-ch-2")] and not report.Failed
+    assert len(report.Unchanged) == 3
+    assert sorted(set(local_site.Requests)) == ["/s/series-1-ch-2", "/s/series-1-ch-2?page=2", "/s/story-3", "/s/story-3?page=2"]
+    assert (tmp_path / "series-1.txt").exists()
+
+
+def test_streaming_write_matches_buffered(local_site, tmp_path):
+    author = load_local_member(local_site, individual_count=2, series_lengths=(3,), pages_per_story=3)
+    buffered_dir = tmp_path / "buffered"
+    streaming_dir = tmp_path / "streaming"
+    buffered_dir.mkdir()
+    streaming_dir.mkdir()
+
+    author.WritePlainTextToFile(str(buffered_dir), force_redownload=True)
+    assert author.WritePlainTextToFile(str(streaming_dir), force_redownload=True, streaming=True)
+
+    for rel_path in [p.relative_to(buffered_dir) for p in buffered_dir.rglob("*.*") if p.name != ".checks"]:  # Records in write order
+        assert (buffered_dir / rel_path).read_text() == (streaming_dir / rel_path).read_text(), rel_path
+    assert all(isinstance(story, LiteroticaStoryListing) for story in author.IndividualStories)
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_lxml_parser_matches_bs4(local_site, pretty):
+    rows = make_listing_rows(50)
+    rows[3]["rating"] = "x.xx"
+    rows[4]["url"] = "https://www.literotica.com/stories/showstory.php?id=12345"
+    rows[5]["title"] = "Tricky &amp; <em>Emphasised</em> Title"
+    series = [("First Saga: 3 Part Series", make_listing_rows(3, prefix="first")),
+              ("Second Saga: 2 Part Series", make_listing_rows(2, prefix="second"))]
+    page = make_member_page("Parser Parity", rows, series)
+    if pretty:  # Rows on lines of their own, as the live site serves them
+        page = page.replace(b"<tr", b"\n    <tr").replace(b"</table>", b"\n</table>")
+    local_site.Pages["/member"] = page
+
+    parsed = {}
+    for parser in ("bs4", "lxml"):
+        author = LiteroticaMemberPage(1, parser=parser)
+        author.MemberPageURL = local_site.URL("/member")
+        assert author.DownloadMemberPage()
+        parsed[parser] = author
+
+    def listing(story):
+        return (story.URL, story.FileName, story.Title, story.Rating, story.Category, story.SecondaryLine, story.Date,
+                story.SeriesTitle)
+
+    assert parsed["lxml"].MemberName == parsed["bs4"].MemberName == "Parser Parity"
+    assert [listing(s) for s in parsed["lxml"].IndividualStories] == [listing(s) for s in parsed["bs4"].IndividualStories]
+    assert len(parsed["lxml"].IndividualStories) == 50
+    for (lxml_title, lxml_entries), (bs4_title, bs4_entries) in zip(parsed["lxml"].SeriesStories, parsed["bs4"].SeriesStories):
+        assert lxml_title == bs4_title
+        assert [listing(s) for s in lxml_entries] == [listing(s) for s in bs4_entries]
+    assert [len(entries) for _, entries in parsed["lxml"].SeriesStories] == [3, 2]
+
+
+@pytest.mark.parametrize("parser", ["bs4", "lxml"])
+def test_listings_are_compact_and_page_is_released(local_site, parser):
+    author = LiteroticaMemberPage(1, parser=parser)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=2, series_lengths=(2,))
+    assert author.DownloadMemberPage()
+
+    assert author._LiteroticaMemberPage__html is None
+    assert author._LiteroticaMemberPage__soup is None
+    assert author._LiteroticaMemberPage__tree is None
+    assert author.SeriesTitles() == ["Series 1: 2 Part Series"]
+
+    listings = author.IndividualStories + [story for _, entries in author.SeriesStories for story in entries]
+    assert len(listings) == 4
+    for listing in listings:
+        assert not hasattr(listing, "__dict__")
+        for field in ("URL", "FileName", "Title", "Category", "SecondaryLine", "Date"):
+            assert type(getattr(listing, field)) is str, field
+
+    story = author.StoryPage(author.SeriesStories[0][1][0])
+    assert story.Fetcher is author.Fetcher
+    assert (story.URL, story.Title, story.SeriesTitle) == (listings[2].URL, "Series 1 Ch. 01", "Series 1: 2 Part Series")
@@ -0,0 +1,167 @@
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaOutput import ArchiveOutput, DirectoryOutput
+from LiteroticaStoryPage import LiteroticaStoryPage
+from synthetic_site import add_member, add_story
+import os
+import pytest
+import zipfile
+
+
+def test_interrupted_write_leaves_nothing(tmp_path):
+    path = str(tmp_path / "story.txt")
+    output = DirectoryOutput()
+
+    with pytest.raises(RuntimeError):
+        with output.Open(path) as file:
+            file.write("half a sto")
+            raise RuntimeError("interrupted")
+
+    assert os.listdir(str(tmp_path)) == []
+    assert not output.Exists(path)
+
+
+def test_sidecar_catches_truncated_files(tmp_path):
+    path = str(tmp_path / "story.txt")
+    output = DirectoryOutput()
+    output.WriteText(path, "Café society.\n" * 100)
+    assert output.Exists(path)
+    assert DirectoryOutput(verify="hash").Exists(path)
+
+    with open(path, "r+b") as file:
+        file.truncate(50)
+    assert not output.Exists(path)
+
+    # Same size but different content is only caught by hashing
+    output.WriteText(path, "abc")
+    with open(path, "wb") as file:
+        file.write(b"xyz")
+    assert output.Exists(path)
+    assert not DirectoryOutput(verify="hash").Exists(path)
+
+
+def test_truncated_story_is_downloaded_again(local_site, tmp_path):
+    url = add_story(local_site, "/s/truncated", [["First page."], ["Second page."]])
+    story = LiteroticaStoryPage()
+    story.URL = url
+    story.FileName = "truncated.html"
+    story.DownloadAndWriteStory(str(tmp_path))
+    _, plaintext_fname = story.StoryFilePaths(str(tmp_path))
+
+    with open(plaintext_fname, "w") as file:
+        file.write("First")
+    local_site.Requests.clear()
+
+    reloaded = LiteroticaStoryPage()
+    reloaded.URL = url
+    reloaded.FileName = "truncated.html"
+    reloaded.DownloadAndWriteStory(str(tmp_path))
+    assert local_site.Requests == ["/s/truncated", "/s/truncated?page=2"]
+    assert reloaded.PlainText == "First page.\n\nSecond page."
+
+
+def test_background_writes_match_foreground(local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=3, series_lengths=(3,))
+    assert author.DownloadMemberPage()
+
+    foreground_dir = tmp_path / "foreground"
+    background_dir = tmp_path / "background"
+    foreground_dir.mkdir()
+    background_dir.mkdir()
+
+    author.WritePlainTextToFile(str(foreground_dir), force_redownload=True)
+    author.WriteCSVToDisk(str(foreground_dir))
+    with DirectoryOutput(background=True, max_pending=2) as output:
+        assert author.WritePlainTextToFile(str(background_dir), force_redownload=True, output=output)
+        author.WriteCSVToDisk(str(background_dir), output)
+
+    foreground_files = sorted(p.relative_to(foreground_dir) for p in foreground_dir.rglob("*"))
+    assert foreground_files == sorted(p.relative_to(background_dir) for p in background_dir.rglob("*"))
+    assert not any(".tmp" in str(p) for p in foreground_files)
+    for rel_path in foreground_files:
+        if (foreground_dir / rel_path).is_file():
+            assert (foreground_dir / rel_path).read_bytes() == (background_dir / rel_path).read_bytes(), rel_path
+
+
+def test_background_write_errors_are_raised(tmp_path):
+    output = DirectoryOutput(background=True)
+    output.WriteText(str(tmp_path / "missing" / "story.txt"), "text")
+    with pytest.raises(FileNotFoundError):
+        output.Flush()
+    output.Close()
+
+
+@pytest.mark.parametrize("options", [{}, {"streaming": True}, {"pipelined": True, "parse_processes": 0}])
+def test_archive_matches_directory(local_site, tmp_path, options):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=2, series_lengths=(3,))
+    assert author.DownloadMemberPage()
+
+    directory = tmp_path / "directory"
+    directory.mkdir()
+    author.WritePlainTextToFile(str(directory), force_redownload=True)
+    author.WriteCSVToDisk(str(directory))
+
+    archive_path = str(tmp_path / "member_1.zip")
+    assert author.WriteArchive(archive_path, **options)
+    assert sorted(os.listdir(str(tmp_path))) == ["directory", "member_1.zip"]
+
+    with zipfile.ZipFile(archive_path) as archive:
+        names = sorted(archive.namelist())
+        assert names == sorted(str(p.relative_to(directory)) for p in directory.rglob("*.*") if not p.name.startswith("."))
+        for name in names:
+            assert archive.read(name) == (directory / name).read_bytes(), name
+
+
+def test_archive_skips_stories_it_already_has(local_site, tmp_path):
+    author = LiteroticaMemberPage(1)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=2, series_lengths=(2,))
+    assert author.DownloadMemberPage()
+    archive_path = str(tmp_path / "member_1.zip")
+    assert author.WriteArchive(archive_path)
+
+    local_site.Requests.clear()
+    assert author.WriteArchive(archive_path)
+    assert local_site.Requests == []
+
+    with ArchiveOutput(archive_path, str(tmp_path)) as output:
+        assert output.Exists(str(tmp_path / "series-1" / "series-1-ch-2.txt"))
+        assert "Story 2 page 2 paragraph 2." in output.ReadText(str(tmp_path / "story-2.txt"))
+
+    # Rewriting a story replaces its entry rather than adding a second one
+    assert author.WriteArchive(archive_path, force_redownload=True)
+    with zipfile.ZipFile(archive_path) as archive:
+        names = archive.namelist()
+    assert len(names) == len(set(names)) == 10
+
+
+def test_archive_keeps_raw_pages_for_reprocess(local_site, tmp_path):
+    author = LiteroticaMemberPage(1, keep_raw=True)
+    author.MemberPageURL = add_member(local_site, 1, individual_count=1, series_lengths=(2,))
+    assert author.DownloadMemberPage()
+    archive_path = str(tmp_path / "member_1.zip")
+    assert author.WriteArchive(archive_path, pipelined=True, parse_processes=0)
+    with zipfile.ZipFile(archive_path) as archive:
+        before = {name: archive.read(name) for name in archive.namelist()}
+    assert "member_1.raw.gz" in before and "series-1/series-1-ch-2.raw.gz" in before
+
+    local_site.Requests.clear()
+    with ArchiveOutput(archive_path, str(tmp_path)) as output:
+        assert LiteroticaMemberPage(1).Reprocess(str(tmp_path), parse_processes=0, output=output)
+    assert local_site.Requests == []
+    with zipfile.ZipFile(archive_path) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == before
+
+
+@pytest.mark.parametrize("previous", [False, True])
+def test_archive_read_of_missing_entry(tmp_path, previous):
+    archive_path = str(tmp_path / "member.zip")
+    if previous:
+        with ArchiveOutput(archive_path, str(tmp_path)) as output:
+            output.WriteText(str(tmp_path / "kept.txt"), "Kept.")
+    with ArchiveOutput(archive_path, str(tmp_path)) as output:
+        for read in (output.ReadBytes, output.ReadText, output.OpenRead):
+            with pytest.raises(FileNotFoundError):
+                read(str(tmp_path / "missing.txt"))
+        if previous:
+            assert output.ReadText(str(tmp_path / "kept.txt")) == "Kept."
@@ -0,0 +1,70 @@
+from LiteroticaPageFormats import PageFormat, page_count, page_format, register_page_format, sniff_page_format, unregister_page_format
+from LiteroticaStoryPage import LiteroticaStoryPage, UnrecognisedPageError
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaFetcher import LiteroticaFetcher
+from synthetic_site import add_story
+import os
+import pytest
+import re
+
+
+def make_legacy_page(page_count, paragraphs):
+    # The pre-2023 layout: body in "b-story-body-x x-r15", page count in the "b-pager-caption-t r-d45" caption
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    return (f'<html><head><title>Old Story</title></head><body>'
+            f'<span class="b-pager-caption-t r-d45"><span>x</span>{page_count:d} Pages:</span>'
+            f'<div class="b-story-body-x x-r15"><div>{body}</div></div></body></html>').encode("utf-8")
+
+
+def make_future_page(paragraphs):
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    return f'<html><body><div class="zz_q9">{body}</div></body></html>'.encode("utf-8")
+
+
+def test_sniffer_picks_the_layout(local_site):
+    url = add_story(local_site, "/s/new", [["One."], ["Two."], ["Three."]])
+    new_page = LiteroticaFetcher().Fetch(url)
+    assert sniff_page_format(new_page).Name == "2023-06"
+    assert page_count(new_page, page_format("2023-06")) == 3
+
+    legacy_page = make_legacy_page(7, ["Old."])
+    assert sniff_page_format(legacy_page).Name == "pre-2023"
+    assert page_count(legacy_page, page_format("pre-2023")) == 7
+    assert sniff_page_format(make_future_page(["New."])) is None
+
+
+def test_legacy_layout_downloads_through_the_same_path(local_site):
+    for page_num in (1, 2):
+        local_site.Pages[f"/s/old?page={page_num:d}"] = make_legacy_page(2, [f"Old page {page_num:d}, *part* one.", "Part two."])
+    local_site.Pages["/s/old"] = local_site.Pages["/s/old?page=1"]
+
+    story = LiteroticaStoryPage()
+    story.URL = local_site.URL("/s/old")
+    assert story.DownloadAllPages()
+    assert story.PageCount() == 2
+    assert story.PlainText.split("\n\n") == ["Old page 1, *part* one.", "Part two.", "Old page 2, *part* one.", "Part two."]
+
+
+def test_unrecognised_pages_are_saved_and_reparsed_from_disk(local_site, tmp_path):
+    local_site.Pages["/s/redesigned"] = make_future_page(["Redesigned page."])
+    checkpoint = LiteroticaCheckpoint(str(tmp_path / "checkpoint"))
+    url = local_site.URL("/s/redesigned")
+
+    story = LiteroticaStoryPage(checkpoint=checkpoint)
+    story.URL = url
+    with pytest.raises(UnrecognisedPageError):
+        story.DownloadAllPagesNewFormat()
+    assert checkpoint.Unparsed() == [(url, 1, "no registered page format matches")]
+
+    # The parser is fixed by registering the new layout; the saved response is parsed without fetching it again
+    register_page_format(PageFormat("future", re.compile(rb'class="zz_q9"'), "zz_q9", re.compile(rb'data-page="(\d+)"')))
+    try:
+        local_site.Requests.clear()
+        story = LiteroticaStoryPage(checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint")))
+        story.URL = url
+        assert story.DownloadAllPagesNewFormat()
+    finally:
+        unregister_page_format("future")
+    assert local_site.Requests == []
+    assert story.PlainText == "Redesigned page."
+    assert os.listdir(tmp_path / "checkpoint") == []
@@ -0,0 +1,61 @@
+from LiteroticaFetcher import LiteroticaFetcher
+from LiteroticaResponseCache import LiteroticaResponseCache
+from LiteroticaStoryPage import LiteroticaStoryPage
+from synthetic_site import add_story
+import os
+
+
+def test_cache_hit_avoids_network(local_site, tmp_path):
+    url = add_story(local_site, "/s/cached", [["Some text."]] * 3)
+    cache = LiteroticaResponseCache(str(tmp_path / "cache"))
+
+    texts = []
+    for _ in range(2):
+        with LiteroticaFetcher(cache=cache) as fetcher:
+            story = LiteroticaStoryPage(fetcher=fetcher)
+            story.URL = url
+            story.DownloadAllPagesNewFormat()
+            texts.append(story.PlainText)
+
+    assert texts[0] == texts[1]
+    assert len(local_site.Requests) == 3, "Second run should be served entirely from the cache"
+    assert len(cache) == 3
+
+
+def test_stale_entries_are_revalidated(local_site, tmp_path):
+    local_site.Pages["/page"] = b"<html><body>version 1</body></html>"
+    cache = LiteroticaResponseCache(str(tmp_path / "cache"), ttl=0)
+
+    with LiteroticaFetcher(cache=cache) as fetcher:
+        assert fetcher.Fetch(local_site.URL("/page")) == b"<html><body>version 1</body></html>"
+        assert fetcher.Fetch(local_site.URL("/page")) == b"<html><body>version 1</body></html>"
+        assert local_site.NotModified == 1
+
+        local_site.Pages["/page"] = b"<html><body>version 2</body></html>"
+        assert fetcher.Fetch(local_site.URL("/page")) == b"<html><body>version 2</body></html>"
+    assert local_site.NotModified == 1
+
+
+def test_bodies_are_compressed_and_deduplicated(tmp_path):
+    cache = LiteroticaResponseCache(str(tmp_path))
+    body = b"<p>" + b"All work and no play. " * 1000 + b"</p>"
+    cache.Put("http://example.com/a", body)
+    cache.Put("http://example.com/b", body)
+
+    assert cache.Get("http://example.com/b").Body == body
+    assert 0 < cache.Size() < len(body) / 10
+    blob_files = [name for _, _, names in os.walk(str(tmp_path)) for name in names if name.endswith(".z")]
+    assert len(blob_files) == 1
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = LiteroticaResponseCache(str(tmp_path), max_bytes=3100, compression_level=0)
+    for name in ("a", "b", "c"):
+        cache.Put("http://example.com/" + name, name.encode() * 1000)
+    cache.Get("http://example.com/a")  # Use a, so that b is now the oldest
+    cache.Put("http://example.com/d", b"d" * 1000)
+
+    assert cache.Get("http://example.com/b") is None
+    for name in ("a", "c", "d"):
+        assert cache.Get("http://example.com/" + name) is not None
+    assert cache.Size() <= 3100
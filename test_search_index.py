@@ -0,0 +1,87 @@
+from LiteroticaMemberPage import LiteroticaMemberPage
+from LiteroticaSearchIndex import LiteroticaSearchIndex
+from synthetic_site import add_member
+import pytest
+
+
+def write_indexed_member(site, directory, index, streaming=False, pipelined=False, force_redownload=True, **kwargs):
+    author = LiteroticaMemberPage(1, search_index=index)
+    author.MemberPageURL = add_member(site, 1, member_name="Indexed Author", **kwargs)
+    assert author.DownloadMemberPage()
+    assert author.WritePlainTextToFile(str(directory), force_redownload=force_redownload, streaming=streaming, pipelined=pipelined,
+                                       parse_processes=0)
+    return author
+
+
+@pytest.mark.parametrize("mode", ["buffered", "streaming", "pipelined"])
+def test_written_stories_are_indexed(local_site, tmp_path, mode):
+    with LiteroticaSearchIndex(str(tmp_path / "index.sqlite"), batch_size=2) as index:
+        author = write_indexed_member(local_site, tmp_path / "out", index, streaming=mode == "streaming",
+                                      pipelined=mode == "pipelined", individual_count=2, series_lengths=(3,))
+        assert len(index) == 5
+
+        hits = index.Search('"Story 2"')
+        assert [hit.Title for hit in hits] == ["Story 2"]
+        assert hits[0].URL == author.IndividualStories[1].URL
+        assert hits[0].MemberID == 1 and hits[0].MemberName == "Indexed Author"
+        assert hits[0].Category == "Romance" and hits[0].SeriesTitle is None
+        assert hits[0].Matches == 6  # Three paragraphs on each of two pages
+
+        chapters = index.Search("paragraph", seriesTitle="Series 1")
+        assert sorted(hit.Title for hit in chapters) == ["Series 1 Ch. 01", "Series 1 Ch. 02", "Series 1 Ch. 03"]
+        assert index.Search("paragraph", memberID=2) == []
+        assert len(index.Search("paragraph", category="Romance", limit=3)) == 3
+
+        paragraphs = index.SearchParagraphs('"Ch. 02" AND "page 2" AND "paragraph 1"')
+        assert len(paragraphs) == 1
+        assert paragraphs[0].Paragraph == 4 and paragraphs[0].SeriesTitle == "Series 1"
+        assert paragraphs[0].Snippet == "Series 1 [Ch. 02] [page 2] [paragraph 1]."
+
+
+def test_reindexing_is_incremental(local_site, tmp_path):
+    class Story():
+        URL, MemberID, Title, SeriesTitle, Category = "https://example.invalid/s/one", 7, "One", "Saga: 2 Part Series", "Humor"
+        PlainText = "A lighthouse keeper.\n\nA storm comes in."
+
+    path = str(tmp_path / "index.sqlite")
+    with LiteroticaSearchIndex(path) as index:
+        index.Add(Story)
+        assert [hit.SeriesTitle for hit in index.Search("lighthouse")] == ["Saga"]
+
+    with LiteroticaSearchIndex(path) as index:
+        index.Add(Story)  # Unchanged: the paragraphs are kept as they were
+        index.Add(Story, "A lighthouse keeper.\n\nThe rain stops.")
+        assert [hit.Matches for hit in index.Search("lighthouse OR rain")] == [2]
+        assert index.Search("storm") == []
+        assert len(index) == 1
+
+        index.Remove(Story.URL)
+        assert index.Search("lighthouse") == [] and len(index) == 0
+
+
+def test_stories_on_disk_are_read_in_chunks_and_only_when_changed(local_site, tmp_path, monkeypatch):
+    monkeypatch.setattr(LiteroticaSearchIndex, "_LiteroticaSearchIndex__chunkSize", 7)
+    path = str(tmp_path / "index.sqlite")
+    with LiteroticaSearchIndex(path) as index:
+        write_indexed_member(local_site, tmp_path / "out", index, streaming=True, individual_count=1, series_lengths=(2,))
+        assert [hit.Matches for hit in index.Search('"Story 1"')] == [6]
+
+    # Written again, taking the stories already on disk: the sidecar hashes match the index, so no story is read
+    def no_reading(*args):
+        raise AssertionError("an unchanged story was read")
+    monkeypatch.setattr(LiteroticaSearchIndex, "_LiteroticaSearchIndex__ReadParagraphs", no_reading)
+    monkeypatch.setattr(LiteroticaSearchIndex, "_LiteroticaSearchIndex__HashFile", no_reading)
+    with LiteroticaSearchIndex(path) as index:
+        write_indexed_member(local_site, tmp_path / "out", index, streaming=True, force_redownload=False,
+                             individual_count=1, series_lengths=(2,))
+        assert len(index) == 3
+
+
+def test_queue_is_bounded_by_bytes(tmp_path):
+    class Story():
+        URL, MemberID, Title, SeriesTitle, Category = "https://example.invalid/s/long", 7, "Long", None, "Humor"
+        PlainText = "A long paragraph. " * 100
+
+    with LiteroticaSearchIndex(str(tmp_path / "index.sqlite"), batch_bytes=1000) as index:
+        index.Add(Story)
+        assert index.Digest(Story.URL) is not None  # Written without a Flush
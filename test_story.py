@@ -1,8 +1,12 @@
-from LiteroticaStoryPage import LiteroticaStoryPage, convert_inline_tags_to_markdown
+from LiteroticaStoryPage import LiteroticaStoryPage, StoryDownloadError, convert_inline_tags_to_markdown
+from LiteroticaCheckpoint import LiteroticaCheckpoint
+from LiteroticaFetcher import LiteroticaFetcher
+from synthetic_site import add_story
 from bs4 import BeautifulSoup
 import pytest
 import os
 import glob
+import time
 
 STORY_URL = "https://www.literotica.com/s/a-pale-court-in-beauty-and-decay"
 STORY_URL = "https://www.literotica.com/s/loving-husband-1"
@@ -62,6 +66,8 @@ MARKDOWN_CASES = [
          ("<p>Hello<em>, World. </em><b>Fizz </b>buzz.</p>", 'Hello, *World.* **Fizz** buzz.'),
          ("<p>Hello<em>, World. </em>Fizz <b>buzz.</b></p>", 'Hello, *World.* Fizz **buzz.**'),
          ("<p>Hello<em>, World. </em>Fizz<b> buzz</b>.</p>", 'Hello, *World.* Fizz **buzz.**'),
+         ("<p><em>Hello, <b>World</b></em>.</p>", '*Hello, **World**.*'), # Nested inline tags keep their text
+         ("<p><b>Fizz </b><em>buzz</em>.</p>", '**Fizz** *buzz.*'), # Whitespace between adjacent tags is kept regardless of tag type
         ]
 
 @pytest.mark.parametrize("input_html, target_text", MARKDOWN_CASES)
@@ -70,4 +76,120 @@ def test_markdown_converter(input_html, target_text):
     output_soup = BeautifulSoup(output_doc, 'html.parser')
     output_text = output_soup.get_text()
     assert output_text == target_text, "error on %s: %s != %s"%(input_html, output_text, target_text)
-    return
\ No newline at end of file
+    return
+
+
+def test_clean_plaintext_large_document():
+    # Every paragraph of a long concatenation should convert exactly as it would on its own
+    paragraphs = [html for html, _ in MARKDOWN_CASES] * 2000
+    plaintext = LiteroticaStoryPage.clean_plaintext("<div>" + "".join(paragraphs) + "</div>")
+
+    expected = [LiteroticaStoryPage.clean_plaintext(html) for html, _ in MARKDOWN_CASES]
+    expected = [text for text in expected if text != ''] * 2000
+    assert plaintext == '\n\n'.join(expected)
+
+def test_concurrent_pages_in_order(local_site):
+    pages = [[f"Page {i:d} paragraph {j:d}." for j in range(3)] for i in range(1, 9)]
+    url = add_story(local_site, "/s/long-story", pages)
+    local_site.Delay = 0.01
+
+    sequential = LiteroticaStoryPage()
+    sequential.URL = url
+    assert sequential.DownloadAllPagesNewFormat()
+
+    concurrent = LiteroticaStoryPage()
+    concurrent.URL = url
+    assert concurrent.DownloadAllPagesNewFormat(max_workers=4)
+
+    assert concurrent.Text == sequential.Text
+    assert concurrent.PlainText == sequential.PlainText
+    page_positions = [concurrent.PlainText.index(f"Page {i:d} paragraph 0.") for i in range(1, 9)]
+    assert page_positions == sorted(page_positions), "Pages were not re-assembled in order"
+
+
+def test_page_rate_limit(local_site):
+    url = add_story(local_site, "/s/rate-limited", [["Some text."]] * 5)
+    story = LiteroticaStoryPage(fetcher=LiteroticaFetcher(politeness_delay=0.05))
+    story.URL = url
+
+    start = time.monotonic()
+    story.DownloadAllPagesNewFormat(max_workers=4)
+    assert time.monotonic() - start >= 4 / 20, "Requests were not spaced out"
+
+
+def test_plaintext_rendered_from_parsed_pages(local_site):
+    pages = [[html for html, _ in MARKDOWN_CASES[:6]], [html for html, _ in MARKDOWN_CASES[6:]]]
+    pages = [[paragraph[len("<p>"):-len("</p>")] for paragraph in page] for page in pages]
+    story = LiteroticaStoryPage()
+    story.URL = add_story(local_site, "/s/italics", pages)
+    assert story.DownloadAllPagesNewFormat()
+
+    assert story.Text.count('class="aa_ht"') == 2
+    assert story.PlainText == LiteroticaStoryPage.clean_plaintext(story.Text)
+
+
+def test_failed_story_resumes_at_first_missing_page(local_site):
+    pages = [[f"Page {i:d} paragraph {j:d}." for j in range(3)] for i in range(1, 6)]
+    url = add_story(local_site, "/s/flaky-story", pages)
+    local_site.Failures["/s/flaky-story?page=4"] = 100
+
+    story = LiteroticaStoryPage(fetcher=LiteroticaFetcher(retries=0, page_retries=2, page_backoff=0.001))
+    story.URL = url
+    with pytest.raises(StoryDownloadError) as error:
+        story.DownloadAllPagesNewFormat()
+    assert (error.value.Page, error.value.PageCount, error.value.PagesSaved, error.value.Attempts) == (4, 5, 3, 3)
+    assert local_site.Requests.count("/s/flaky-story?page=4") == 3
+
+    local_site.Failures.clear()
+    local_site.Requests.clear()
+    assert story.DownloadAllPagesNewFormat()
+    assert local_site.Requests == ["/s/flaky-story?page=4", "/s/flaky-story?page=5"]
+    assert story.PlainText.count("paragraph 0.") == 5
+
+
+def test_checkpoint_on_disk_resumes_across_runs(local_site, tmp_path):
+    url = add_story(local_site, "/s/resumed", [["Some text."]] * 4)
+    local_site.Failures["/s/resumed?page=3"] = 100
+    checkpoint = LiteroticaCheckpoint(str(tmp_path / "checkpoint"))
+
+    first = LiteroticaStoryPage(fetcher=LiteroticaFetcher(retries=0, page_retries=0), checkpoint=checkpoint)
+    first.URL = url
+    with pytest.raises(StoryDownloadError):
+        first.DownloadAllPagesNewFormat(max_workers=2)
+    assert checkpoint.PageNumbers(url)[:2] == [1, 2]
+
+    local_site.Failures.clear()
+    local_site.Requests.clear()
+    # Served again with a different ad and token around the story, which don't make it a different story
+    local_site.Pages["/s/resumed"] = local_site.Pages["/s/resumed"].replace(b"<body>", b'<body><div class="ad" data-token="8f3a">Ad</div>')
+    second = LiteroticaStoryPage(checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint")))
+    second.URL = url
+    assert second.DownloadAllPagesNewFormat()
+    # Page 1 is fetched again to check the story hasn't changed since; the other saved pages are kept
+    assert "/s/resumed?page=2" not in local_site.Requests
+    assert local_site.Requests.count("/s/resumed") == 1 and "/s/resumed?page=3" in local_site.Requests
+    assert os.listdir(tmp_path / "checkpoint") == [], "The story is cleared once complete, leaving the directory"
+
+
+@pytest.mark.parametrize("change", ["edited", "expired"])
+def test_stale_checkpoint_is_discarded(local_site, tmp_path, change):
+    url = add_story(local_site, "/s/revised", [["Old text."]] * 4)
+    local_site.Failures["/s/revised?page=3"] = 100
+    first = LiteroticaStoryPage(fetcher=LiteroticaFetcher(retries=0, page_retries=0),
+                                checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint")))
+    first.URL = url
+    with pytest.raises(StoryDownloadError):
+        first.DownloadAllPagesNewFormat()
+
+    local_site.Failures.clear()
+    text, pages, ttl = "Old text.", 4, 0
+    if change == "edited":
+        text, pages, ttl = "New text.", 3, 3600
+        add_story(local_site, "/s/revised", [[text]] * pages)  # Re-paginated: page 4 is gone
+    local_site.Requests.clear()
+    second = LiteroticaStoryPage(checkpoint=LiteroticaCheckpoint(str(tmp_path / "checkpoint"), ttl=ttl))
+    second.URL = url
+    assert second.DownloadAllPagesNewFormat()
+
+    assert "/s/revised?page=2" in local_site.Requests, "Saved pages should be fetched again"
+    assert second.PlainText.count(text) == pages and second.PageCount() == pages